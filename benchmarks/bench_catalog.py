@@ -0,0 +1,115 @@
+# Build time of the beverage catalog (GET /product/beverage on a cache miss): rows grouped in Python vs. the
+# document built by PostgreSQL with json_agg. Runs against a throwaway PostgreSQL container like the tests.
+# Run from the repository root: python benchmarks/bench_catalog.py
+import os
+import sys
+import timeit
+import psycopg2
+from flask import Flask
+from testcontainers.postgres import PostgresContainer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+os.environ.setdefault("POSTGRES_DB_NAME", "bude_transactions")
+os.environ.setdefault("POSTGRES_AUTH_USER", "bench_auth")
+os.environ.setdefault("POSTGRES_AUTH_PW", "bench_auth")
+os.environ.setdefault("POSTGRES_PUBLIC_USER", "bench_public")
+os.environ.setdefault("POSTGRES_PUBLIC_PW", "bench_public")
+# Every build of the large catalogs would be logged as slow query
+os.environ.setdefault("SLOW_QUERY_THRESHOLD", "inf")
+
+from database_service.connection import close_all_pools  # noqa
+from database_service.migrations import apply_migrations  # noqa
+from endpoints.json_provider import OrjsonProvider  # noqa
+from endpoints.product import build_beverage_catalog  # noqa
+from services.catalog_cache import CachedResponse, render_json  # noqa
+
+INIT_SQL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../sql/init.sql.template'))
+
+SIZES = (10, 1_000, 100_000)
+ENGINES = ("python", "json")
+
+
+def connect(postgres, dbname: str):
+    conn = psycopg2.connect(host=postgres.get_container_host_ip(), port=postgres.get_exposed_port(5432),
+                            user=postgres.username, password=postgres.password, dbname=dbname)
+    conn.autocommit = True
+    return conn
+
+
+def setup_database(postgres):
+    conn = connect(postgres, "postgres")
+    conn.cursor().execute(f"CREATE DATABASE {os.environ['POSTGRES_DB_NAME']}")
+    conn.close()
+
+    conn = connect(postgres, os.environ["POSTGRES_DB_NAME"])
+    with open(INIT_SQL_PATH, "r") as sql_file:
+        conn.cursor().execute(sql_file.read().format(db_public_user=os.environ['POSTGRES_PUBLIC_USER'],
+                                                     db_public_user_pw=os.environ['POSTGRES_PUBLIC_PW'],
+                                                     db_auth_user=os.environ['POSTGRES_AUTH_USER'],
+                                                     db_auth_user_pw=os.environ['POSTGRES_AUTH_PW']))
+    conn.autocommit = False
+    apply_migrations(conn)
+    conn.autocommit = True
+    return conn
+
+
+def seed_products(cur, count: int):
+    # 10 categories, every beverage with all three prices
+    cur.execute("TRUNCATE product, product_category RESTART IDENTITY CASCADE")
+    cur.execute("INSERT INTO product_category(category_name) SELECT 'Category ' || i FROM generate_series(1, 10) i")
+    cur.execute('''
+                INSERT INTO product(category_id, product_type, product_name)
+                SELECT i %% 10 + 1, 'beverage', 'Beverage ' || i FROM generate_series(1, %s) i
+                ''',
+                (count, ))
+    cur.execute("INSERT INTO beverage(product_id, beverage_size) SELECT product_id, 0.5 FROM product")
+    cur.execute('''
+                INSERT INTO pricing(product_id, pricing_type, price)
+                SELECT product_id, pricing_type::PRICE_CATEGORY, 1.5 + product_id % 7 * 0.25
+                FROM product
+                CROSS JOIN unnest(ARRAY['normal', 'party', 'big_event']) pricing_type
+                ''')
+    cur.execute("ANALYZE product, beverage, pricing")
+
+
+def build(engine: str):
+    os.environ["BEVERAGE_CATALOG_ENGINE"] = engine
+    # Same rendering as the catalog cache, for both engines the complete response body
+    result = build_beverage_catalog()
+    return (result if isinstance(result, CachedResponse) else render_json(*result)).body
+
+
+def main():
+    postgres = PostgresContainer("postgres:17-alpine")
+    postgres.start()
+    os.environ["POSTGRES_HOST"] = postgres.get_container_host_ip()
+    os.environ["POSTGRES_PORT"] = postgres.get_exposed_port(5432)
+
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    try:
+        conn = setup_database(postgres)
+        cur = conn.cursor()
+        with app.app_context():
+            print(f"{'products':>10}{'python ms':>12}{'json ms':>10}{'speedup':>9}{'python KB':>11}{'json KB':>9}")
+            for size in SIZES:
+                seed_products(cur, size)
+                results = {}
+                for engine in ENGINES:
+                    body = build(engine)
+                    runs = 1 if size >= 100_000 else 10
+                    seconds = min(timeit.repeat(lambda: build(engine), number=runs, repeat=3)) / runs
+                    results[engine] = (seconds * 1000, len(body) / 1024)
+                print(f"{size:>10}{results['python'][0]:>12.2f}{results['json'][0]:>10.2f}"
+                      f"{results['python'][0] / results['json'][0]:>8.1f}x"
+                      f"{results['python'][1]:>11.1f}{results['json'][1]:>9.1f}")
+        cur.close()
+        conn.close()
+    finally:
+        close_all_pools()
+        postgres.stop()
+
+
+if __name__ == "__main__":
+    main()
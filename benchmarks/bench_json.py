@@ -0,0 +1,77 @@
+# Serialization time of the large list endpoints, Flask's json provider vs. orjson.
+# Run from the repository root: python benchmarks/bench_json.py
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from endpoints.json_provider import OrjsonProvider  # noqa
+from models.Account import AccountSession  # noqa
+from models.Product import Beverage  # noqa
+from models.User import User  # noqa
+
+now = datetime.now(timezone.utc)
+
+
+def account_sessions_payload(count: int, accounts: int):
+    # GET /account/session: the sessions grouped by accountId. Ids come from psycopg2 as str, like in the models.
+    account_ids = [str(uuid.uuid4()) for _ in range(accounts)]
+    fields = [field for field in AccountSession.columns if field != "accountId"]
+    grouped_sessions = {}
+    for i in range(count):
+        session = AccountSession(str(uuid.uuid4()), account_ids[i % accounts], "192.168.0.1", "iPhone",
+                                 "Mobile Safari 17.4", str(uuid.uuid4()), now - timedelta(minutes=i))
+        grouped_sessions.setdefault(session.account_id, []).append(session.to_json(*fields))
+    return {"error": None, "message": grouped_sessions}
+
+
+def users_payload(count: int):
+    # GET /user/
+    users = [User(str(uuid.uuid4()), f"First {i}", f"Last {i}", now, False, "member", "user",
+                  f"data/images/profile_pictures/{i}.jpg" if i % 2 == 0 else None) for i in range(count)]
+    return {"error": None, "message": [user.to_json() for user in users]}
+
+
+def beverages_payload(count: int, categories: int):
+    # GET /product/beverage: the beverages grouped by categoryId, built like build_beverage_catalog
+    grouped_beverages = {}
+    for i in range(count):
+        beverage = Beverage(i + 1, f"Beverage {i + 1}", i % categories + 1, 0.5,
+                            {"normal": 1.5 + i % 7 * 0.25, "party": 2.0, "bigEvent": 2.5})
+        grouped_beverages.setdefault(beverage.category_id, {"categoryId": beverage.category_id, "beverages": []})
+        grouped_beverages[beverage.category_id]["beverages"].append(
+            beverage.to_json("id", "productName", "beverageSize", "pricing"))
+    return {"error": None, "message": list(grouped_beverages.values())}
+
+
+# Built from the models like the responses of the large list endpoints
+PAYLOADS = {
+    "account sessions (5000)": account_sessions_payload(5000, accounts=500),
+    "users (1000)": users_payload(1000),
+    "beverages (300)": beverages_payload(300, categories=10),
+}
+
+
+def main():
+    app = Flask(__name__)
+    providers = {"flask": DefaultJSONProvider(app), "orjson": OrjsonProvider(app)}
+
+    with app.app_context():
+        print(f"{'payload':<26}{'flask ms':>10}{'orjson ms':>11}{'speedup':>9}")
+        for name, payload in PAYLOADS.items():
+            results = {}
+            for provider_name, provider in providers.items():
+                runs = 20
+                seconds = min(timeit.repeat(lambda: provider.response(payload), number=runs, repeat=5)) / runs
+                results[provider_name] = seconds * 1000
+            print(f"{name:<26}{results['flask']:>10.2f}{results['orjson']:>11.2f}"
+                  f"{results['flask'] / results['orjson']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
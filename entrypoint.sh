@@ -2,4 +2,10 @@
 set -e  # Exit immediately if a command fails
 
 echo "Starting the application..."
-exec python app.py  # Replace with your actual startup command
\ No newline at end of file
+if [ "$RUN_ENV" = "DEV" ]; then
+    # Werkzeug development server with debugger and reloader
+    exec python app.py
+else
+    # Settings are read from gunicorn.conf.py in the working directory
+    exec gunicorn app:app
+fi
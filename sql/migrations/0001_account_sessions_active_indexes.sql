@@ -0,0 +1,3 @@
+-- Session checks and invalidations filter active sessions by account (and origin)
+CREATE INDEX IF NOT EXISTS account_sessions_active_account_origin_idx ON account_sessions(account_id, origin_id)
+    WHERE NOT invalidated;
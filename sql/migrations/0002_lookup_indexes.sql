@@ -0,0 +1,8 @@
+-- Foreign keys used for lookups, PostgreSQL does not index the referencing side on its own
+CREATE INDEX IF NOT EXISTS account_linked_user_id_idx ON account(linked_user_id);
+CREATE INDEX IF NOT EXISTS product_category_id_idx ON product(category_id);
+
+-- Transaction history per user, also used by ON DELETE SET NULL when a user is deleted
+CREATE INDEX IF NOT EXISTS tab_transactions_user_affected_idx ON tab_transactions(user_affected, time_created);
+CREATE INDEX IF NOT EXISTS tab_transactions_user_created_idx ON tab_transactions(user_created);
+CREATE INDEX IF NOT EXISTS register_transactions_user_created_idx ON register_transactions(user_created);
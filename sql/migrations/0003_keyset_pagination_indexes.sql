@@ -0,0 +1,5 @@
+-- Keyset pagination of the list endpoints, ordered by (time_created, id)
+CREATE INDEX IF NOT EXISTS user_time_created_idx ON "user"(time_created, user_id);
+CREATE INDEX IF NOT EXISTS account_time_created_idx ON account(time_created, public_id);
+CREATE INDEX IF NOT EXISTS account_sessions_active_time_created_idx ON account_sessions(time_created, token_id)
+    WHERE NOT invalidated;
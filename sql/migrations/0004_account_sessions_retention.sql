@@ -0,0 +1,5 @@
+-- Session retention job: finds old invalidated sessions and deletes them as the auth user
+CREATE INDEX IF NOT EXISTS account_sessions_invalidated_idx ON account_sessions(time_invalidated)
+    WHERE invalidated;
+
+GRANT DELETE ON TABLE account_sessions TO {db_auth_user};
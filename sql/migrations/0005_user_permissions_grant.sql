@@ -0,0 +1,2 @@
+-- Login reads the permissions of the linked user
+GRANT SELECT (user_id, permissions) ON TABLE "user" TO {db_public_user};
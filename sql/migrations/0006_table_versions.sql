@@ -0,0 +1,17 @@
+-- Versions of cached tables for ETags, bumped by every write
+CREATE TABLE IF NOT EXISTS table_versions(
+    table_name VARCHAR(255) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    time_modified TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO table_versions(table_name)
+VALUES
+('product'),
+('product_category'),
+('user')
+ON CONFLICT DO NOTHING;
+
+GRANT INSERT ON TABLE table_versions TO {db_auth_user};
+GRANT SELECT ON TABLE table_versions TO {db_auth_user};
+GRANT UPDATE ON TABLE table_versions TO {db_auth_user};
@@ -0,0 +1,4 @@
+-- Tab bookings are inserted by the auth user
+GRANT USAGE, SELECT ON SEQUENCE tab_transactions_transaction_id_seq TO {db_auth_user};
+GRANT INSERT ON TABLE tab_transactions TO {db_auth_user};
+GRANT SELECT ON TABLE tab_transactions TO {db_auth_user};
@@ -0,0 +1,20 @@
+-- Current balance per user, kept up to date with every booking on tab_transactions
+CREATE TABLE IF NOT EXISTS user_balance(
+    user_id UUID PRIMARY KEY REFERENCES "user"(user_id)
+                                ON DELETE CASCADE
+                                ON UPDATE CASCADE,
+    balance NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    time_modified TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Bookings made before the ledger existed
+INSERT INTO user_balance(user_id, balance)
+SELECT user_affected, SUM(balance)
+FROM tab_transactions
+WHERE user_affected IS NOT NULL
+GROUP BY user_affected
+ON CONFLICT DO NOTHING;
+
+GRANT INSERT ON TABLE user_balance TO {db_auth_user};
+GRANT SELECT ON TABLE user_balance TO {db_auth_user};
+GRANT UPDATE ON TABLE user_balance TO {db_auth_user};
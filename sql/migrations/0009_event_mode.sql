@@ -0,0 +1,17 @@
+-- Pricing tier that is currently active (normal, party or big_event), a single row switched by admins
+CREATE TABLE IF NOT EXISTS event_mode(
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    pricing_type PRICE_CATEGORY NOT NULL DEFAULT 'normal',
+    time_modified TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO event_mode(id)
+VALUES (TRUE)
+ON CONFLICT DO NOTHING;
+
+INSERT INTO table_versions(table_name)
+VALUES ('event_mode')
+ON CONFLICT DO NOTHING;
+
+GRANT SELECT ON TABLE event_mode TO {db_auth_user};
+GRANT UPDATE ON TABLE event_mode TO {db_auth_user};
@@ -6,13 +6,33 @@ from flask_jwt_extended import verify_jwt_in_request
 from endpoints.account import *
 from endpoints.user import *
 from endpoints.product import *
+from endpoints.transaction import *
 from endpoints.misc import *
 from endpoints.jwt_handlers import jwt
+from endpoints.json_provider import OrjsonProvider
+from endpoints.metrics import finish_request_metrics, metrics, record_request_metrics, start_request_metrics
+from endpoints.unit_of_work import commit_request_unit_of_work, end_request_unit_of_work, start_request_unit_of_work
+from commands import migrate_command, partition_sessions_command, purge_sessions_command, reconcile_balances_command
+from database_service.migrations import migrate_on_startup
+from database_service.session_retention import start_retention_scheduler
+from services.background_removal import start_background_remover
 from flask_cors import CORS
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Request metrics, registered before Compress: after_request hooks run in reverse order and see the sent size
+app.before_request(start_request_metrics)
+app.after_request(record_request_metrics)
+app.teardown_request(finish_request_metrics)
+
 Compress(app)
 
+# One database transaction per request, registered last so it is committed before the other after_request hooks
+app.before_request(start_request_unit_of_work)
+app.after_request(commit_request_unit_of_work)
+app.teardown_request(end_request_unit_of_work)
+
 # Environment check for production
 RUN_ENV = os.environ.get('RUN_ENV', 'PROD')
 # Logging!!
@@ -35,8 +55,16 @@ jwt.init_app(app)
 app.register_blueprint(accounts, url_prefix='/account')
 app.register_blueprint(users, url_prefix='/user')
 app.register_blueprint(products, url_prefix='/product')
+app.register_blueprint(transactions, url_prefix='/transaction')
 
 app.register_blueprint(misc, url_prefix='/misc')
+app.register_blueprint(metrics)
+
+# CLI commands
+app.cli.add_command(reconcile_balances_command)
+app.cli.add_command(migrate_command)
+app.cli.add_command(purge_sessions_command)
+app.cli.add_command(partition_sessions_command)
 
 
 if __name__ == "__main__":
@@ -56,4 +84,14 @@ if __name__ == "__main__":
         print(f"{var}: {value}")
     print("\n----------------------------------------\n")
 
-    app.run(host="0.0.0.0", port=8085, debug=True)
+    # Only in the serving process of the reloader, like the background removal below
+    if RUN_ENV != "DEV" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        migrate_on_startup()
+        start_retention_scheduler()
+
+    # Load the background removal models before the first request, only in the serving process of the reloader
+    if RUN_ENV != "DEV" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_remover()
+
+    # Development server only, production runs gunicorn with gunicorn.conf.py (see entrypoint.sh)
+    app.run(host="0.0.0.0", port=8085, debug=RUN_ENV == "DEV")
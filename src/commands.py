@@ -0,0 +1,81 @@
+import json
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from database_service.balance import reconcile_user_balances
+from database_service.migrations import apply_migrations, get_migration_connection, get_migration_status
+from database_service.session_retention import get_max_age, partition_account_sessions, run_session_retention
+
+
+# Run with: flask --app src/app.py reconcile-balances [--fix]
+@click.command("reconcile-balances")
+@click.option("--fix", is_flag=True, help="Overwrite drifted balances with the recomputed ones.")
+def reconcile_balances_command(fix):
+    """Recompute user balances from tab_transactions and report drift."""
+    response = reconcile_user_balances(fix)
+    if response["error"]:
+        raise click.ClickException(json.dumps(response["error"]))
+
+    drift = response["message"]["drift"]
+    for entry in drift:
+        click.echo(f"{entry['userId']}: stored {entry['stored']}, expected {entry['expected']}")
+    click.echo(f"{len(drift)} drifted balance(s){' fixed' if fix and drift else ''}")
+
+    # Non-zero exit code lets cron jobs alert on unfixed drift
+    if drift and not fix:
+        raise SystemExit(1)
+
+
+# Run with: flask --app src/app.py migrate [--status]
+@click.command("migrate")
+@click.option("--status", is_flag=True, help="Only list the migrations and whether they are applied.")
+def migrate_command(status):
+    """Apply pending schema migrations from sql/migrations."""
+    conn = get_migration_connection()
+    try:
+        if status:
+            for version, name, time_applied in get_migration_status(conn):
+                click.echo(f"{version:04d}_{name}: {time_applied or 'pending'}")
+            return
+
+        applied = apply_migrations(conn)
+    finally:
+        conn.close()
+
+    for name in applied:
+        click.echo(f"Applied {name}")
+    click.echo(f"{len(applied)} migration(s) applied")
+
+
+# Run with: flask --app src/app.py purge-sessions [--max-age SECONDS] [--batch-size N]
+@click.command("purge-sessions")
+@click.option("--max-age", type=float, default=None,
+              help="Seconds since invalidation, default SESSION_RETENTION_MAX_AGE.")
+@click.option("--batch-size", type=int, default=None, help="Sessions deleted per transaction.")
+def purge_sessions_command(max_age, batch_size):
+    """Delete old invalidated sessions and drop expired session partitions."""
+    result = run_session_retention(max_age, batch_size)
+    if result is None:
+        raise click.ClickException("Session retention is already running")
+
+    click.echo(f"{result['deleted']} session(s) deleted")
+    for name in result["droppedPartitions"]:
+        click.echo(f"Dropped {name}")
+
+
+# Run with: flask --app src/app.py partition-sessions [--months-ahead N]
+@click.command("partition-sessions")
+@click.option("--months-ahead", type=int, default=3, help="Monthly partitions created in advance.")
+@with_appcontext
+def partition_sessions_command(months_ahead):
+    """Convert account_sessions into a table partitioned by month, needs the migration role."""
+    if get_max_age() <= current_app.config["JWT_REFRESH_TOKEN_EXPIRES"]:
+        # Whole partitions are dropped after the max age, including sessions that were never invalidated
+        raise click.ClickException("SESSION_RETENTION_MAX_AGE has to exceed the refresh token lifetime")
+
+    conn = get_migration_connection()
+    try:
+        converted = partition_account_sessions(conn, months_ahead)
+    finally:
+        conn.close()
+    click.echo("account_sessions partitioned by month" if converted else "account_sessions is already partitioned")
@@ -1,24 +1,28 @@
 import os
 import sys
-import bcrypt
 import uuid
-import bcrypt
 import psycopg2
 from models.Account import Account, AccountSession
+from services.password_hashing import check_password, hash_password
+from services.session_cache import (SESSION_CHANNEL, handle_session_notification, invalidate_account_sessions,
+                                    session_cache)
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
 
 from database_service.connection import *  # noqa
+from database_service.notifications import notify, subscribe  # noqa
+from database_service.pagination import fetch_page  # noqa
+from database_service.rows import fetch_one  # noqa
 
 
 def create_account(username: str, password: str):
+    # Hash the password before a connection is checked out
+    hashed_password = hash_password(password)
+
     try:
         conn = get_public_db_connection()
         cur = conn.cursor()
 
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
         # Generate a user UUID
         user_uuid = str(uuid.uuid4())
         cur.execute('''
@@ -59,26 +63,6 @@ def get_pg_version():
     return version
 
 
-def get_all_accounts_by_username(username: str):
-    conn = get_public_db_connection()
-    cur = conn.cursor()
-
-    cur.execute('''
-                SELECT public_id, username, password_hash, time_created, linked_user_id
-                FROM account
-                WHERE username = %s
-                ''',
-                (username, ))
-    response = cur.fetchall()
-    parsed_response = []
-    for row in response:
-        parsed_response.append(Account(row[0], row[1], row[2].tobytes(), row[3], row[4]))
-    cur.close()
-    conn.close()
-
-    return parsed_response
-
-
 def get_account_by_uuid(public_id: uuid):
     conn = get_public_db_connection()
     cur = conn.cursor()
@@ -89,10 +73,10 @@ def get_account_by_uuid(public_id: uuid):
                 WHERE public_id = %s
                 ''',
                 (public_id, ))
-    response = cur.fetchone()
+    account = fetch_one(cur, Account)
     cur.close()
     conn.close()
-    return Account(response[0], response[1], None, response[2], response[3])
+    return account
 
 
 def update_link_user_to_account(public_id: uuid, user_id: uuid):
@@ -109,9 +93,12 @@ def update_link_user_to_account(public_id: uuid, user_id: uuid):
                         user_id,
                         public_id,
                     ))
+        # Cached permissions of the account are outdated
+        notify(cur, SESSION_CHANNEL, public_id)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(lambda: invalidate_account_sessions(public_id))
         return {"error": None, "message": f"Linked account {public_id} successfully"}, 200
 
     except psycopg2.errors.UniqueViolation as Err:
@@ -127,32 +114,23 @@ def update_link_user_to_account(public_id: uuid, user_id: uuid):
             Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}
 
 
-def get_all_accounts():
+def get_accounts_page(fields: list = None, limit: int = None, after: str = None, with_total: bool = False):
     conn = get_auth_db_connection()
-    cur = conn.cursor()
-
-    cur.execute('''
-                SELECT public_id, username, time_created, linked_user_id
-                FROM account
-                ''')
-    response = cur.fetchall()
-    parsed_response = []
-    for row in response:
-        parsed_response.append(Account(row[0], row[1], "", row[2], row[3]))
-    cur.close()
-    conn.close()
-
-    return parsed_response
+    try:
+        return fetch_page(conn, Account, "account a", "a", "public_id",
+                          fields=fields, limit=limit, after=after, with_total=with_total)
+    finally:
+        conn.close()
 
 
 def update_account_password(user_id: uuid, password: str):
+    # Hash the password before a connection is checked out
+    hashed_password = hash_password(password)
+
     try:
         conn = get_auth_db_connection()
         cur = conn.cursor()
 
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
         cur.execute('''
                     UPDATE account
                     SET password_hash = %s
@@ -174,58 +152,123 @@ def update_account_password(user_id: uuid, password: str):
             Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}
 
 
-def create_account_session(token_id: uuid, origin_id: uuid, account_id: uuid,
-                           ip_address: str, device: str, browser: str):
+def login_account(username: str, password: str, origin_id: uuid, token_id: uuid,
+                  ip_address: str, device: str, browser: str):
+    # Verifies the credentials, then invalidates the old sessions of the origin and creates the new session.
+    # Two transactions, no connection is held while bcrypt runs in between.
+    # Returns (account, permissions) or None if the login failed.
+    response = _get_login_account(username)
+    release_unit_connection()
+
+    account = Account.from_row(response[:5]) if response else None
+    if not account or not check_password(password, account.password_hash):
+        return None
+
+    # The hash is not needed beyond this point
+    account.password_hash = None
+    _create_login_session(account.public_id, origin_id, token_id, ip_address, device, browser)
+    return account, response[5]
+
+
+def _get_login_account(username: str):
+    # Checked out before the try, a failed checkout raises its own error
+    conn = get_public_db_connection()
     try:
-        conn = get_public_db_connection()
         cur = conn.cursor()
+        cur.execute('''
+                    SELECT a.public_id, a.username, a.time_created, a.linked_user_id, a.password_hash, u.permissions
+                    FROM account a
+                    LEFT JOIN "user" u ON(a.linked_user_id = u.user_id)
+                    WHERE a.username = %s
+                    ''',
+                    (username, ))
+        response = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+        return response
+
+    except psycopg2.Error:
+        conn.rollback()
+        conn.close()
+        raise
+
 
+def _create_login_session(account_id: uuid, origin_id: uuid, token_id: uuid,
+                          ip_address: str, device: str, browser: str):
+    # Invalidate all other tokens for this users origin and store the new session in one statement
+    conn = get_public_db_connection()
+    try:
+        cur = conn.cursor()
         cur.execute('''
+                    WITH invalidated AS (
+                        UPDATE account_sessions
+                        SET invalidated = true,
+                            time_invalidated = NOW()
+                        WHERE origin_id = %(origin_id)s
+                        AND account_id = %(account_id)s
+                        AND invalidated = false
+                    )
                     INSERT INTO account_sessions(token_id, origin_id, account_id, ip_address, device, browser)
-                    VALUES(%s, %s, %s, %s, %s, %s)
+                    VALUES(%(token_id)s, %(origin_id)s, %(account_id)s, %(ip_address)s, %(device)s, %(browser)s)
                     ''',
-                    (
-                        token_id,
-                        origin_id,
-                        account_id,
-                        ip_address,
-                        device,
-                        browser
-                    ))
+                    {
+                        "token_id": token_id,
+                        "origin_id": origin_id,
+                        "account_id": account_id,
+                        "ip_address": ip_address,
+                        "device": device,
+                        "browser": browser
+                    })
+        notify(cur, SESSION_CHANNEL, account_id)
         conn.commit()
         cur.close()
         conn.close()
-        return
+        on_commit(lambda: invalidate_account_sessions(account_id))
 
-    except psycopg2.Error as Err:
+    except psycopg2.Error:
         conn.rollback()
         conn.close()
-        raise Err
+        raise
+
 
+def get_session_validity(account_id: uuid, token_id: uuid):
+    # Returns (is_active, permissions) of a refresh token session, served from the cache when possible
+    return session_cache.get_or_load((str(account_id), str(token_id)),
+                                     lambda: _load_session_validity(account_id, token_id))
+
+
+def _load_session_validity(account_id: uuid, token_id: uuid):
+    # Make sure invalidations of other workers reach the cache
+    subscribe(SESSION_CHANNEL, handle_session_notification)
 
-def check_token_id_is_active(account_id: uuid, token_id: uuid):
     try:
         conn = get_public_db_connection()
         cur = conn.cursor()
 
         cur.execute('''
-                    SELECT token_id
-                    FROM account_sessions
-                    WHERE token_id = %s
-                    AND account_id = %s
-                    AND invalidated = false
+                    SELECT EXISTS(
+                               SELECT token_id
+                               FROM account_sessions
+                               WHERE token_id = %(token_id)s
+                               AND account_id = %(account_id)s
+                               AND invalidated = false
+                           ),
+                           (
+                               SELECT u.permissions
+                               FROM account a
+                               JOIN "user" u ON(a.linked_user_id = u.user_id)
+                               WHERE a.public_id = %(account_id)s
+                           )
                     ''',
-                    (
-                        token_id,
-                        account_id
-                    ))
-        response = cur.fetchall()
+                    {
+                        "token_id": token_id,
+                        "account_id": account_id
+                    })
+        response = cur.fetchone()
         cur.close()
         conn.close()
-        if not response:
-            return False
-        else:
-            return True
+        return response[0], response[1]
 
     except psycopg2.Error as Err:
         conn.rollback()
@@ -250,9 +293,11 @@ def invalidate_token_by_token_id(account_id: uuid, token_id: uuid):
                         token_id,
                         account_id
                     ))
+        notify(cur, SESSION_CHANNEL, account_id)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(lambda: invalidate_account_sessions(account_id))
         return
 
     except psycopg2.Error as Err:
@@ -278,9 +323,11 @@ def invalidate_tokens_by_origin_id(account_id: uuid, origin_id: uuid):
                         origin_id,
                         account_id
                     ))
+        notify(cur, SESSION_CHANNEL, account_id)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(lambda: invalidate_account_sessions(account_id))
         return
 
     except psycopg2.Error as Err:
@@ -304,9 +351,11 @@ def invalidate_tokens_by_account_id(account_id: uuid):
                     (
                         account_id,
                     ))
+        notify(cur, SESSION_CHANNEL, account_id)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(lambda: invalidate_account_sessions(account_id))
         return
 
     except psycopg2.Error as Err:
@@ -315,20 +364,10 @@ def invalidate_tokens_by_account_id(account_id: uuid):
         raise Err
 
 
-def get_all_account_sessions():
+def get_account_sessions_page(fields: list = None, limit: int = None, after: str = None, with_total: bool = False):
     conn = get_auth_db_connection()
-    cur = conn.cursor()
-
-    cur.execute('''
-                SELECT token_id, account_id, ip_address, device, browser, origin_id, time_created
-                FROM account_sessions
-                WHERE invalidated = false
-                ''')
-    response = cur.fetchall()
-    parsed_response = []
-    for row in response:
-        parsed_response.append(AccountSession(row[0], row[1], row[2], row[3], row[4], row[5], row[6]))
-    cur.close()
-    conn.close()
-
-    return parsed_response
+    try:
+        return fetch_page(conn, AccountSession, "account_sessions s", "s", "token_id", where="s.invalidated = false",
+                          fields=fields, limit=limit, after=after, with_total=with_total)
+    finally:
+        conn.close()
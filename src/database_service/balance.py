@@ -0,0 +1,91 @@
+import psycopg2
+import sys
+import os
+import uuid
+from models.User import UserBalance
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
+
+from database_service.connection import *  # noqa
+from database_service.rows import fetch_all, fetch_one  # noqa
+
+
+# Users without bookings have no row in user_balance, their balance is 0
+def get_user_balance(user_id: uuid):
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT u.user_id, u.first_name, u.last_name, COALESCE(b.balance, 0), b.time_modified
+                FROM "user" u
+                LEFT JOIN user_balance b ON(b.user_id = u.user_id)
+                WHERE u.user_id = %s
+                ''',
+                (user_id, ))
+    balance = fetch_one(cur, UserBalance)
+    cur.close()
+    conn.close()
+    return balance
+
+
+def get_all_user_balances():
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT u.user_id, u.first_name, u.last_name, COALESCE(b.balance, 0), b.time_modified
+                FROM "user" u
+                LEFT JOIN user_balance b ON(b.user_id = u.user_id)
+                ORDER BY u.last_name, u.first_name
+                ''')
+    parsed_response = fetch_all(cur, UserBalance)
+    cur.close()
+    conn.close()
+    return parsed_response
+
+
+# Recompute all balances from the raw ledger and report users whose stored balance drifted.
+# With fix=True the stored balances are overwritten with the recomputed ones.
+def reconcile_user_balances(fix: bool = False):
+    try:
+        conn = get_auth_db_connection()
+        cur = conn.cursor()
+
+        if fix:
+            # Bookings wait until the corrected balances are committed, none of them can get lost in between
+            cur.execute('LOCK TABLE user_balance IN SHARE ROW EXCLUSIVE MODE')
+
+        cur.execute('''
+                    WITH ledger AS (
+                        SELECT user_affected AS user_id, SUM(balance) AS balance
+                        FROM tab_transactions
+                        WHERE user_affected IS NOT NULL
+                        GROUP BY user_affected
+                    )
+                    SELECT COALESCE(l.user_id, b.user_id), COALESCE(b.balance, 0), COALESCE(l.balance, 0)
+                    FROM ledger l
+                    FULL OUTER JOIN user_balance b ON(b.user_id = l.user_id)
+                    WHERE COALESCE(b.balance, 0) <> COALESCE(l.balance, 0)
+                    ORDER BY 1
+                    ''')
+        drift = [{"userId": str(row[0]), "stored": row[1], "expected": row[2]} for row in cur.fetchall()]
+
+        if fix and drift:
+            cur.execute('''
+                        INSERT INTO user_balance(user_id, balance)
+                        SELECT user_id, expected
+                        FROM unnest(%s::uuid[], %s::numeric[]) AS d(user_id, expected)
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET balance = EXCLUDED.balance,
+                            time_modified = NOW()
+                        ''',
+                        ([entry["userId"] for entry in drift], [entry["expected"] for entry in drift]))
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        return {"error": None, "message": {"drift": drift, "fixed": fix}}
+
+    except psycopg2.Error as Err:
+        conn.rollback()
+        conn.close()
+        return {"error": {"exception": Err.__class__.__name__, "message": str(
+            Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}
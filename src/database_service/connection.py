@@ -1,24 +1,435 @@
-# Database private connection
+# Database connection pools
+import contextvars
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
 from dotenv import load_dotenv
+from database_service.query_stats import TimedCursor, record_connection
 load_dotenv()
 
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    # Raised when no connection could be checked out within the configured timeout
+    pass
+
+
+class UnitOfWorkFailedError(RuntimeError):
+    # Raised when a rolled back unit of work is used again or committed, its earlier work is lost.
+    # No psycopg2.Error, so the handlers of the data services do not turn it into an error dict.
+    pass
+
+
+class _PoolEntry:
+    __slots__ = ("conn", "created_at", "last_used", "uses")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+
+class PooledConnection:
+    # Proxy around a psycopg2 connection. close() hands the connection back to the pool
+    # instead of closing the socket, so existing `conn.close()` call sites keep working.
+    # Used as a context manager it commits (or rolls back on error) and releases the connection.
+    __slots__ = ("_pool", "_entry")
+
+    def __init__(self, pool, entry):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_entry", entry)
+
+    def __getattr__(self, name):
+        entry = self._entry
+        if entry is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(entry.conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._entry.conn, name, value)
+
+    @property
+    def closed(self):
+        entry = self._entry
+        return 1 if entry is None else entry.conn.closed
+
+    def close(self):
+        entry = self._entry
+        if entry is None:
+            return
+        object.__setattr__(self, "_entry", None)
+        self._pool.release(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        entry = self._entry
+        if entry is not None and not entry.conn.closed:
+            try:
+                if exc_type is None:
+                    entry.conn.commit()
+                else:
+                    entry.conn.rollback()
+            finally:
+                self.close()
+        else:
+            self.close()
+        return False
+
+
+class ConnectionPool:
+    # Thread-safe pool of psycopg2 connections for a single database role
+    def __init__(self, connect_kwargs: dict, min_size: int = 1, max_size: int = 10, timeout: float = 5.0,
+                 max_uses: int = 0, max_lifetime: float = 0, ping_interval: float = 30.0):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._size = 0  # Open connections, idle and checked out
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Warm up the pool; a database that is not reachable yet must not break startup
+        for _ in range(self.min_size):
+            try:
+                entry = self._connect()
+            except psycopg2.Error:
+                break
+            with self._cond:
+                self._size += 1
+                self._idle.append(entry)
+
+    def _connect(self):
+        # Cursors of pooled connections count the database time of the current request
+        return _PoolEntry(psycopg2.connect(**self.connect_kwargs, cursor_factory=TimedCursor))
+
+    def _is_expired(self, entry: _PoolEntry, now: float):
+        if self.max_uses and entry.uses >= self.max_uses:
+            return True
+        if self.max_lifetime and now - entry.created_at >= self.max_lifetime:
+            return True
+        return False
+
+    def _is_usable(self, entry: _PoolEntry, now: float):
+        conn = entry.conn
+        if conn.closed or self._is_expired(entry, now):
+            return False
+
+        # Only ping connections that sat idle long enough to have been dropped by the server
+        if now - entry.last_used >= self.ping_interval:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, entry: _PoolEntry):
+        try:
+            if not entry.conn.closed:
+                entry.conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    if self._idle:
+                        entry = self._idle.pop()  # LIFO keeps the warmest connections in use
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        entry = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+
+            connected = entry is None
+            if entry is None:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(entry, time.monotonic()):
+                self._discard(entry)
+                continue
+
+            entry.uses += 1
+            record_connection(connected)
+            return PooledConnection(self, entry)
+
+    def release(self, entry: _PoolEntry):
+        if os.getpid() != self.pid:
+            # Inherited through fork, the socket belongs to the parent process
+            return
+
+        conn = entry.conn
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                status = conn.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    broken = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        now = time.monotonic()
+        if broken or self._closed or self._is_expired(entry, now):
+            self._discard(entry)
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for entry in idle:
+            self._discard(entry)
+
+
+# Process-wide pools, one per database role
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_setting(role: str, name: str, default, cast):
+    # Role specific settings (e.g. POSTGRES_AUTH_POOL_MAX_SIZE) override the shared ones
+    value = os.environ.get(f"POSTGRES_{role.upper()}_POOL_{name}", os.environ.get(f"POSTGRES_POOL_{name}"))
+    return cast(value) if value not in (None, "") else default
+
+
+def _connect_kwargs(role: str):
+    return {"host": os.environ['POSTGRES_HOST'],
+            "port": os.environ['POSTGRES_PORT'],
+            "database": os.environ['POSTGRES_DB_NAME'],
+            "user": os.environ[f'POSTGRES_{role.upper()}_USER'],
+            "password": os.environ[f'POSTGRES_{role.upper()}_PW']}
+
+
+def get_pool(role: str):
+    connect_kwargs = _connect_kwargs(role)
+    pool = _pools.get(role)
+    if pool is not None and pool.pid == os.getpid() and pool.connect_kwargs == connect_kwargs:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(role)
+        if pool is not None and pool.pid == os.getpid() and pool.connect_kwargs == connect_kwargs:
+            return pool
+        if pool is not None and pool.pid == os.getpid():
+            # Database settings changed (e.g. new host), drop the stale connections
+            pool.close()
+
+        pool = ConnectionPool(connect_kwargs,
+                              min_size=_pool_setting(role, "MIN_SIZE", 1, int),
+                              max_size=_pool_setting(role, "MAX_SIZE", 10, int),
+                              timeout=_pool_setting(role, "TIMEOUT", 5.0, float),
+                              max_uses=_pool_setting(role, "MAX_USES", 0, int),
+                              max_lifetime=_pool_setting(role, "MAX_LIFETIME", 1800.0, float),
+                              ping_interval=_pool_setting(role, "PING_INTERVAL", 30.0, float))
+        _pools[role] = pool
+        return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            if pool.pid == os.getpid():
+                pool.close()
+        _pools.clear()
+
+
+def reset_pools():
+    # Forget inherited pools after a fork without closing the parent's sockets
+    with _pools_lock:
+        _pools.clear()
+
+
+class UnitOfWork:
+    # One connection and transaction per role shared by every data-service call of a request (or unit_of_work
+    # block), committed or rolled back once at the end. Only one role is held at a time: switching roles commits
+    # the work of the other role first, so the new connection sees it and cannot wait on its row locks. A unit
+    # using both roles is therefore only atomic per role, not as a whole.
+    __slots__ = ("role", "conn", "failed", "after_commit")
+
+    def __init__(self):
+        self.role = None
+        self.conn = None
+        self.failed = False  # A data service rolled back, nothing of the unit is committed anymore
+        self.after_commit = []  # Callbacks of on_commit, run once the work is committed
+
+    def get_connection(self, role: str):
+        if self.failed:
+            raise UnitOfWorkFailedError("The unit of work was rolled back, later calls can not commit a part of it")
+        if self.conn is not None and self.conn.closed:
+            # The work on the lost connection is gone, the rest of the unit must not be committed without it
+            self._release(commit=False)
+            self.failed = True
+            raise UnitOfWorkFailedError("The connection of the unit of work was lost")
+        if self.conn is not None and self.role != role:
+            self._release(commit=True)
+        if self.conn is None:
+            self.conn = get_pool(role).getconn()
+            self.role = role
+        return UnitConnection(self)
+
+    def _release(self, commit: bool):
+        conn = self.conn
+        self.conn = None
+        callbacks, self.after_commit = self.after_commit, []
+        committed = False
+        try:
+            if not conn.closed:
+                if commit and not self.failed:
+                    conn.commit()
+                    committed = True
+                else:
+                    conn.rollback()
+        finally:
+            conn.close()
+        # Callbacks of rolled back work are dropped
+        if committed:
+            for callback in callbacks:
+                callback()
+
+    def finish(self, commit: bool = True):
+        # Raises the error of a failed commit, or UnitOfWorkFailedError if the work to commit was rolled back.
+        # The connection is back in the pool either way.
+        if self.conn is not None:
+            self._release(commit)
+        if commit and self.failed:
+            raise UnitOfWorkFailedError("The unit of work was rolled back and can not be committed")
+
+
+class UnitConnection:
+    # What the data services get inside a unit of work: commit() and close() are left to the unit,
+    # rollback() discards the whole unit as the statements before it belong to the same transaction.
+    # Later calls of the unit raise UnitOfWorkFailedError instead of writing what can not be committed.
+    __slots__ = ("_unit", )
+
+    def __init__(self, unit: UnitOfWork):
+        object.__setattr__(self, "_unit", unit)
+
+    def __getattr__(self, name):
+        return getattr(self._unit.conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._unit.conn, name, value)
+
+    @property
+    def closed(self):
+        conn = self._unit.conn
+        return 1 if conn is None else conn.closed
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._unit.failed = True
+        self._unit.conn.rollback()
+
+    def close(self):
+        pass
+
+
+_unit_of_work = contextvars.ContextVar("unit_of_work", default=None)
+
+
+def start_unit_of_work():
+    # Returns a token for finish_unit_of_work, None if the calls already share a unit
+    if _unit_of_work.get() is not None:
+        return None
+    return _unit_of_work.set(UnitOfWork())
+
+
+def finish_unit_of_work(token, commit: bool = True):
+    if token is None:
+        return
+    unit = _unit_of_work.get()
+    _unit_of_work.reset(token)
+    unit.finish(commit)
+
+
+@contextmanager
+def unit_of_work():
+    # Data-service calls in the block share one transaction, committed at the end unless an exception escapes
+    token = start_unit_of_work()
+    try:
+        yield
+    except BaseException:
+        finish_unit_of_work(token, commit=False)
+        raise
+    finish_unit_of_work(token)
+
+
+def is_unit_of_work_failed():
+    unit = _unit_of_work.get()
+    return unit is not None and unit.failed
+
+
+def on_commit(callback):
+    # Runs callback once the work of the current unit is committed, e.g. to invalidate the caches of the written
+    # data. Without a unit the data service commits on its own, so it runs right away.
+    unit = _unit_of_work.get()
+    if unit is None or unit.conn is None:
+        callback()
+    else:
+        unit.after_commit.append(callback)
+
+
+def release_unit_connection():
+    # Hands the connection of the current unit back to the pool before slow work without the database
+    # (e.g. bcrypt), committing what the unit did so far. The next call checks out a connection again.
+    unit = _unit_of_work.get()
+    if unit is not None:
+        unit.finish()
+
+
+def _get_connection(role: str):
+    unit = _unit_of_work.get()
+    if unit is not None:
+        return unit.get_connection(role)
+    return get_pool(role).getconn()
+
+
+# Database private connection
 def get_auth_db_connection():
-    conn = psycopg2.connect(host=os.environ['POSTGRES_HOST'],
-                            port=os.environ['POSTGRES_PORT'],
-                            database=os.environ['POSTGRES_DB_NAME'],
-                            user=os.environ['POSTGRES_AUTH_USER'],
-                            password=os.environ['POSTGRES_AUTH_PW'])
-    return conn
+    return _get_connection("auth")
+
 
 # Database public connection for e.g. registering
 def get_public_db_connection():
-    conn = psycopg2.connect(host=os.environ['POSTGRES_HOST'],
-                            port=os.environ['POSTGRES_PORT'],
-                            database=os.environ['POSTGRES_DB_NAME'],
-                            user=os.environ['POSTGRES_PUBLIC_USER'],
-                            password=os.environ['POSTGRES_PUBLIC_PW'])
-    
-    return conn
-
+    return _get_connection("public")
@@ -0,0 +1,125 @@
+# Versioned schema migrations on top of sql/init.sql.template, applied in order and recorded in schema_migrations.
+# Files are named <version>_<name>.sql and may use the same placeholders as the template (e.g. {db_auth_user}).
+import logging
+import os
+import re
+import sys
+import psycopg2
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
+
+from database_service.connection import _connect_kwargs  # noqa
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Any constant, it only has to be the same for every process running migrations
+MIGRATION_LOCK_ID = 4206001
+
+PLACEHOLDERS = {"{db_public_user}": "POSTGRES_PUBLIC_USER",
+                "{db_auth_user}": "POSTGRES_AUTH_USER"}
+
+
+def get_migrations_dir():
+    # sql/migrations of the repository, the Docker image copies it to /sql/migrations
+    return os.environ.get("MIGRATIONS_DIR", os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../../sql/migrations")))
+
+
+def get_migrations():
+    # Returns [(version, name, path)] sorted by version
+    migrations = []
+    for file_name in os.listdir(get_migrations_dir()):
+        match = MIGRATION_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(get_migrations_dir(), file_name)))
+    migrations.sort()
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {get_migrations_dir()}")
+    return migrations
+
+
+def _read_migration(path: str):
+    with open(path, "r") as sql_file:
+        sql = sql_file.read()
+    for placeholder, env_var in PLACEHOLDERS.items():
+        if placeholder in sql:
+            sql = sql.replace(placeholder, os.environ[env_var])
+    return sql
+
+
+def get_migration_connection():
+    # Migrations change the schema and need the owner of the tables, not the application roles
+    return psycopg2.connect(**_connect_kwargs("migration"))
+
+
+def _ensure_migrations_table(cur):
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations(
+                    version INT PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    time_applied TIMESTAMPTZ DEFAULT NOW()
+                )
+                ''')
+
+
+def get_migration_status(conn):
+    # Returns [(version, name, time_applied or None)] of all known migrations
+    cur = conn.cursor()
+    _ensure_migrations_table(cur)
+    cur.execute("SELECT version, time_applied FROM schema_migrations")
+    applied = dict(cur.fetchall())
+    conn.commit()
+    cur.close()
+    return [(version, name, applied.get(version)) for version, name, _ in get_migrations()]
+
+
+def apply_migrations(conn):
+    # Applies all pending migrations, each in its own transaction. Returns the names of the applied ones.
+    cur = conn.cursor()
+    # Several workers or containers may start at the same time, only one of them migrates
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID, ))
+    try:
+        _ensure_migrations_table(cur)
+        conn.commit()
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+        applied_names = []
+        for version, name, path in get_migrations():
+            if version in applied:
+                continue
+            try:
+                cur.execute(_read_migration(path))
+                cur.execute("INSERT INTO schema_migrations(version, name) VALUES(%s, %s)", (version, name))
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                logger.error("Migration %04d_%s failed", version, name)
+                raise
+            logger.info("Applied migration %04d_%s", version, name)
+            applied_names.append(f"{version:04d}_{name}")
+        return applied_names
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID, ))
+        conn.commit()
+        cur.close()
+
+
+def migrate():
+    conn = get_migration_connection()
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+def migrate_on_startup():
+    # Opt-in, deployments without migration credentials run `flask migrate` instead
+    if os.environ.get("MIGRATE_ON_STARTUP", "false").lower() == "true":
+        migrate()
@@ -0,0 +1,126 @@
+# PostgreSQL LISTEN/NOTIFY for cross-worker cache invalidation
+import logging
+import os
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+from database_service.connection import _connect_kwargs
+
+logger = logging.getLogger(__name__)
+
+_subscribers = {}
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def notify(cur, channel: str, payload: str = ""):
+    # Queue a notification on the current transaction, it is delivered on commit
+    cur.execute('SELECT pg_notify(%s, %s)', (channel, str(payload)))
+
+
+def subscribe(channel: str, callback):
+    # Callback receives the payload, or None if notifications may have been missed (e.g. reconnect)
+    with _listener_lock:
+        _subscribers.setdefault(channel, [])
+        if callback not in _subscribers[channel]:
+            _subscribers[channel].append(callback)
+    start_listener()
+
+
+def _dispatch(channel: str, payload):
+    for callback in list(_subscribers.get(channel, [])):
+        try:
+            callback(payload)
+        except Exception as e:
+            logger.exception("Notification callback for %s failed: %s", channel, e)
+
+
+class _Listener(threading.Thread):
+    def __init__(self):
+        super().__init__(name="pg-notify-listener", daemon=True)
+        self.pid = os.getpid()
+        self.interval = float(os.environ.get("POSTGRES_NOTIFY_POLL_INTERVAL", 5))
+        self.stopped = threading.Event()
+        self.listening = threading.Event()
+
+    def _connect(self):
+        self.connect_kwargs = _connect_kwargs("public")
+        conn = psycopg2.connect(**self.connect_kwargs)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        for channel in list(_subscribers):
+            cur.execute(f'LISTEN "{channel}"')
+        cur.close()
+        return conn, set(_subscribers)
+
+    def run(self):
+        conn = None
+        while not self.stopped.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn, channels = self._connect()
+                    # Anything sent while we were not listening is lost
+                    for channel in channels:
+                        _dispatch(channel, None)
+                    self.listening.set()
+
+                if set(_subscribers) != channels:
+                    self.listening.clear()
+                    conn.close()
+                    conn = None
+                    continue
+
+                if select.select([conn], [], [], self.interval) == ([], [], []):
+                    # Keep detecting dropped connections and changed database settings
+                    if self.connect_kwargs != _connect_kwargs("public"):
+                        self.listening.clear()
+                        conn.close()
+                    continue
+
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    _dispatch(notification.channel, notification.payload)
+
+            except Exception as e:
+                logger.warning("Notification listener lost its connection: %s", e)
+                self.listening.clear()
+                if conn is not None and not conn.closed:
+                    conn.close()
+                conn = None
+                self.stopped.wait(self.interval)
+
+        if conn is not None and not conn.closed:
+            conn.close()
+
+
+def start_listener():
+    global _listener
+    if os.environ.get("POSTGRES_NOTIFY_LISTENER", "true").lower() != "true":
+        return
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid() or not _listener.is_alive():
+            _listener = _Listener()
+            _listener.start()
+
+
+def wait_for_listener(timeout: float = None):
+    # Blocks until the listener receives notifications, returns False on timeout
+    listener = _listener
+    return listener is not None and listener.listening.wait(timeout)
+
+
+def stop_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None and _listener.pid == os.getpid():
+            _listener.stopped.set()
+        _listener = None
+
+
+def reset_listener():
+    # Forget the listener inherited through a fork, its thread only runs in the parent
+    global _listener, _listener_lock
+    _listener = None
+    _listener_lock = threading.Lock()
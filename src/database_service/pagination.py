@@ -0,0 +1,111 @@
+# Keyset pagination over (time_created, id) with optional field projection
+import base64
+import json
+import psycopg2
+from dataclasses import dataclass
+from datetime import datetime
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class Page:
+    items: list
+    next_cursor: str = None
+    total: int = None
+
+
+def encode_cursor(time_created, row_id):
+    payload = json.dumps([time_created.isoformat() if time_created else None, str(row_id)])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        time_created, row_id = json.loads(payload)
+        if time_created is not None:
+            datetime.fromisoformat(time_created)
+        return time_created, str(row_id)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("Invalid cursor")
+
+
+def parse_limit(limit, max_limit: int):
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidPageRequest("limit must be a number")
+    if not 1 <= limit <= max_limit:
+        raise InvalidPageRequest(f"limit must be between 1 and {max_limit}")
+    return limit
+
+
+def parse_fields(fields: str, model):
+    # JSON keys of the response, None for all fields of the model
+    if not fields:
+        return None
+    keys = [key.strip() for key in fields.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in model.columns]
+    if unknown or not keys:
+        raise InvalidPageRequest(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(model.columns)}")
+    return keys
+
+
+def fetch_page(conn, model, source: str, alias: str, id_column: str, where: str = "TRUE", params: tuple = (),
+               fields: list = None, limit: int = None, after: str = None, with_total: bool = False):
+    # model.columns maps the JSON keys to model fields, which are named like the table columns.
+    # Only the columns of the requested fields are selected, the other model fields stay None.
+    # conn is the connection of the data service, so a failed statement is rolled back through it.
+    keys = fields or list(model.columns)
+    selected = list(dict.fromkeys(model.columns[key] for key in keys))
+
+    query = f'''
+            SELECT {", ".join(f"{alias}.{column}" for column in selected)},
+                   {alias}.time_created, {alias}.{id_column}
+            FROM {source}
+            WHERE {where}
+            '''
+    query_params = list(params)
+    if after:
+        time_created, row_id = decode_cursor(after)
+        query += f" AND ({alias}.time_created, {alias}.{id_column}) > (%s::timestamptz, %s)"
+        query_params += [time_created, row_id]
+    if limit or after:
+        # The whole list keeps the unsorted order it always had, only pages need the keyset order
+        query += f" ORDER BY {alias}.time_created, {alias}.{id_column}"
+    if limit:
+        # One more row tells if there is a next page
+        query += " LIMIT %s"
+        query_params.append(limit + 1)
+
+    cur = conn.cursor()
+    try:
+        try:
+            cur.execute(query, query_params)
+        except psycopg2.DataError:
+            # The cursor decoded but does not hold a valid timestamp or id
+            conn.rollback()
+            raise InvalidPageRequest("Invalid cursor")
+        rows = cur.fetchall()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][-2], rows[-1][-1])
+
+        count = len(selected)
+        items = [model(**dict(zip(selected, row[:count]))) for row in rows]
+
+        total = None
+        if with_total:
+            cur.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", params)
+            total = cur.fetchone()[0]
+
+        return Page(items, next_cursor, total)
+    finally:
+        cur.close()
@@ -1,14 +1,119 @@
-from numpy import double
+from decimal import ROUND_HALF_UP, Decimal
 import psycopg2
-import psycopg2.extras
 import sys
 import os
 
-from models.Product import Beverage, Product, ProductCategory
+from models.Product import Beverage, BeveragePrice, PriceMatrix, Product, ProductCategory
+from services.catalog_cache import CATALOG_CHANNEL, catalog_cache, invalidate_catalog
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
 
 from database_service.connection import *  # noqa
+from database_service.notifications import notify, subscribe  # noqa
+from database_service.rows import fetch_all, fetch_one  # noqa
+from database_service.table_version import (EVENT_MODE_TABLE, PRODUCT_CATEGORY_TABLE, PRODUCT_TABLE,  # noqa
+                                            bump_table_version)
+
+# JSON key of a price -> pricing_type (PRICE_CATEGORY) in the database
+PRICING_KEY_MAPPING = {
+    "normal": "normal",
+    "party": "party",
+    "bigEvent": "big_event"
+}
+
+
+def get_price_ranking_markup():
+    # Markup in percent per price_ranking on top of the pricing table, e.g. PRICE_MARKUP_EXTERNAL=20
+    return {price_ranking: 1 + Decimal(os.environ.get(f"PRICE_MARKUP_{price_ranking.upper()}", "0")) / 100
+            for price_ranking in ("member", "regular", "external")}
+
+
+def get_effective_price_ranking(price_ranking: str):
+    # Unknown rankings pay like external users, as in book_tab_transaction
+    return price_ranking if price_ranking in ("member", "regular") else "external"
+
+
+def get_price_matrix():
+    # Cached with the catalog, so every catalog change rebuilds it. The markup is part of the key,
+    # a changed configuration never returns old prices.
+    markup = get_price_ranking_markup()
+    return catalog_cache.get_or_load(("priceMatrix", tuple(markup.items())), lambda: _load_price_matrix(markup))
+
+
+def _load_price_matrix(markup: dict):
+    # Make sure catalog changes of other workers reach the cache
+    subscribe(CATALOG_CHANNEL, invalidate_catalog)
+
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT p.product_id, p.product_name, p.category_id, b.beverage_size, pr.pricing_type, pr.price
+                FROM product p
+                JOIN beverage b ON(p.product_id = b.product_id)
+                JOIN pricing pr ON(p.product_id = pr.product_id)
+                ORDER BY p.product_id
+                '''
+                )
+
+    prices = {}
+    for product_id, product_name, category_id, beverage_size, pricing_type, price in cur:
+        for price_ranking, factor in markup.items():
+            # Rounded like ROUND(price * markup, 2) of the booking
+            effective_price = (price * factor).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+            prices.setdefault((pricing_type, price_ranking), []).append(
+                BeveragePrice(product_id, product_name, category_id, float(beverage_size), float(effective_price)))
+    cur.close()
+    conn.close()
+
+    return PriceMatrix(prices)
+
+
+def get_event_mode():
+    # Active pricing_type, cached with the catalog so set_event_mode of any worker reloads it
+    return catalog_cache.get_or_load("eventMode", _load_event_mode)
+
+
+def _load_event_mode():
+    # Make sure catalog changes of other workers reach the cache
+    subscribe(CATALOG_CHANNEL, invalidate_catalog)
+
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT pricing_type
+                FROM event_mode
+                '''
+                )
+    response = cur.fetchone()
+    cur.close()
+    conn.close()
+    return response[0] if response else "normal"
+
+
+def set_event_mode(pricing_type: str):
+    try:
+        conn = get_auth_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+                    UPDATE event_mode
+                    SET pricing_type = %s,
+                        time_modified = NOW()
+                    ''',
+                    (pricing_type, ))
+        bump_table_version(cur, EVENT_MODE_TABLE)
+        # Every worker drops its catalogs rendered for the previous mode
+        notify(cur, CATALOG_CHANNEL)
+        conn.commit()
+        cur.close()
+        conn.close()
+        on_commit(invalidate_catalog)
+        return {"error": None, "message": {"status": "Event mode updated successfully"}}
+
+    except psycopg2.Error as Err:
+        conn.rollback()
+        conn.close()
+        return {"error": {"exception": Err.__class__.__name__, "message": str(
+            Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}
 
 
 def create_category(title: str):
@@ -22,9 +127,12 @@ def create_category(title: str):
                     (%s);
                     ''',
                     (title,))
+        bump_table_version(cur, PRODUCT_CATEGORY_TABLE)
+        notify(cur, CATALOG_CHANNEL)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_catalog)
         return {"error": None, "message": {"categoryName": title}}
 
     except psycopg2.errors.UniqueViolation as Err:
@@ -48,13 +156,9 @@ def get_all_product_categories():
                 FROM "product_category"
                 '''
                 )
-    response = cur.fetchall()
+    parsed_response = fetch_all(cur, ProductCategory)
     cur.close()
     conn.close()
-
-    parsed_response = []
-    for row in response:
-        parsed_response.append(ProductCategory(row[0], row[1]))
     return parsed_response
 
 
@@ -78,11 +182,6 @@ def create_beverage(product_name: str, category_id: int, beverage_size: float, p
                     ''',
                     (product_id, beverage_size))
 
-        PRICING_KEY_MAPPING = {
-            "normal": "normal",
-            "party": "party",
-            "bigEvent": "big_event"
-        }
         pricing_values = [(product_id, PRICING_KEY_MAPPING[key], price) for key, price in pricing.items()]
         # Bulk insert into pricing table
         cur.executemany('''
@@ -92,9 +191,12 @@ def create_beverage(product_name: str, category_id: int, beverage_size: float, p
                         pricing_values
                         )
 
+        bump_table_version(cur, PRODUCT_TABLE)
+        notify(cur, CATALOG_CHANNEL)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_catalog)
         return {"error": None, "message": {"productId": product_id, "status": "Beverage added successfully"}}
 
     except psycopg2.Error as Err:
@@ -106,7 +208,7 @@ def create_beverage(product_name: str, category_id: int, beverage_size: float, p
 
 def get_all_beverages():
     conn = get_auth_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur = conn.cursor()
     cur.execute('''
                 SELECT p.product_id, p.product_name, p.category_id, b.beverage_size, pr.pricing_type, pr.price
                 FROM product p
@@ -114,9 +216,6 @@ def get_all_beverages():
                 JOIN pricing pr ON(p.product_id = pr.product_id)
                 '''
                 )
-    response = cur.fetchall()
-    cur.close()
-    conn.close()
 
     PRICING_KEY_MAPPING = {
         "normal": "normal",
@@ -124,43 +223,53 @@ def get_all_beverages():
         "big_event": "bigEvent"
     }
 
-    # Dictionary to group products by product_id
-    products_dict = {}
-
-    for row in response:
-        product_id = int(row["product_id"])
-        product_name = str(row["product_name"])
-        category_id = int(row["category_id"])
-        beverage_size = float(row["beverage_size"])
-        pricing_type = str(row["pricing_type"])
-        price = float(row["price"])
-
-        if product_id not in products_dict:
-            products_dict[product_id] = {
-                "product_id": product_id,
-                "product_name": product_name,
-                "category_id": category_id,
-                "beverage_size": beverage_size,
-                "pricing": {}
-            }
-
-        # Map pricing type using PRICING_KEY_MAPPING
-        pricing_key = PRICING_KEY_MAPPING.get(pricing_type, pricing_type)
-        products_dict[product_id]["pricing"][pricing_key] = price
-
-    # Convert dictionary to a list of Product objects
-    products_array = [
-        Beverage(
-            product_id=data["product_id"],
-            product_name=data["product_name"],
-            category_id=data["category_id"],
-            beverage_size=data["beverage_size"],
-            pricing=data["pricing"]
-        )
-        for data in products_dict.values()
-    ]
-
-    return products_array
+    # One row per price, group them into one Beverage per product
+    beverages = {}
+    for product_id, product_name, category_id, beverage_size, pricing_type, price in cur:
+        beverage = beverages.get(product_id)
+        if beverage is None:
+            beverage = beverages[product_id] = Beverage(product_id, product_name, category_id, float(beverage_size), {})
+        beverage.pricing[PRICING_KEY_MAPPING.get(pricing_type, pricing_type)] = float(price)
+    cur.close()
+    conn.close()
+
+    return list(beverages.values())
+
+
+def get_beverage_catalog_json():
+    # The grouped catalog (category -> beverages -> pricing) as JSON text built by PostgreSQL in one statement,
+    # None without beverages. Numbers are cast to float8 so they are written like float() in get_all_beverages.
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT json_agg(json_build_object('categoryId', c.category_id, 'beverages', c.beverages)
+                                ORDER BY c.category_id)::text
+                FROM (
+                    SELECT p.category_id,
+                           json_agg(json_build_object('id', p.product_id,
+                                                      'productName', p.product_name,
+                                                      'beverageSize', b.beverage_size::float8,
+                                                      'pricing', pr.pricing)
+                                    ORDER BY p.product_id) AS beverages
+                    FROM product p
+                    JOIN beverage b ON(p.product_id = b.product_id)
+                    JOIN (
+                        SELECT product_id,
+                               json_object_agg(CASE pricing_type
+                                                   WHEN 'big_event' THEN 'bigEvent'
+                                                   ELSE pricing_type::text
+                                               END, price::float8) AS pricing
+                        FROM pricing
+                        GROUP BY product_id
+                    ) pr ON(p.product_id = pr.product_id)
+                    GROUP BY p.category_id
+                ) c
+                '''
+                )
+    response = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return response
 
 
 def get_product_by_product_id(product_id: int):
@@ -172,13 +281,10 @@ def get_product_by_product_id(product_id: int):
                 WHERE product_id = %s
                 ''',
                 (product_id, ))
-    response = cur.fetchone()
+    product = fetch_one(cur, Product)
     cur.close()
     conn.close()
-    if response:
-        return Product(response[0], response[1], response[2], response[3], "")
-    else:
-        return None
+    return product
 
 
 def update_product_picture_path(product_id: int, path: str):
@@ -251,11 +357,6 @@ def update_beverage(product_id: int, product_name: str, category_id: int, bevera
                     ''',
                     (beverage_size, product_id))
 
-        PRICING_KEY_MAPPING = {
-            "normal": "normal",
-            "party": "party",
-            "bigEvent": "big_event"
-        }
         pricing_values = [(price, PRICING_KEY_MAPPING[key], product_id) for key, price in pricing.items()]
         # Bulk insert into pricing table
         cur.executemany('''
@@ -267,9 +368,12 @@ def update_beverage(product_id: int, product_name: str, category_id: int, bevera
                         pricing_values,
                         )
 
+        bump_table_version(cur, PRODUCT_TABLE)
+        notify(cur, CATALOG_CHANNEL)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_catalog)
         return {"error": None, "message": {"productId": product_id, "status": "Beverage updated successfully"}}
 
     except psycopg2.Error as Err:
@@ -291,9 +395,13 @@ def delete_product_by_product_id(product_id: int):
                     (product_id,))
 
         deleted_product = cur.fetchone()
+        if deleted_product:
+            bump_table_version(cur, PRODUCT_TABLE)
+        notify(cur, CATALOG_CHANNEL)
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_catalog)
 
         if deleted_product:
             return {"error": None, "message": f"Product {product_id} deleted successfully"}, 200
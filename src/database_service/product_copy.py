@@ -0,0 +1,338 @@
+# Bulk import and export of beverages with COPY. Imports are streamed into a temporary staging table and
+# applied with one set-based statement, exports are streamed from COPY TO STDOUT while the database sends them.
+import csv
+import io
+import json
+import queue
+import threading
+import psycopg2
+import sys
+import os
+from decimal import Decimal, InvalidOperation
+
+from services.catalog_cache import CATALOG_CHANNEL, invalidate_catalog
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
+
+from database_service.connection import *  # noqa
+from database_service.notifications import notify  # noqa
+from database_service.table_version import PRODUCT_TABLE, bump_table_version  # noqa
+
+# Columns of the CSV files, also the keys of the JSON lines (prices there may be nested in "pricing")
+COLUMNS = ("productId", "productName", "categoryId", "beverageSize", "normal", "party", "bigEvent")
+REQUIRED_COLUMNS = COLUMNS[1:]
+
+# Limits of the NUMERIC columns of beverage and pricing
+MAX_BEVERAGE_SIZE = Decimal("1000")
+MAX_PRICE = Decimal("100000000")
+
+
+class ImportFormatError(ValueError):
+    # The input as a whole can not be read, e.g. a missing CSV column
+    pass
+
+
+def _int(value, key: str, required: bool = True):
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"{key} is required")
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    raise ValueError(f"{key} must be a positive integer")
+
+
+def _decimal(value, key: str, maximum: Decimal):
+    if value is None or value == "" or isinstance(value, bool):
+        raise ValueError(f"{key} is required")
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{key} must be a number")
+    if not number.is_finite() or not 0 <= number < maximum:
+        raise ValueError(f"{key} must be between 0 and {maximum}")
+    return number
+
+
+def _staging_row(line: int, values: dict):
+    # Row of the staging table, rows that can not be imported only carry their error
+    try:
+        product_name = values.get("productName")
+        if not isinstance(product_name, str) or not 0 < len(product_name.strip()) <= 255:
+            raise ValueError("productName must be a text of 1 to 255 characters")
+        return (line, _int(values.get("productId"), "productId", required=False), product_name.strip(),
+                _int(values.get("categoryId"), "categoryId"),
+                _decimal(values.get("beverageSize"), "beverageSize", MAX_BEVERAGE_SIZE),
+                *(_decimal(values.get(key), key, MAX_PRICE) for key in ("normal", "party", "bigEvent")), None)
+    except ValueError as e:
+        return _error_row(line, str(e))
+
+
+def _error_row(line: int, error: str):
+    return (line, None, None, None, None, None, None, None, error)
+
+
+def parse_csv(stream):
+    # Reads the header right away so a wrong file fails before anything is sent to the database
+    reader = csv.reader(stream)
+    try:
+        header = [column.strip() for column in next(reader, [])]
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFormatError(f"Invalid CSV header: {e}")
+    unknown = [column for column in header if column not in COLUMNS]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if unknown or missing:
+        raise ImportFormatError(f"Expected the columns {', '.join(COLUMNS)} (productId is optional)")
+
+    def rows():
+        try:
+            for values in reader:
+                if not values:
+                    continue
+                if len(values) != len(header):
+                    yield _error_row(reader.line_num, f"Expected {len(header)} values but got {len(values)}")
+                    continue
+                yield _staging_row(reader.line_num, dict(zip(header, values)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Nothing after this point can be read
+            yield _error_row(reader.line_num + 1, f"Invalid CSV, the rest of the file was skipped: {e}")
+
+    return rows()
+
+
+def parse_jsonl(stream):
+    # One object per line, shaped like the body of POST /product/beverage plus an optional productId
+    def rows():
+        line = 0
+        try:
+            for line, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    values = json.loads(text)
+                except ValueError:
+                    yield _error_row(line, "Invalid JSON")
+                    continue
+                if not isinstance(values, dict):
+                    yield _error_row(line, "Expected a JSON object")
+                    continue
+                if isinstance(values.get("pricing"), dict):
+                    values = {**values, **values["pricing"]}
+                yield _staging_row(line, values)
+        except UnicodeDecodeError as e:
+            yield _error_row(line + 1, f"Invalid UTF-8, the rest of the file was skipped: {e}")
+
+    return rows()
+
+
+class _CopyInStream:
+    # Source file of COPY FROM STDIN, the rows are written as CSV while the database reads them
+    def __init__(self, rows):
+        self._rows = rows
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        self._pending = bytearray()
+
+    def read(self, size: int = -1):
+        while self._rows is not None and (size < 0 or len(self._pending) < size):
+            row = next(self._rows, None)
+            if row is None:
+                self._rows = None
+                break
+            self._writer.writerow(row)
+            self._pending += self._text.getvalue().encode("utf-8")
+            self._text.seek(0)
+            self._text.truncate()
+        if size < 0:
+            size = len(self._pending)
+        chunk = bytes(self._pending[:size])
+        del self._pending[:size]
+        return chunk
+
+
+def import_beverages(rows):
+    # rows: staging rows of parse_csv or parse_jsonl. Valid rows are imported, rows with a productId update
+    # that beverage, the others are created. Returns the number of created and updated beverages and
+    # the errors per line.
+    try:
+        conn = get_auth_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+                    CREATE TEMPORARY TABLE product_import(
+                        line_number INT NOT NULL,
+                        product_id INT,
+                        product_name TEXT,
+                        category_id INT,
+                        beverage_size NUMERIC,
+                        normal NUMERIC,
+                        party NUMERIC,
+                        big_event NUMERIC,
+                        error TEXT
+                    ) ON COMMIT DROP
+                    ''')
+        cur.copy_expert("COPY product_import FROM STDIN WITH (FORMAT csv)", _CopyInStream(rows))
+
+        # Rows that only fail against the current data
+        cur.execute('''
+                    UPDATE product_import i
+                    SET error = v.error
+                    FROM (
+                        SELECT s.line_number,
+                               CASE
+                                   WHEN c.category_id IS NULL THEN 'Unknown categoryId'
+                                   WHEN s.product_id IS NOT NULL AND b.product_id IS NULL THEN 'Unknown productId'
+                                   WHEN s.product_id IS NOT NULL
+                                        AND row_number() OVER (PARTITION BY s.product_id ORDER BY s.line_number) > 1
+                                       THEN 'Duplicate productId'
+                               END AS error
+                        FROM product_import s
+                        LEFT JOIN product_category c ON(c.category_id = s.category_id)
+                        LEFT JOIN beverage b ON(b.product_id = s.product_id)
+                        WHERE s.error IS NULL
+                    ) v
+                    WHERE i.line_number = v.line_number
+                    AND v.error IS NOT NULL
+                    ''')
+
+        # New beverages get their id upfront, so products, beverages and prices are written in one statement
+        cur.execute('''
+                    WITH staged AS MATERIALIZED (
+                        SELECT line_number, product_id IS NULL AS created,
+                               COALESCE(product_id, nextval('product_product_id_seq')) AS product_id,
+                               product_name, category_id, beverage_size, normal, party, big_event
+                        FROM product_import
+                        WHERE error IS NULL
+                    ),
+                    updated_product AS (
+                        UPDATE product p
+                        SET product_name = s.product_name,
+                            category_id = s.category_id
+                        FROM staged s
+                        WHERE NOT s.created
+                        AND p.product_id = s.product_id
+                    ),
+                    created_product AS (
+                        INSERT INTO product(product_id, product_name, category_id, product_type)
+                        SELECT product_id, product_name, category_id, 'beverage'
+                        FROM staged
+                        WHERE created
+                    ),
+                    upserted_beverage AS (
+                        INSERT INTO beverage(product_id, beverage_size)
+                        SELECT product_id, beverage_size
+                        FROM staged
+                        ON CONFLICT (product_id) DO UPDATE
+                        SET beverage_size = EXCLUDED.beverage_size
+                    ),
+                    upserted_pricing AS (
+                        INSERT INTO pricing(product_id, pricing_type, price)
+                        SELECT s.product_id, p.pricing_type, p.price
+                        FROM staged s
+                        CROSS JOIN LATERAL (VALUES ('normal'::PRICE_CATEGORY, s.normal),
+                                                   ('party'::PRICE_CATEGORY, s.party),
+                                                   ('big_event'::PRICE_CATEGORY, s.big_event)) p(pricing_type, price)
+                        ON CONFLICT (product_id, pricing_type) DO UPDATE
+                        SET price = EXCLUDED.price
+                    )
+                    SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FILTER (WHERE NOT created)
+                    FROM staged
+                    ''')
+        created, updated = cur.fetchone()
+
+        cur.execute('''
+                    SELECT line_number, error
+                    FROM product_import
+                    WHERE error IS NOT NULL
+                    ORDER BY line_number
+                    ''')
+        errors = [{"line": line, "message": error} for line, error in cur]
+
+        if created or updated:
+            bump_table_version(cur, PRODUCT_TABLE)
+            notify(cur, CATALOG_CHANNEL)
+        conn.commit()
+        cur.close()
+        conn.close()
+        if created or updated:
+            on_commit(invalidate_catalog)
+        return {"error": None, "message": {"created": created, "updated": updated, "errors": errors}}
+
+    except psycopg2.Error as Err:
+        conn.rollback()
+        conn.close()
+        return {"error": {"exception": Err.__class__.__name__, "message": str(
+            Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}
+
+
+def export_beverages(file):
+    # Writes all beverages as CSV with the columns of the import, so an export can be imported again
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.copy_expert('''
+                        COPY (
+                            SELECT p.product_id AS "productId", p.product_name AS "productName",
+                                   p.category_id AS "categoryId", b.beverage_size AS "beverageSize",
+                                   MAX(pr.price) FILTER (WHERE pr.pricing_type = 'normal') AS "normal",
+                                   MAX(pr.price) FILTER (WHERE pr.pricing_type = 'party') AS "party",
+                                   MAX(pr.price) FILTER (WHERE pr.pricing_type = 'big_event') AS "bigEvent"
+                            FROM product p
+                            JOIN beverage b ON(p.product_id = b.product_id)
+                            LEFT JOIN pricing pr ON(p.product_id = pr.product_id)
+                            GROUP BY p.product_id, b.beverage_size
+                            ORDER BY p.product_id
+                        ) TO STDOUT WITH (FORMAT csv, HEADER)
+                        ''',
+                        file)
+    finally:
+        cur.close()
+        conn.close()
+
+
+_END = object()
+
+
+class BeverageExport:
+    # Iterates over the CSV chunks of export_beverages. COPY runs on its own connection in a thread and
+    # waits while the client is slower than the database, a closed iterator makes it fail and stop.
+    def __init__(self, max_chunks: int = 16):
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._closed = threading.Event()
+
+    def write(self, data):
+        self._put(data.encode("utf-8") if isinstance(data, str) else bytes(data))
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        raise OSError("Export closed by the client")
+
+    def _run(self):
+        try:
+            export_beverages(self)
+            result = _END
+        except Exception as e:
+            result = e
+        try:
+            self._put(result)
+        except OSError:
+            pass
+
+    def __iter__(self):
+        threading.Thread(target=self._run, name="beverage-export", daemon=True).start()
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is _END:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self._closed.set()
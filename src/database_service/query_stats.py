@@ -0,0 +1,141 @@
+# Database time and connections of the current request, collected by the cursors of pooled connections.
+# Statements above SLOW_QUERY_THRESHOLD seconds are logged, in debug mode repeated statements (N+1) as well.
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+_query_stats = contextvars.ContextVar("query_stats", default=None)
+
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD", 0.2))
+
+# Identical statements per request from which a request is reported as N+1, only checked in debug mode
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 10))
+DETECT_N_PLUS_ONE = os.environ.get("DETECT_N_PLUS_ONE",
+                                   str(os.environ.get("RUN_ENV", "PROD") == "DEV")).lower() == "true"
+
+# Helpers that run statements for the data services, the caller is the function that called them
+_HELPER_MODULES = {__name__, "database_service.pagination", "database_service.rows"}
+
+MAX_LOGGED_STATEMENT_LENGTH = 1000
+
+
+class QueryStats:
+    __slots__ = ("context", "queries", "seconds", "checkouts", "connects", "statements")
+
+    def __init__(self, context: str = None):
+        self.context = context  # e.g. the route of the request, for the logs
+        self.queries = 0
+        self.seconds = 0.0
+        self.checkouts = 0  # Connections taken from a pool
+        self.connects = 0  # Connections newly opened to the database
+        self.statements = {}  # statement -> StatementStats, only when detecting N+1
+
+
+class StatementStats:
+    __slots__ = ("count", "seconds", "rows", "caller")
+
+    def __init__(self, caller: str):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.caller = caller
+
+
+def start_query_stats(context: str = None):
+    # Returns a token for stop_query_stats, statements outside of a started context are not counted
+    return _query_stats.set(QueryStats(context))
+
+
+def get_query_stats():
+    return _query_stats.get()
+
+
+def stop_query_stats(token):
+    stats = _query_stats.get()
+    _query_stats.reset(token)
+    if stats is not None:
+        for statement, statement_stats in stats.statements.items():
+            if statement_stats.count >= N_PLUS_ONE_THRESHOLD:
+                _log("n_plus_one", _statement_text(statement, None), statement_stats.caller, stats.context,
+                     count=statement_stats.count, seconds=round(statement_stats.seconds, 6), rows=statement_stats.rows)
+    return stats
+
+
+def get_caller():
+    # "module.function" of the data service running the statement
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in _HELPER_MODULES and not module.startswith("psycopg2"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _statement_text(query, cur):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed
+        query = query.as_string(cur)
+    # One line, the values of the parameters are never logged
+    return " ".join(query.split())[:MAX_LOGGED_STATEMENT_LENGTH]
+
+
+def _log(event: str, statement: str, caller: str, context: str, **fields):
+    logger.warning(json.dumps({"event": event, "context": context, "caller": caller, **fields,
+                               "statement": statement}))
+
+
+def record_query(seconds: float, query=None, cur=None, rows: int = -1):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += seconds
+
+    if query is None:
+        return
+    if seconds >= SLOW_QUERY_THRESHOLD:
+        _log("slow_query", _statement_text(query, cur), get_caller(), stats.context if stats else None,
+             seconds=round(seconds, 6), rows=rows)
+
+    if stats is not None and DETECT_N_PLUS_ONE:
+        # The statement text is the same for every call of a data service, only the parameters differ
+        key = query if isinstance(query, (str, bytes)) else _statement_text(query, cur)
+        statement_stats = stats.statements.get(key)
+        if statement_stats is None:
+            statement_stats = stats.statements[key] = StatementStats(get_caller())
+        statement_stats.count += 1
+        statement_stats.seconds += seconds
+        statement_stats.rows += max(rows, 0)
+
+
+def record_connection(connected: bool):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.checkouts += 1
+        if connected:
+            stats.connects += 1
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    # psycopg2 reads the whole result in execute, the fetch calls do not wait for the database
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - started, query, self, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(time.perf_counter() - started, query, self, self.rowcount)
@@ -0,0 +1,8 @@
+# Map cursor rows straight into model instances, the selected columns follow the order of the model fields
+def fetch_one(cur, model):
+    row = cur.fetchone()
+    return model.from_row(row) if row else None
+
+
+def fetch_all(cur, model):
+    return [model.from_row(row) for row in cur]
@@ -0,0 +1,304 @@
+# Retention of account sessions. Invalidated sessions are deleted in small batches, so no long lock blocks logins.
+# A partitioned account_sessions table (see partition_account_sessions) additionally drops whole months at once.
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2 import sql
+from database_service.connection import _connect_kwargs
+from database_service.migrations import get_migration_connection
+
+logger = logging.getLogger(__name__)
+
+# Only one worker of all containers runs the retention at a time
+RETENTION_LOCK_ID = 4206002
+
+PARTITION_PREFIX = "account_sessions_p"
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_max_age():
+    # Seconds, has to be longer than the refresh token lifetime
+    return float(os.environ.get("SESSION_RETENTION_MAX_AGE", 30 * 24 * 60 * 60))
+
+
+def purge_invalidated_sessions(conn, max_age: float, batch_size: int = 1000, batch_pause: float = 0.0):
+    # Deletes sessions invalidated longer than max_age seconds ago, each batch in its own transaction.
+    # Returns the number of deleted sessions.
+    cur = conn.cursor()
+    deleted = 0
+    while True:
+        cur.execute('''
+                    DELETE FROM account_sessions
+                    WHERE token_id IN (
+                        -- Invalidated sessions are never updated again, the rows are not contended
+                        SELECT token_id
+                        FROM account_sessions
+                        WHERE invalidated
+                        AND time_invalidated < NOW() - make_interval(secs => %s)
+                        LIMIT %s
+                    )
+                    ''',
+                    (max_age, batch_size))
+        conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+        # Leave room for the logins and invalidations in between
+        time.sleep(batch_pause)
+    cur.close()
+    return deleted
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'account_sessions'::regclass")
+    return cur.fetchone()[0]
+
+
+def _month_start(year: int, month: int):
+    # Months beyond December roll over into the next year
+    return datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _partition_name(month_start: datetime):
+    return f"{PARTITION_PREFIX}{month_start.year:04d}{month_start.month:02d}"
+
+
+def _create_partition(cur, month_start: datetime):
+    month_end = _month_start(month_start.year, month_start.month + 1)
+    cur.execute(sql.SQL('''
+                        CREATE TABLE IF NOT EXISTS {} PARTITION OF account_sessions
+                        FOR VALUES FROM (%s) TO (%s)
+                        ''').format(sql.Identifier(_partition_name(month_start))),
+                (month_start, month_end))
+
+
+def _create_partitions(cur, first: datetime, months_ahead: int):
+    now = datetime.now(timezone.utc)
+    last = _month_start(now.year, now.month + months_ahead)
+    month = 0
+    while _month_start(first.year, first.month + month) <= last:
+        _create_partition(cur, _month_start(first.year, first.month + month))
+        month += 1
+
+
+def ensure_session_partitions(conn, months_ahead: int = 3):
+    # Monthly partitions up to months_ahead months in the future. Rows outside of them land in the
+    # default partition, which would block creating their partition later.
+    cur = conn.cursor()
+    _create_partitions(cur, datetime.now(timezone.utc), months_ahead)
+    conn.commit()
+    cur.close()
+
+
+def drop_expired_session_partitions(conn, max_age: float):
+    # Partitions that ended more than max_age seconds ago only hold expired sessions, dropping them is instant.
+    # Returns the names of the dropped partitions.
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON(c.oid = i.inhrelid)
+                WHERE i.inhparent = 'account_sessions'::regclass
+                AND c.relname LIKE %s
+                ORDER BY c.relname
+                ''',
+                (f"{PARTITION_PREFIX}%", ))
+    cutoff = datetime.now(timezone.utc).timestamp() - max_age
+
+    dropped = []
+    for (name, ) in cur.fetchall():
+        suffix = name[len(PARTITION_PREFIX):]
+        if len(suffix) != 6 or not suffix.isdigit():
+            continue
+        month_end = _month_start(int(suffix[:4]), int(suffix[4:]) + 1)
+        if month_end.timestamp() < cutoff:
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            dropped.append(name)
+    conn.commit()
+    cur.close()
+    return dropped
+
+
+def partition_account_sessions(conn, months_ahead: int = 3):
+    # One-time conversion of account_sessions into a table partitioned by month of time_created, as table owner.
+    # Returns False if it is already partitioned.
+    cur = conn.cursor()
+    try:
+        cur.execute("LOCK TABLE account_sessions IN ACCESS EXCLUSIVE MODE")
+        if is_partitioned(cur):
+            conn.rollback()
+            return False
+
+        # Everything that has to be recreated on the new table
+        cur.execute('''
+                    SELECT indexdef
+                    FROM pg_indexes
+                    WHERE schemaname = current_schema()
+                    AND tablename = 'account_sessions'
+                    AND indexname <> 'account_sessions_pkey'
+                    ''')
+        index_definitions = [row[0] for row in cur.fetchall()]
+        cur.execute('''
+                    SELECT grantee, privilege_type
+                    FROM information_schema.role_table_grants
+                    WHERE table_schema = current_schema()
+                    AND table_name = 'account_sessions'
+                    AND grantee <> current_user
+                    ''')
+        grants = cur.fetchall()
+        cur.execute("SELECT MIN(time_created) FROM account_sessions")
+        oldest = cur.fetchone()[0]
+
+        cur.execute('''
+                    ALTER TABLE account_sessions RENAME TO account_sessions_unpartitioned;
+                    ALTER INDEX account_sessions_pkey RENAME TO account_sessions_unpartitioned_pkey;
+
+                    -- The partition key has to be part of the primary key
+                    CREATE TABLE account_sessions (LIKE account_sessions_unpartitioned INCLUDING DEFAULTS)
+                        PARTITION BY RANGE (time_created);
+                    ALTER TABLE account_sessions ALTER COLUMN time_created SET NOT NULL;
+                    ALTER TABLE account_sessions ADD CONSTRAINT account_sessions_pkey
+                        PRIMARY KEY (token_id, time_created);
+                    ALTER TABLE account_sessions ADD FOREIGN KEY (account_id) REFERENCES account(public_id)
+                        ON DELETE CASCADE
+                        ON UPDATE CASCADE;
+                    CREATE TABLE account_sessions_default PARTITION OF account_sessions DEFAULT;
+                    ''')
+        _create_partitions(cur, oldest.astimezone(timezone.utc) if oldest else datetime.now(timezone.utc),
+                           months_ahead)
+
+        cur.execute('''
+                    INSERT INTO account_sessions(token_id, account_id, ip_address, device, browser, time_created,
+                                                 origin_id, invalidated, time_invalidated)
+                    SELECT token_id, account_id, ip_address, device, browser, COALESCE(time_created, NOW()),
+                           origin_id, invalidated, time_invalidated
+                    FROM account_sessions_unpartitioned;
+
+                    CREATE OR REPLACE VIEW active_account_sessions AS
+                    SELECT
+                      a.username,
+                      s.ip_address,
+                      s.device,
+                      s.browser,
+                      s.time_created
+                    FROM account_sessions s
+                    JOIN account a ON a.public_id = s.account_id
+                    WHERE s.invalidated = false;
+
+                    CREATE TRIGGER trg_set_time_invalidated
+                    BEFORE UPDATE ON account_sessions
+                    FOR EACH ROW
+                    WHEN (OLD.invalidated IS DISTINCT FROM NEW.invalidated)
+                    EXECUTE FUNCTION set_time_invalidated();
+
+                    DROP TABLE account_sessions_unpartitioned;
+                    ''')
+        for grantee, privilege in grants:
+            cur.execute(sql.SQL("GRANT {} ON TABLE account_sessions TO {}").format(
+                sql.SQL(privilege), sql.Identifier(grantee)))
+        # The old indexes are gone with the old table, their names are free again
+        for index_definition in index_definitions:
+            cur.execute(index_definition)
+
+        conn.commit()
+        return True
+
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def run_session_retention(max_age: float = None, batch_size: int = None, batch_pause: float = None):
+    # One round of the retention. Returns None if another worker is running it right now.
+    max_age = get_max_age() if max_age is None else max_age
+    batch_size = batch_size or int(os.environ.get("SESSION_RETENTION_BATCH_SIZE", 1000))
+    batch_pause = float(os.environ.get("SESSION_RETENTION_BATCH_PAUSE", 0.05)) if batch_pause is None else batch_pause
+
+    conn = psycopg2.connect(**_connect_kwargs("auth"))
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (RETENTION_LOCK_ID, ))
+        if not cur.fetchone()[0]:
+            return None
+        try:
+            deleted = purge_invalidated_sessions(conn, max_age, batch_size, batch_pause)
+            partitioned = is_partitioned(cur)
+            conn.commit()
+
+            dropped = []
+            if partitioned:
+                # Creating and dropping partitions is up to the owner of the table
+                if "POSTGRES_MIGRATION_USER" in os.environ:
+                    migration_conn = get_migration_connection()
+                    try:
+                        ensure_session_partitions(migration_conn,
+                                                  int(os.environ.get("SESSION_PARTITION_MONTHS_AHEAD", 3)))
+                        dropped = drop_expired_session_partitions(migration_conn, max_age)
+                    finally:
+                        migration_conn.close()
+                else:
+                    logger.warning("account_sessions is partitioned, but POSTGRES_MIGRATION_USER is not set "
+                                   "to maintain the partitions")
+        finally:
+            # A failed batch must not keep the lock
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (RETENTION_LOCK_ID, ))
+            conn.commit()
+            cur.close()
+    finally:
+        conn.close()
+
+    if deleted or dropped:
+        logger.info("Session retention deleted %s session(s) and dropped %s partition(s)", deleted, len(dropped))
+    return {"deleted": deleted, "droppedPartitions": dropped}
+
+
+class _RetentionScheduler(threading.Thread):
+    def __init__(self):
+        super().__init__(name="session-retention", daemon=True)
+        self.pid = os.getpid()
+        self.interval = float(os.environ.get("SESSION_RETENTION_INTERVAL", 60 * 60))
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Spread the first round of all workers, the advisory lock lets only one of them do the work
+        self.stopped.wait(random.uniform(0, min(self.interval, 60)))
+        while not self.stopped.is_set():
+            try:
+                run_session_retention()
+            except Exception as e:
+                logger.warning("Session retention failed: %s", e)
+            self.stopped.wait(self.interval)
+
+
+def start_retention_scheduler():
+    global _scheduler
+    if os.environ.get("SESSION_RETENTION_SCHEDULER", "true").lower() != "true":
+        return
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.pid != os.getpid() or not _scheduler.is_alive():
+            _scheduler = _RetentionScheduler()
+            _scheduler.start()
+
+
+def stop_retention_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.pid == os.getpid():
+            _scheduler.stopped.set()
+        _scheduler = None
+
+
+def reset_retention_scheduler():
+    # Forget the scheduler inherited through a fork, its thread only runs in the parent
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
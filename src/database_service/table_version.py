@@ -0,0 +1,68 @@
+import os
+import sys
+from services.cache import TTLCache
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
+
+from database_service.connection import *  # noqa
+from database_service.notifications import notify, subscribe  # noqa
+
+# Notification channel, payload is the name of the changed table
+TABLE_VERSION_CHANNEL = "table_versions"
+
+# Versioned tables: "product" covers product, beverage and pricing
+PRODUCT_TABLE = "product"
+PRODUCT_CATEGORY_TABLE = "product_category"
+USER_TABLE = "user"
+EVENT_MODE_TABLE = "event_mode"
+
+table_version_cache = TTLCache(max_size=64, ttl=float(os.environ.get("TABLE_VERSION_CACHE_TTL", 60)),
+                               name="tableVersion")
+
+
+def bump_table_version(cur, table_name: str):
+    # Call inside the writing transaction, the new version becomes visible on commit
+    cur.execute('''
+                INSERT INTO table_versions(table_name, version, time_modified)
+                VALUES(%s, 1, NOW())
+                ON CONFLICT (table_name) DO UPDATE
+                SET version = table_versions.version + 1,
+                    time_modified = NOW()
+                ''',
+                (table_name, ))
+    notify(cur, TABLE_VERSION_CHANNEL, table_name)
+    # Inside a unit of work once it is committed. Reloads racing with the commit are corrected by the notification.
+    on_commit(lambda: invalidate_table_version(table_name))
+
+
+def invalidate_table_version(table_name: str = None):
+    if table_name is None:
+        table_version_cache.clear()
+    else:
+        table_version_cache.discard(lambda key: key == table_name)
+
+
+def get_table_version(table_name: str):
+    # Returns (version, time_modified), only read from the database on a cache miss
+    return table_version_cache.get_or_load(table_name, lambda: _load_table_version(table_name))
+
+
+def _load_table_version(table_name: str):
+    # Make sure writes of other workers reach the cache
+    subscribe(TABLE_VERSION_CHANNEL, invalidate_table_version)
+
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT version, time_modified
+                FROM table_versions
+                WHERE table_name = %s
+                ''',
+                (table_name, ))
+    response = cur.fetchone()
+    cur.close()
+    conn.close()
+    if response:
+        return response[0], response[1]
+    else:
+        return 0, None
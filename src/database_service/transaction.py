@@ -0,0 +1,117 @@
+import psycopg2
+import sys
+import os
+import uuid
+from models.Transaction import TabTransactionPosition
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
+
+from database_service.connection import *  # noqa
+from database_service.rows import fetch_all  # noqa
+from database_service.product import get_price_ranking_markup  # noqa
+from database_service.sqlstate import map_sqlstate_to_http_status  # noqa
+
+
+def book_tab_transaction(account_id: uuid, user_id: uuid, pricing_type: str, positions: list):
+    # Books all positions as one transaction_id with a single multi-row insert.
+    # positions: list of (product_id, quantity). Prices are resolved from pricing and the users price_ranking,
+    # the balance of a position is negative (money the user owes).
+    try:
+        conn = get_auth_db_connection()
+        cur = conn.cursor()
+
+        markup = get_price_ranking_markup()
+        cur.execute('''
+                    WITH new_transaction AS (
+                        SELECT nextval('tab_transactions_transaction_id_seq') AS transaction_id
+                    ),
+                    booking AS (
+                        SELECT p.position, p.product_id, p.quantity,
+                               ROUND(pr.price * CASE u.price_ranking
+                                                    WHEN 'member' THEN %(member)s
+                                                    WHEN 'regular' THEN %(regular)s
+                                                    ELSE %(external)s
+                                                END, 2) AS price
+                        FROM unnest(%(positions)s::int[], %(product_ids)s::int[], %(quantities)s::int[])
+                             AS p(position, product_id, quantity)
+                        JOIN pricing pr ON(pr.product_id = p.product_id AND pr.pricing_type = %(pricing_type)s)
+                        JOIN "user" u ON(u.user_id = %(user_id)s)
+                    ),
+                    booked AS (
+                        INSERT INTO tab_transactions(transaction_id, transaction_position, transaction_type,
+                                                     product_id, quantity, balance, user_affected, user_created)
+                        SELECT t.transaction_id, b.position, 'product', b.product_id, b.quantity,
+                               -(b.price * b.quantity), %(user_id)s,
+                               (SELECT linked_user_id FROM account WHERE public_id = %(account_id)s)
+                        FROM booking b
+                        CROSS JOIN new_transaction t
+                        RETURNING transaction_id, transaction_position, time_created, product_id, quantity, balance,
+                                  user_affected, user_created
+                    ),
+                    -- Keep the materialized balance in the same transaction as the booking
+                    user_balance_update AS (
+                        INSERT INTO user_balance(user_id, balance)
+                        SELECT user_affected, SUM(balance)
+                        FROM booked
+                        GROUP BY user_affected
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET balance = user_balance.balance + EXCLUDED.balance,
+                            time_modified = NOW()
+                    )
+                    SELECT transaction_id, transaction_position, time_created, product_id, quantity, balance,
+                           user_affected, user_created
+                    FROM booked
+                    ''',
+                    {
+                        "positions": list(range(1, len(positions) + 1)),
+                        "product_ids": [product_id for product_id, _ in positions],
+                        "quantities": [quantity for _, quantity in positions],
+                        "pricing_type": pricing_type,
+                        "user_id": user_id,
+                        "account_id": account_id,
+                        **markup
+                    })
+        response = cur.fetchall()
+
+        if len(response) != len(positions):
+            # Unknown user, or a product without price
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return {"error": {"exception": "BookingNotPossible",
+                              "message": "User or product of a position not found"}, "message": None}, 404
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        booked = [TabTransactionPosition.from_row(row) for row in sorted(response, key=lambda row: row[1])]
+        return {"error": None, "message": {
+            "transactionId": booked[0].transaction_id,
+            "userId": user_id,
+            "total": float(sum(position.balance for position in booked)),
+            "positions": [position.to_json() for position in booked]
+        }}, 201
+
+    except psycopg2.Error as Err:
+        conn.rollback()
+        conn.close()
+        return {"error": {"exception": Err.__class__.__name__, "message": str(
+            Err.diag.message_primary), "pgCode": Err.pgcode}, "message": None}, map_sqlstate_to_http_status(Err.pgcode)
+
+
+def get_tab_transaction_by_transaction_id(transaction_id: int):
+    conn = get_auth_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT transaction_id, transaction_position, time_created, product_id, quantity, balance,
+                       user_affected, user_created
+                FROM tab_transactions
+                WHERE transaction_id = %s
+                ORDER BY transaction_position
+                ''',
+                (transaction_id, ))
+    parsed_response = fetch_all(cur, TabTransactionPosition)
+    cur.close()
+    conn.close()
+    return parsed_response
@@ -3,10 +3,15 @@ import sys
 import os
 import uuid
 from models.User import User
+from services.session_cache import SESSION_CHANNEL, invalidate_account_sessions
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), './')))
 
 from database_service.connection import *  # noqa
+from database_service.notifications import notify  # noqa
+from database_service.pagination import fetch_page  # noqa
+from database_service.rows import fetch_one  # noqa
+from database_service.table_version import USER_TABLE, bump_table_version  # noqa
 
 
 def get_user_by_linked_account_uuid(account_public_id: uuid):
@@ -19,14 +24,10 @@ def get_user_by_linked_account_uuid(account_public_id: uuid):
                 WHERE a.public_id = %s
                 ''',
                 (account_public_id, ))
-    response = cur.fetchone()
+    user = fetch_one(cur, User)
     cur.close()
     conn.close()
-    if response:
-        return User(response[0], response[1], response[2], response[3],
-                    response[4], response[5], response[6], response[7])
-    else:
-        return None
+    return user
 
 
 def create_user(first_name: str, last_name: str, is_temporary: bool, price_ranking: str, permissions: str):
@@ -49,6 +50,7 @@ def create_user(first_name: str, last_name: str, is_temporary: bool, price_ranki
                         permissions
 
                     ))
+        bump_table_version(cur, USER_TABLE)
         conn.commit()
         cur.close()
         conn.close()
@@ -68,22 +70,16 @@ def create_user(first_name: str, last_name: str, is_temporary: bool, price_ranki
 
 
 def get_all_users():
-    conn = get_auth_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-                SELECT u.user_id, u.first_name, u.last_name, u.time_created, u.is_temporary, u.price_ranking, u.permissions, u.profile_picture_path
-                FROM "user" u
-                '''
-                )
-    response = cur.fetchall()
-    cur.close()
-    conn.close()
+    return get_users_page().items
+
 
-    parsed_response = []
-    for row in response:
-        parsed_response.append(User(row[0], row[1], row[2], row[3],
-                                    row[4], row[5], row[6], row[7]))
-    return parsed_response
+def get_users_page(fields: list = None, limit: int = None, after: str = None, with_total: bool = False):
+    conn = get_auth_db_connection()
+    try:
+        return fetch_page(conn, User, '"user" u', "u", "user_id",
+                          fields=fields, limit=limit, after=after, with_total=with_total)
+    finally:
+        conn.close()
 
 
 def delete_user_by_user_id(user_id: str):
@@ -98,9 +94,14 @@ def delete_user_by_user_id(user_id: str):
                     (user_id,))
 
         deleted_user = cur.fetchone()
+        if deleted_user:
+            bump_table_version(cur, USER_TABLE)
+        # Cached permissions of the linked accounts are outdated
+        notify(cur, SESSION_CHANNEL, "*")
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_account_sessions)
 
         if deleted_user:
             return {"error": None, "message": f"User {user_id} deleted successfully"}, 200
@@ -129,6 +130,7 @@ def update_user_profile_picture_path(user_id: uuid, path: str):
                         path,
                         user_id,
                     ))
+        bump_table_version(cur, USER_TABLE)
         conn.commit()
         cur.close()
         conn.close()
@@ -168,14 +170,10 @@ def get_user_by_user_id(user_id: uuid):
                 WHERE u.user_id = %s
                 ''',
                 (user_id, ))
-    response = cur.fetchone()
+    user = fetch_one(cur, User)
     cur.close()
     conn.close()
-    if response:
-        return User(response[0], response[1], response[2], response[3],
-                    response[4], response[5], response[6], response[7])
-    else:
-        return None
+    return user
 
 
 def update_user(user_id: uuid, first_name: str, last_name: str,
@@ -210,9 +208,13 @@ def update_user(user_id: uuid, first_name: str, last_name: str,
             conn.close()
             return {"error": {"exception": "UserNotFound", "message": "User with user_id not found"}, "message": None}
 
+        bump_table_version(cur, USER_TABLE)
+        # Cached permissions of the linked accounts are outdated
+        notify(cur, SESSION_CHANNEL, "*")
         conn.commit()
         cur.close()
         conn.close()
+        on_commit(invalidate_account_sessions)
         return {"error": None, "message": {"userId": user_id, "status": "User updated successfully"}}
 
     except psycopg2.Error as Err:
@@ -1,17 +1,20 @@
-from ipaddress import ip_address
 from tabnanny import check
 import token
 import uuid
-import bcrypt
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, jwt_required, get_jwt_identity
-import user_agents
-from database_service.account import check_token_id_is_active, create_account, create_account_session, get_all_account_sessions, get_all_accounts, get_pg_version, get_all_accounts_by_username, get_account_by_uuid, invalidate_tokens_by_account_id, invalidate_tokens_by_origin_id, update_account_password, update_link_user_to_account
+from database_service.account import (create_account, get_account_sessions_page, get_accounts_page, get_pg_version,
+                                      get_account_by_uuid, get_session_validity, invalidate_tokens_by_account_id,
+                                      invalidate_tokens_by_origin_id, login_account, update_account_password,
+                                      update_link_user_to_account)
+from database_service.pagination import InvalidPageRequest
 from database_service.sqlstate import map_sqlstate_to_http_status
 import re
-from database_service.user import get_user_by_linked_account_uuid
 from endpoints.jwt_handlers import roles_required
-from models.Account import Account
+from endpoints.pagination import get_page_args, set_page_headers
+from models.Account import Account, AccountSession
+from services.password_hashing import HashingPoolSaturatedError
+from services.user_agent import parse_user_agent
 
 accounts = Blueprint('accounts', __name__)
 
@@ -20,6 +23,12 @@ usernamePattern = r"^[a-z0-9_]+$"
 passwordPattern = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?!.*\s).{8,}$"
 
 
+def hashing_busy_response(e: HashingPoolSaturatedError):
+    return jsonify({"error": {"exception": "ServiceUnavailable",
+                              "message": "Too many password requests, please try again shortly"},
+                    "message": None}), 503, {"Retry-After": str(e.retry_after)}
+
+
 # Register user route
 @accounts.route("/register", methods=['POST'])
 def handle_register():
@@ -49,6 +58,9 @@ def handle_register():
         else:
             return jsonify(response), 201
 
+    except HashingPoolSaturatedError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
@@ -61,6 +73,13 @@ def handle_connection_is_alive():
     return jsonify(get_pg_version()), 200
 
 
+# Client metadata stored with a session: (client_ip, device, browser)
+def get_session_metadata():
+    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+    device, browser = parse_user_agent(request.headers.get("User-Agent", ""))
+    return client_ip, device, browser
+
+
 # Account login route
 @accounts.route("/login", methods=['POST'])
 def handle_login():
@@ -69,11 +88,7 @@ def handle_login():
         data = request.get_json()
 
         # Reuest metadata for sessions
-        ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
-        ua_string = request.headers.get("User-Agent", "")
-        ua = user_agents.parse(ua_string)
-        device = f"{ua.device.family}"
-        browser = f"{ua.browser.family} {ua.browser.version_string}"
+        client_ip, device, browser = get_session_metadata()
 
         # Extract and validate username and password
         username = data.get('username').strip().lower()
@@ -82,35 +97,18 @@ def handle_login():
             return jsonify({"error": {"exception": "MissingValues",
                            "message": "Missing username or password"}, "message": None}), 400
 
-        accounts = get_all_accounts_by_username(username)
-        if accounts:
-            account = accounts[0]
-        else:
-            account = None
-
-        if account and bcrypt.checkpw(password.encode("utf-8"), account.password_hash):
-            origin_id = data.get('originId')
-            if origin_id:
-                # Invalidate all other tokens for this users origin (browser, app, etc.)
-                invalidate_tokens_by_origin_id(account.public_id, origin_id)
-            else:
-                # On first startup issue a new originId
-                origin_id = str(uuid.uuid4())
-
-            token_id = str(uuid.uuid4())
+        # On first startup issue a new originId
+        origin_id = data.get('originId') or str(uuid.uuid4())
+        token_id = str(uuid.uuid4())
 
-            response = create_account_session(token_id, origin_id, account.public_id, ip_address, device, browser)
+        login = login_account(username, password, origin_id, token_id, client_ip, device, browser)
+        if login:
+            account, permissions = login
 
             # Get user permissions if assigned
-            user = get_user_by_linked_account_uuid(account.public_id)
-            if user:
-                additional_claims = {
-                    "permissions": user.permissions
-                }
-            else:
-                additional_claims = {
-                    "permissions": "none"
-                }
+            additional_claims = {
+                "permissions": permissions if permissions else "none"
+            }
 
             access_token = create_access_token(
                 identity=account.public_id, fresh=True, additional_claims=additional_claims)
@@ -124,6 +122,9 @@ def handle_login():
         else:
             return jsonify({"error": None, 'message': 'Login Failed'}), 401
 
+    except HashingPoolSaturatedError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
@@ -164,20 +165,14 @@ def handle_refresh_token():
     try:
         # Extract the user ID from the JWT
         user_id = get_jwt_identity()
-        account = get_account_by_uuid(user_id)
         token_id = get_jwt()["tokenId"]
-        # Get user permissions if assigned
-        user = get_user_by_linked_account_uuid(user_id)
-        if user:
-            additional_claims = {"permissions": user.permissions}
-        else:
-            additional_claims = {"permissions": "none"}
 
-        isValid = check_token_id_is_active(user_id, token_id)
+        # Session state and user permissions, only read from the database on a cache miss
+        isValid, permissions = get_session_validity(user_id, token_id)
         if isValid:
-            # Check if user exists
+            additional_claims = {"permissions": permissions if permissions else "none"}
             access_token = create_access_token(
-                identity=account.public_id, fresh=False, additional_claims=additional_claims)
+                identity=user_id, fresh=False, additional_claims=additional_claims)
             return jsonify({"error": None, 'message': 'Refresh Success', 'access_token': access_token}), 200
         else:
             return jsonify({
@@ -204,10 +199,7 @@ def handle_get_my_account():
 
         # Check if user exists
         if account:
-            return jsonify({"error": None, 'message': {'username': account.username,
-                                                       'timeCreated': account.time_created,
-                                                       'linkedUserId': account.linked_user_id
-                                                       }}), 200
+            return jsonify({"error": None, 'message': account.to_json("username", "timeCreated", "linkedUserId")}), 200
         else:
             return jsonify({"error": None, 'message': 'User not found'}), 404
 
@@ -247,23 +239,24 @@ def handle_link_user(public_id):
 @roles_required("admin")
 def handle_get_all_accounts():
     try:
-        accounts = get_all_accounts()
+        page_args = get_page_args(Account)
+        page = get_accounts_page(**page_args)
 
-        # Check if user list is empty
-        if not accounts:  # Check if list is empty
+        # Check if user list is empty, an empty page after a cursor is not an error
+        if not page.items and not page_args["after"]:
             return jsonify({"error": {"exception": "AccountNotFound",
                            "message": "No accounts were found"}, "message": None}), 404
 
-        # Convert all users to JSON format
-        return jsonify({
+        # Convert all users to JSON format, only with the requested fields
+        fields = page_args["fields"] or ()
+        response = jsonify({
             "error": None,
-            "message": [{
-                'publicId': account.public_id,
-                'username': account.username,
-                'timeCreated': account.time_created,
-                'linkedUserId': account.linked_user_id
-            } for account in accounts]
-        }), 200
+            "message": [account.to_json(*fields) for account in page.items]
+        })
+        return set_page_headers(response, page), 200
+
+    except InvalidPageRequest as e:
+        return jsonify({"error": {"exception": "InvalidPageRequest", "message": str(e)}, "message": None}), 400
 
     except Exception as e:
         # Log the error
@@ -298,6 +291,9 @@ def handle_change_password_by_user():
         else:
             return jsonify(response), 200
 
+    except HashingPoolSaturatedError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
@@ -317,6 +313,9 @@ def handle_change_password_by_admin(public_id):
         else:
             return jsonify(response), 200
 
+    except HashingPoolSaturatedError as e:
+        return hashing_busy_response(e)
+
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
@@ -372,32 +371,28 @@ def handle_terminate_all_account_sessions_by_admin(public_id):
 @roles_required("admin")
 def handle_get_all_account_sessions():
     try:
-        sessions = get_all_account_sessions()
-
-        # Check if user list is empty
-        if not sessions:  # Check if list is empty
-            return jsonify({"error": None, "message": {}}), 200
+        # The account id is always selected, the sessions are grouped by it
+        page_args = get_page_args(AccountSession, required_fields=("accountId",))
+        page = get_account_sessions_page(**page_args)
+        fields = [field for field in page_args["fields"] or AccountSession.columns if field != "accountId"]
 
         # Group sessions by accountId
         grouped_sessions = {}
-        for session in sessions:
+        for session in page.items:
             account_id = session.account_id
             if account_id not in grouped_sessions:
                 grouped_sessions[account_id] = []
-            grouped_sessions[account_id].append({
-                'tokenId': session.token_id,
-                'ipAddress': session.ip_address,
-                'device': session.device,
-                'browser': session.browser,
-                'originId': session.origin_id,
-                'timeCreated': session.time_created
-            })
+            grouped_sessions[account_id].append(session.to_json(*fields))
 
         # Convert grouped sessions to JSON format
-        return jsonify({
+        response = jsonify({
             "error": None,
             "message": grouped_sessions
-        }), 200
+        })
+        return set_page_headers(response, page), 200
+
+    except InvalidPageRequest as e:
+        return jsonify({"error": {"exception": "InvalidPageRequest", "message": str(e)}, "message": None}), 400
 
     except Exception as e:
         # Log the error
@@ -0,0 +1,61 @@
+from functools import wraps
+from flask import make_response, request
+from database_service.table_version import get_table_version
+
+
+# Find the tag of the client that matches the current version. Compressed representations
+# carry the encoding as suffix (e.g. "user.5:gzip"), they are based on the same data.
+def _matching_etag(etags, etag):
+    if etags.star_tag:
+        return etag
+    for tag in etags.as_set(include_weak=True):
+        if tag == etag or tag.startswith(f"{etag}:"):
+            return tag
+    return None
+
+
+# Answer conditional GET requests with 304 Not Modified based on the versions of the given tables.
+# request_variant() returns the part of the ETag that depends on the caller (e.g. the user), the response then
+# varies by Authorization. None answers the request without ETag.
+def conditional(*table_names, request_variant=None):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            variant = request_variant() if request_variant else ""
+            if variant is None:
+                return fn(*args, **kwargs)
+            # Read the versions before the data, a concurrent write can only make the ETag too old
+            versions = [get_table_version(table_name) for table_name in table_names]
+            etag = "-".join(f"{table_name}.{version}" for table_name, (version, _) in zip(table_names, versions))
+            if variant:
+                etag = f"{etag}-{variant}"
+            modified = [time_modified for _, time_modified in versions if time_modified is not None]
+            last_modified = max(modified).replace(microsecond=0) if modified else None
+
+            if request.if_none_match:
+                matching_etag = _matching_etag(request.if_none_match, etag)
+            elif last_modified and request.if_modified_since and last_modified <= request.if_modified_since:
+                matching_etag = etag
+            else:
+                matching_etag = None
+
+            if matching_etag:
+                response = make_response("", 304)
+                response.set_etag(matching_etag)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                encoding = response.headers.get("Content-Encoding")
+                response.set_etag(f"{etag}:{encoding}" if encoding else etag)
+
+            if last_modified:
+                response.last_modified = last_modified
+            if request_variant:
+                response.vary.add("Authorization")
+            # Clients may keep the response but have to revalidate it
+            response.cache_control.no_cache = True
+            response.cache_control.private = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+import decimal
+import orjson
+from datetime import date, datetime, timezone
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+# Same output as Flask's provider: sorted keys, dates in HTTP format and Decimals as strings
+_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _http_date(o):
+    # Same result as werkzeug's http_date, which goes through the slower email.utils
+    if not isinstance(o, datetime):
+        return http_date(o)
+    if o.tzinfo is not None:
+        o = o.astimezone(timezone.utc)
+    return (f"{_DAYS[o.weekday()]}, {o.day:02d} {_MONTHS[o.month - 1]} {o.year:04d} "
+            f"{o.hour:02d}:{o.minute:02d}:{o.second:02d} GMT")
+
+
+def _default(o):
+    if isinstance(o, date):
+        return _http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    # UUIDs and dataclasses are serialized by orjson itself, anything else like Flask does
+    return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def _dumps_bytes(self, obj):
+        # Readable output in debug mode, like Flask's provider
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS | orjson.OPT_INDENT_2)
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Custom encoder arguments are only supported by the json module
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._dumps_bytes(obj).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bit
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            data = self._dumps_bytes(obj) + b"\n"
+        except orjson.JSONEncodeError:
+            data = f"{super().dumps(obj)}\n"
+        return self._app.response_class(data, mimetype=self.mimetype)
@@ -0,0 +1,131 @@
+# Prometheus metrics of the HTTP requests. The hooks are registered in app.py, GET /metrics exposes them.
+# With gunicorn, PROMETHEUS_MULTIPROC_DIR has to point to an empty folder so all workers report together.
+import hmac
+import os
+import time
+from flask import Blueprint, Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from database_service.query_stats import get_query_stats, start_query_stats, stop_query_stats
+from services import background_removal, password_hashing
+
+metrics = Blueprint('metrics', __name__)
+
+LABELS = ["blueprint", "route", "method"]
+
+REQUESTS = Counter("http_requests_total", "HTTP requests", LABELS + ["status"])
+LATENCY = Histogram("http_request_duration_seconds", "Time until the response is returned", LABELS,
+                    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests currently handled", LABELS, multiprocess_mode="livesum")
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Size of the sent response body", LABELS,
+                          buckets=(100, 1000, 10_000, 100_000, 1_000_000, 10_000_000))
+DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in database statements per request", LABELS,
+                       buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+DB_QUERIES = Histogram("http_request_db_queries", "Database statements per request", LABELS,
+                       buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+DB_CONNECTIONS = Histogram("http_request_db_connections", "Connections taken from the pools per request", LABELS,
+                           buckets=(0, 1, 2, 3, 5, 10))
+DB_CONNECTS = Counter("http_request_db_connects_total", "Connections newly opened to the database by requests", LABELS)
+
+
+class PoolCollector:
+    # Stats of a worker pool, read on every scrape: job counters and *_total sums as counters, the rest as gauges.
+    # Labelled by process, every gunicorn worker has its own password hashing pool.
+    def __init__(self, prefix: str, description: str, get_stats):
+        self.prefix = prefix
+        self.description = description
+        self.get_stats = get_stats
+
+    def collect(self):
+        try:
+            stats = self.get_stats()
+        except (OSError, EOFError):
+            # The background removal server is not reachable, the other metrics are still reported
+            return
+        pid = str(os.getpid())
+        for key, value in stats.items():
+            if key in ("completed", "failed", "rejected"):
+                family = CounterMetricFamily(f"{self.prefix}_jobs_{key}", f"{self.description} jobs {key}",
+                                             labels=["pid"])
+            elif key.endswith("_total"):
+                family = CounterMetricFamily(f"{self.prefix}_{key[:-len('_total')]}", f"{self.description} {key}",
+                                             labels=["pid"])
+            else:
+                family = GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.description} {key}", labels=["pid"])
+            family.add_metric([pid], value)
+            yield family
+
+
+POOL_COLLECTORS = [PoolCollector("password_hashing", "Password hashing", password_hashing.get_stats),
+                   PoolCollector("background_removal", "Background removal", background_removal.get_stats)]
+for collector in POOL_COLLECTORS:
+    REGISTRY.register(collector)
+
+
+def _labels():
+    # The rule instead of the path, so /user/<user_id> is one route and not one per user
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    return request.blueprint or "app", rule, request.method
+
+
+def start_request_metrics():
+    g.metrics_labels = _labels()
+    g.metrics_started = time.perf_counter()
+    g.metrics_query_stats = start_query_stats(f"{request.method} {g.metrics_labels[1]}")
+    IN_PROGRESS.labels(*g.metrics_labels).inc()
+
+
+def _record(labels, status: int, size: int = None):
+    REQUESTS.labels(*labels, str(status)).inc()
+    LATENCY.labels(*labels).observe(time.perf_counter() - g.metrics_started)
+    if size is not None:
+        RESPONSE_SIZE.labels(*labels).observe(size)
+
+    stats = get_query_stats()
+    if stats is not None:
+        DB_SECONDS.labels(*labels).observe(stats.seconds)
+        DB_QUERIES.labels(*labels).observe(stats.queries)
+        DB_CONNECTIONS.labels(*labels).observe(stats.checkouts)
+        if stats.connects:
+            DB_CONNECTS.labels(*labels).inc(stats.connects)
+
+
+def record_request_metrics(response):
+    if "metrics_labels" in g:
+        # Streamed responses (e.g. files) only have a size if it was set upfront
+        _record(g.metrics_labels, response.status_code, response.content_length)
+        g.metrics_recorded = True
+    return response
+
+
+def finish_request_metrics(exception=None):
+    if "metrics_labels" not in g:
+        return
+    if not g.get("metrics_recorded"):
+        # An exception skipped the after_request hooks
+        _record(g.metrics_labels, 500)
+    IN_PROGRESS.labels(*g.metrics_labels).dec()
+    stop_query_stats(g.metrics_query_stats)
+
+
+def _get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    # Sum up the files written by all workers
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in POOL_COLLECTORS:
+        registry.register(collector)
+    return registry
+
+
+@metrics.route("/metrics", methods=["GET"])
+def handle_get_metrics():
+    # Scrapers authenticate with a static token instead of a JWT, if one is configured
+    token = os.environ.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"),
+                                         f"Bearer {token}".encode("utf-8")):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(generate_latest(_get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -1,7 +1,12 @@
+import os
 from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required
 from endpoints.jwt_handlers import roles_required
-from rembg import remove
+from services.background_removal import BackgroundRemovalBusyError
+from services.background_removal import get_stats as get_background_removal_stats
+from services.background_removal_jobs import get_job_status, get_result_path, remove_background_cached, submit_job
+from services.cache import get_all_cache_stats
+from services.password_hashing import get_stats as get_password_hashing_stats
 from io import BytesIO
 
 misc = Blueprint('misc', __name__)
@@ -15,33 +20,121 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# Read the uploaded image, returns (bytes, None) or (None, error response)
+def read_uploaded_image():
+    if "file" not in request.files:
+        return None, (jsonify({"error": {"exception": "NoFileError", "message": "No file in request"},
+                              "message": None}), 400)
+
+    file = request.files["file"]
+
+    if file.filename == "":
+        return None, (jsonify({"error": {"exception": "NoFileError", "message": "No file selected"},
+                              "message": None}), 400)
+
+    if not allowed_file(file.filename):
+        return None, (jsonify({"error": {"exception": "InvalidFileType",
+                                         "message": "Filetype not allowed. Please use .jpg, .png or .webp"},
+                                "message": None}), 400)
+
+    return file.read(), None
+
+
+def busy_response(e: BackgroundRemovalBusyError):
+    return jsonify({"error": {"exception": "ServiceUnavailable",
+                              "message": "Background removal is busy, please try again later"},
+                    "message": None}), 503, {"Retry-After": str(e.retry_after)}
+
+
 @misc.route("/remove-background/", methods=["POST"])
 @jwt_required()
 @roles_required("admin")
 def handle_remove_picture_background():
     try:
-        if "file" not in request.files:
-            return jsonify({"error": {"exception": "NoFileError", "message": "No file in request"}, "message": None}), 400
-
-        file = request.files["file"]
-
-        if file.filename == "":
-            return jsonify({"error": {"exception": "NoFileError", "message": "No file selected"}, "message": None}), 400
-
-        if not allowed_file(file.filename):
-            return jsonify({"error": {"exception": "InvalidFileType",
-                                      "message": "Filetype not allowed. Please use .jpg, .png or .webp"}, "message": None}), 400
+        input_bytes, error_response = read_uploaded_image()
+        if error_response:
+            return error_response
 
-        # Remove the background
-        input_bytes = file.read()
-        output_bytes = remove(input_bytes)
+        # Remove the background on the worker pool, identical images come from the cache
+        output_bytes = remove_background_cached(input_bytes)
 
         # Return the result as a PNG image
         output_io = BytesIO(output_bytes)
         output_io.seek(0)
         return send_file(output_io, mimetype="image/png")
 
+    except BackgroundRemovalBusyError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+# Submit a background removal job, poll GET /misc/remove-background/<job_id> for the result
+@misc.route("/remove-background/jobs", methods=["POST"])
+@jwt_required()
+@roles_required("admin")
+def handle_submit_remove_picture_background_job():
+    try:
+        input_bytes, error_response = read_uploaded_image()
+        if error_response:
+            return error_response
+
+        job_id, status = submit_job(input_bytes)
+        return jsonify({"error": None, "message": {"jobId": job_id, "status": status}}), \
+            200 if status == "done" else 202, {"Location": f"/misc/remove-background/{job_id}"}
+
+    except BackgroundRemovalBusyError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+@misc.route("/remove-background/<job_id>", methods=["GET"])
+@jwt_required()
+@roles_required("admin")
+def handle_get_remove_picture_background_job(job_id):
+    try:
+        status, detail = get_job_status(job_id)
+
+        if status == "done":
+            result_path = get_result_path(job_id)
+            if result_path:
+                return send_file(os.path.abspath(result_path), mimetype="image/png", max_age=60 * 60 * 24)
+        elif status == "pending":
+            return jsonify({"error": None, "message": {"jobId": job_id, "status": status}}), \
+                202, {"Retry-After": "1"}
+        elif status == "failed":
+            return jsonify({"error": {"exception": "BackgroundRemovalFailed", "message": detail},
+                            "message": {"jobId": job_id, "status": status}}), 500
+
+        return jsonify({"error": {"exception": "JobNotFound", "message": "Job not found"}, "message": None}), 404
+
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
         return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"}, "message": None}), 500
+
+
+# Hit and miss counters of the in-memory caches of this worker and the stats of the worker pools
+@misc.route("/stats", methods=["GET"])
+@jwt_required()
+@roles_required("admin")
+def handle_get_stats():
+    try:
+        return jsonify({"error": None, "message": {"caches": get_all_cache_stats(),
+                                                   "passwordHashing": get_password_hashing_stats(),
+                                                   "backgroundRemoval": get_background_removal_stats()}}), 200
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
@@ -0,0 +1,26 @@
+import os
+from flask import request
+from database_service.pagination import parse_fields, parse_limit
+
+# Upper bound of ?limit=, without a limit the whole list is returned as before
+MAX_PAGE_LIMIT = int(os.environ.get("MAX_PAGE_LIMIT", 1000))
+
+
+# Read ?fields=, ?limit=, ?after= and ?count=true of the list endpoints, raises InvalidPageRequest
+def get_page_args(model, required_fields=()):
+    fields = parse_fields(request.args.get("fields"), model)
+    if fields:
+        fields = list(dict.fromkeys([*fields, *required_fields]))
+    return {"fields": fields,
+            "limit": parse_limit(request.args.get("limit"), MAX_PAGE_LIMIT),
+            "after": request.args.get("after") or None,
+            "with_total": request.args.get("count", "false").lower() == "true"}
+
+
+# The body keeps its shape, the cursor of the next page and the total count are sent as headers
+def set_page_headers(response, page):
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
+    return response
@@ -1,16 +1,38 @@
+import io
 import os
+import uuid
 from pathlib import Path
-from flask import Blueprint, request, jsonify, send_file
-from flask_jwt_extended import jwt_required
-from database_service.product import create_beverage, create_category, delete_product_by_product_id, get_all_beverages, get_all_product_categories, get_product_by_product_id, get_product_picture_path_by_product_id, update_beverage, update_product_picture_path
+from flask import Blueprint, Response, g, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from database_service.product import (PRICING_KEY_MAPPING, create_beverage, create_category,
+                                      delete_product_by_product_id, get_all_beverages, get_all_product_categories,
+                                      get_beverage_catalog_json, get_effective_price_ranking, get_event_mode,
+                                      get_price_matrix, get_price_ranking_markup, get_product_by_product_id,
+                                      get_product_picture_path_by_product_id, set_event_mode, update_beverage,
+                                      update_product_picture_path)
+from database_service.product_copy import BeverageExport, ImportFormatError, import_beverages, parse_csv, parse_jsonl
 from database_service.sqlstate import map_sqlstate_to_http_status
 import re
 from models.Product import ProductCategory
+from database_service.notifications import subscribe
+from database_service.table_version import EVENT_MODE_TABLE, PRODUCT_CATEGORY_TABLE, PRODUCT_TABLE
+from database_service.user import get_user_by_linked_account_uuid, get_user_by_user_id
+from endpoints.http_cache import conditional
 from endpoints.jwt_handlers import roles_required
+from services.catalog_cache import CATALOG_CHANNEL, get_cached_response, invalidate_catalog, render_raw_json
 from PIL import Image, ImageChops
 
 products = Blueprint('products', __name__)
 
+EVENT_MODE_MAPPING = {pricing_type: key for key, pricing_type in PRICING_KEY_MAPPING.items()}
+
+# Content types of POST /product/import, ?format= overrides them
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl"
+}
+
 
 # Create Product Category
 @products.route("/category", methods=['POST'])
@@ -45,6 +67,7 @@ def handle_create_category():
 @products.route("/category", methods=['GET'])
 @jwt_required()
 @roles_required("admin", "user")
+@conditional(PRODUCT_CATEGORY_TABLE)
 def handle_get_all_categories():
     try:
         categories = get_all_product_categories()
@@ -57,9 +80,7 @@ def handle_get_all_categories():
         # Convert all category to JSON format
         return jsonify({
             "error": None,
-            "message": [{"id": category.category_id,
-                         "name": category.category_name
-                         } for category in categories]
+            "message": [category.to_json() for category in categories]
         }), 200
 
     except Exception as e:
@@ -127,39 +148,15 @@ def handle_create_beverage():
 @products.route("/beverage", methods=['GET'])
 @jwt_required()
 @roles_required("admin", "user")
+@conditional(PRODUCT_TABLE, request_variant=lambda: get_price_list_variant())
 def handle_get_all_beverages():
     try:
-        beverages = get_all_beverages()
-
-        # Check if beverage list is empty
-        if not beverages:  # Check if list is empty
-            return jsonify({"error": {"exception": "BeveragesNotFound",
-                           "message": "No beverages were found"}, "message": None}), 404
-
-        # Group beverages by category_id
-        grouped_beverages = {}
-        for bev in beverages:
-            if bev.category_id not in grouped_beverages:
-                grouped_beverages[bev.category_id] = {
-                    "categoryId": bev.category_id,
-                    "beverages": []
-                }
-
-            grouped_beverages[bev.category_id]["beverages"].append({
-                "id": bev.product_id,
-                "productName": bev.product_name,
-                "beverageSize": bev.beverage_size,
-                "pricing": bev.pricing
-            })
-
-        # Convert dict to list for JSON response
-        grouped_beverages_list = list(grouped_beverages.values())
-
-        # Convert to JSON response
-        return jsonify({
-            "error": None,
-            "message": grouped_beverages_list
-        }), 200
+        if is_price_list_request():
+            return get_beverage_price_list()
+
+        # Only rebuilt after the catalog changed
+        catalog = get_cached_response("beverage", build_beverage_catalog)
+        return catalog.to_response(request.accept_encodings)
 
     except Exception as e:
         # Log the error
@@ -167,6 +164,216 @@ def handle_get_all_beverages():
         return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"}, "message": None}), 500
 
 
+# Get all Beverages with only the price of the active event mode
+@products.route("/beverage/current", methods=['GET'])
+@jwt_required()
+@roles_required("admin", "user")
+@conditional(PRODUCT_TABLE, EVENT_MODE_TABLE)
+def handle_get_current_beverages():
+    try:
+        # Polled by every tablet, answered from the cache until the catalog or the mode changes
+        pricing_type = get_event_mode()
+        catalog = get_cached_response(("beverageCurrent", pricing_type),
+                                      lambda: build_current_beverage_catalog(pricing_type))
+        return catalog.to_response(request.accept_encodings)
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+# Get the active event mode
+@products.route("/event-mode", methods=['GET'])
+@jwt_required()
+@roles_required("admin", "user")
+@conditional(EVENT_MODE_TABLE)
+def handle_get_event_mode():
+    try:
+        return jsonify({"error": None, "message": {"eventMode": EVENT_MODE_MAPPING[get_event_mode()]}}), 200
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+# Switch the active event mode for all workers
+@products.route("/event-mode", methods=['PUT'])
+@jwt_required()
+@roles_required("admin")
+def handle_set_event_mode():
+    try:
+        data = request.get_json()
+        event_mode = data.get('eventMode')
+
+        if event_mode not in PRICING_KEY_MAPPING:
+            return jsonify({"error": {"exception": "InvalidEventMode",
+                                      "message": "eventMode must be 'normal', 'party' or 'bigEvent'"},
+                            "message": None}), 400
+
+        response = set_event_mode(PRICING_KEY_MAPPING[event_mode])
+        if response["error"]:
+            return jsonify(response), map_sqlstate_to_http_status(response["error"]["pgCode"])
+        else:
+            return jsonify({"error": None, "message": {**response["message"], "eventMode": event_mode}}), 200
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+def is_price_list_request():
+    # ?forUser=<user_id>&event=<pricingType> returns the effective prices instead of the grouped catalog
+    return "forUser" in request.args or "event" in request.args
+
+
+def get_price_list_variant():
+    # The price list depends on the user, the resolved price ranking and its markup, so does its ETag
+    if not is_price_list_request():
+        return ""
+    error, price_list = resolve_price_list()
+    if error:
+        return None
+    pricing_type, user, price_ranking, markup = price_list
+    return f"{pricing_type}.{user.user_id}.{price_ranking}.{markup}"
+
+
+def resolve_price_list():
+    # Returns (error response, None) or (None, (pricing_type, user, price_ranking, markup)),
+    # resolved once per request for the ETag and the response
+    if "price_list" not in g:
+        g.price_list = _resolve_price_list()
+    return g.price_list
+
+
+def _resolve_price_list():
+    event = request.args.get("event", "normal")
+    if event not in PRICING_KEY_MAPPING:
+        return (jsonify({"error": {"exception": "InvalidPricingType",
+                                   "message": "event must be 'normal', 'party' or 'bigEvent'"},
+                         "message": None}), 400), None
+
+    user_id = request.args.get("forUser")
+    if user_id:
+        try:
+            uuid.UUID(user_id)
+        except ValueError:
+            return (jsonify({"error": {"exception": "InvalidUserId", "message": "forUser must be a UUID"},
+                             "message": None}), 400), None
+
+    if get_jwt().get("permissions") == "admin" and user_id:
+        user = get_user_by_user_id(user_id)
+    else:
+        # Prices of the own user, other users only for admins
+        user = get_user_by_linked_account_uuid(get_jwt_identity())
+        if user and user_id and uuid.UUID(user_id) != uuid.UUID(str(user.user_id)):
+            return (jsonify({"error": {"exception": "InsufficientPermissions",
+                                       "message": "You do not have the required permissions for this"}}), 403), None
+    if not user:
+        return (jsonify({"error": {"exception": "UserNotFound", "message": "User not found"},
+                         "message": None}), 404), None
+
+    price_ranking = get_effective_price_ranking(user.price_ranking)
+    return None, (PRICING_KEY_MAPPING[event], user, price_ranking, get_price_ranking_markup()[price_ranking])
+
+
+def get_beverage_price_list():
+    error, price_list = resolve_price_list()
+    if error:
+        return error
+    pricing_type, _, price_ranking, markup = price_list
+    # One pre-serialized list per pricing_type and price_ranking, shared by all users of that ranking
+    price_list = get_cached_response(("beveragePrices", pricing_type, price_ranking, markup),
+                                     lambda: build_beverage_price_list(pricing_type, price_ranking))
+    return price_list.to_response(request.accept_encodings)
+
+
+def build_beverage_price_list(pricing_type: str, price_ranking: str):
+    prices = get_price_matrix().get_prices(pricing_type, price_ranking)
+    if not prices:
+        return {"error": {"exception": "BeveragesNotFound",
+                "message": "No beverages were found"}, "message": None}, 404
+    return {"error": None, "message": [price.to_json() for price in prices]}, 200
+
+
+def build_beverage_catalog():
+    # Make sure catalog changes of other workers reach the cache
+    subscribe(CATALOG_CHANNEL, invalidate_catalog)
+
+    # "python" groups the rows of get_all_beverages, "json" has PostgreSQL build the whole document
+    if os.environ.get("BEVERAGE_CATALOG_ENGINE", "python") == "json":
+        catalog = get_beverage_catalog_json()
+        if catalog is None:
+            return {"error": {"exception": "BeveragesNotFound",
+                    "message": "No beverages were found"}, "message": None}, 404
+        return render_raw_json(catalog)
+
+    beverages = get_all_beverages()
+
+    # Check if beverage list is empty
+    if not beverages:  # Check if list is empty
+        return {"error": {"exception": "BeveragesNotFound",
+                "message": "No beverages were found"}, "message": None}, 404
+
+    # Group beverages by category_id
+    grouped_beverages = {}
+    for bev in beverages:
+        if bev.category_id not in grouped_beverages:
+            grouped_beverages[bev.category_id] = {
+                "categoryId": bev.category_id,
+                "beverages": []
+            }
+
+        grouped_beverages[bev.category_id]["beverages"].append(
+            bev.to_json("id", "productName", "beverageSize", "pricing"))
+
+    # Convert dict to list for JSON response
+    grouped_beverages_list = list(grouped_beverages.values())
+
+    return {
+        "error": None,
+        "message": grouped_beverages_list
+    }, 200
+
+
+def build_current_beverage_catalog(pricing_type: str):
+    # Make sure catalog changes of other workers reach the cache
+    subscribe(CATALOG_CHANNEL, invalidate_catalog)
+
+    event_mode = EVENT_MODE_MAPPING[pricing_type]
+    beverages = [bev for bev in get_all_beverages() if event_mode in bev.pricing]
+
+    # Check if beverage list is empty
+    if not beverages:
+        return {"error": {"exception": "BeveragesNotFound",
+                "message": "No beverages were found"}, "message": None}, 404
+
+    # Group beverages by category_id, with the active price only
+    grouped_beverages = {}
+    for bev in beverages:
+        if bev.category_id not in grouped_beverages:
+            grouped_beverages[bev.category_id] = {
+                "categoryId": bev.category_id,
+                "beverages": []
+            }
+
+        grouped_beverages[bev.category_id]["beverages"].append(
+            {**bev.to_json("id", "productName", "beverageSize"), "price": bev.pricing[event_mode]})
+
+    return {
+        "error": None,
+        "message": {
+            "eventMode": event_mode,
+            "categories": list(grouped_beverages.values())
+        }
+    }, 200
+
+
 # User profile picture
 ALLOWED_EXTENSIONS = {"png"}
 
@@ -347,3 +554,65 @@ def handle_delete_product(product_id):
         # Log the error
         print(f"Unexpected error: {e}")
         return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"}, "message": None}), 500
+
+
+# Bulk import beverages from CSV or JSON lines
+@products.route("/import", methods=['POST'])
+@jwt_required()
+@roles_required("admin")
+def handle_import_beverages():
+    try:
+        import_format = request.args.get("format") or IMPORT_FORMATS.get(request.mimetype)
+        if import_format not in ("csv", "jsonl"):
+            return jsonify({"error": {"exception": "UnsupportedFormat",
+                                      "message": ("Send text/csv or application/x-ndjson, "
+                                                  "or set format to csv or jsonl")},
+                            "message": None}), 400
+
+        # Decoded while COPY reads it, the body is never held in memory as a whole
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+        try:
+            rows = parse_csv(stream) if import_format == "csv" else parse_jsonl(stream)
+        except ImportFormatError as e:
+            return jsonify({"error": {"exception": "InvalidImport", "message": str(e)}, "message": None}), 400
+
+        response = import_beverages(rows)
+        if response["error"]:
+            return jsonify(response), map_sqlstate_to_http_status(response["error"]["pgCode"])
+        else:
+            return jsonify(response), 200
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+# Export all beverages as CSV, in the format of the import
+@products.route("/export", methods=['GET'])
+@jwt_required()
+@roles_required("admin")
+def handle_export_beverages():
+    try:
+        chunks = iter(BeverageExport())
+        # Wait for the header, so an export failing right away is still answered with an error
+        first_chunk = next(chunks, b"")
+
+        def stream():
+            # Closed by the server when the client goes away, which stops the COPY
+            try:
+                yield first_chunk
+                yield from chunks
+            finally:
+                chunks.close()
+
+        response = Response(stream(), mimetype="text/csv")
+        response.headers["Content-Disposition"] = "attachment; filename=beverages.csv"
+        return response
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
@@ -0,0 +1,107 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from database_service.product import PRICING_KEY_MAPPING, get_event_mode
+from database_service.transaction import book_tab_transaction, get_tab_transaction_by_transaction_id
+from endpoints.jwt_handlers import roles_required
+
+transactions = Blueprint('transactions', __name__)
+
+# Upper limit of positions per booking
+MAX_POSITIONS = 100
+
+
+# Book an order onto a users tab
+@transactions.route("/", methods=['POST'])
+@jwt_required()
+@roles_required("admin", "user")
+def handle_book_transaction():
+    try:
+        # Extract the account ID from the JWT
+        account_id = get_jwt_identity()
+
+        # Parse JSON data
+        data = request.get_json()
+
+        user_id = data.get('userId')
+        pricing_type = data.get('pricingType')
+        positions = data.get('positions')
+
+        if any(val is None for val in [user_id, positions]):
+            return jsonify({"error": {"exception": "MissingValues",
+                                      "message": "Required values: userId, positions"}, "message": None}), 400
+
+        if pricing_type is not None and pricing_type not in PRICING_KEY_MAPPING:
+            return jsonify({"error": {"exception": "InvalidPricingType",
+                                      "message": "pricingType must be 'normal', 'party' or 'bigEvent'"},
+                            "message": None}), 400
+
+        # Bookings use the prices of the active event mode, only admins may book with other prices
+        event_mode = get_event_mode()
+        if pricing_type is None:
+            pricing_type = event_mode
+        elif PRICING_KEY_MAPPING[pricing_type] == event_mode or get_jwt().get("permissions") == "admin":
+            pricing_type = PRICING_KEY_MAPPING[pricing_type]
+        else:
+            return jsonify({"error": {"exception": "InsufficientPermissions",
+                                      "message": "Only admins may book with a pricingType other than the event mode"},
+                            "message": None}), 403
+
+        # Ensure positions is a non-empty list of products with quantities
+        if not isinstance(positions, list) or not 0 < len(positions) <= MAX_POSITIONS:
+            return jsonify({"error": {"exception": "InvalidPositions",
+                                      "message": f"positions must be a list of 1 to {MAX_POSITIONS} entries"},
+                            "message": None}), 400
+
+        parsed_positions = []
+        for position in positions:
+            product_id = position.get('productId') if isinstance(position, dict) else None
+            quantity = position.get('quantity', 1) if isinstance(position, dict) else None
+            # JSON true and false are no numbers here
+            valid = all(isinstance(value, int) and not isinstance(value, bool) for value in (product_id, quantity))
+            if not valid or quantity < 1:
+                return jsonify({"error": {"exception": "InvalidPositions",
+                                          "message": "Every position needs a productId and a quantity of at least 1"},
+                                "message": None}), 400
+            parsed_positions.append((product_id, quantity))
+
+        # Book all positions in one transaction
+        response, status = book_tab_transaction(account_id, user_id, pricing_type, parsed_positions)
+        return jsonify(response), status
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+# Get all positions of a transaction
+@transactions.route("/<int:transaction_id>", methods=['GET'])
+@jwt_required()
+@roles_required("admin")
+def handle_get_transaction(transaction_id):
+    try:
+        positions = get_tab_transaction_by_transaction_id(transaction_id)
+
+        # Check if transaction exists
+        if not positions:
+            return jsonify({"error": {"exception": "TransactionNotFound",
+                           "message": "Transaction not found"}, "message": None}), 404
+
+        return jsonify({
+            "error": None,
+            "message": {
+                "transactionId": transaction_id,
+                "timeCreated": positions[0].time_created,
+                "userId": positions[0].user_affected,
+                "userCreated": positions[0].user_created,
+                "total": float(sum(position.balance for position in positions)),
+                "positions": [position.to_json() for position in positions]
+            }
+        }), 200
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
@@ -0,0 +1,35 @@
+# Every request is one unit of work: the data services share one connection and transaction, committed once
+# after the view returned. A request switching between the public and the auth role commits the work of the
+# previous role first, so it is only atomic per role. The hooks are registered in app.py.
+import psycopg2
+from flask import g, jsonify
+from database_service.connection import (UnitOfWorkFailedError, finish_unit_of_work, is_unit_of_work_failed,
+                                         start_unit_of_work)
+
+
+def start_request_unit_of_work():
+    g.unit_of_work = start_unit_of_work()
+
+
+def commit_request_unit_of_work(response):
+    # Committed before the response is sent, so a failed commit is not reported as success.
+    # Server errors roll back whatever the view wrote before failing. A client error may come from a data
+    # service that rolled back the unit, then there is nothing left to commit.
+    if "unit_of_work" not in g:
+        return response
+    token = g.pop("unit_of_work")
+    commit = response.status_code < 400 or (response.status_code < 500 and not is_unit_of_work_failed())
+    try:
+        finish_unit_of_work(token, commit=commit)
+    except (psycopg2.Error, UnitOfWorkFailedError) as e:
+        print(f"Unexpected error: {e}")
+        response = jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                           "message": None})
+        response.status_code = 500
+    return response
+
+
+def end_request_unit_of_work(exception=None):
+    if "unit_of_work" in g:
+        # An exception skipped the after_request hooks
+        finish_unit_of_work(g.pop("unit_of_work"), commit=False)
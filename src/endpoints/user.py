@@ -3,10 +3,17 @@ from pathlib import Path
 import profile
 from PIL import Image
 from flask import Blueprint, jsonify, request, send_file
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from database_service.balance import get_all_user_balances, get_user_balance
+from database_service.pagination import InvalidPageRequest
 from database_service.sqlstate import map_sqlstate_to_http_status
-from database_service.user import create_user, delete_user_by_user_id, get_all_users, get_profile_picture_path_by_user_id, get_user_by_linked_account_uuid, get_user_by_user_id, update_user, update_user_profile_picture_path
+from database_service.user import (create_user, delete_user_by_user_id, get_profile_picture_path_by_user_id,
+                                   get_user_by_linked_account_uuid, get_user_by_user_id, get_users_page, update_user,
+                                   update_user_profile_picture_path)
+from database_service.table_version import USER_TABLE
+from endpoints.http_cache import conditional
 from endpoints.jwt_handlers import roles_required
+from endpoints.pagination import get_page_args, set_page_headers
 from models.User import User
 from werkzeug.utils import secure_filename
 
@@ -25,14 +32,7 @@ def handle_get_my_user():
 
         # Check if user exists
         if user:
-            return jsonify({"error": None, 'message': {"userId": user.user_id,
-                                                       "firstName": user.first_name,
-                                                       "lastName": user.last_name,
-                                                       "isTemporary": user.is_temporary,
-                                                       "priceRanking": user.price_ranking,
-                                                       "permissions": user.permissions,
-                                                       "hasProfilePicture": user.has_profile_picture
-                                                       }}), 200
+            return jsonify({"error": None, 'message': user.to_json()}), 200
         else:
             return jsonify({"error": {"exception": "UserNotFound",
                            "message": "User not found or not assigned"}, 'message': None}), 404
@@ -83,32 +83,80 @@ def handle_create_user():
 @users.route("/", methods=['GET'])
 @jwt_required()
 @roles_required("admin", "user")
+@conditional(USER_TABLE)
 def handle_get_all_users():
     try:
-        users = get_all_users()
+        page_args = get_page_args(User)
+        page = get_users_page(**page_args)
 
-        # Check if user list is empty
-        if not users:  # Check if list is empty
+        # Check if user list is empty, an empty page after a cursor is not an error
+        if not page.items and not page_args["after"]:
             return jsonify({"error": {"exception": "UserNotFound",
                            "message": "No users were found"}, "message": None}), 404
 
-        # Convert all users to JSON format
+        # Convert all users to JSON format, only with the requested fields
+        fields = page_args["fields"] or ()
+        response = jsonify({
+            "error": None,
+            "message": [user.to_json(*fields) for user in page.items]
+        })
+        return set_page_headers(response, page), 200
+
+    except InvalidPageRequest as e:
+        return jsonify({"error": {"exception": "InvalidPageRequest", "message": str(e)}, "message": None}), 400
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"}, "message": None}), 500
+
+
+# Current balances of all users for the admin overview
+@users.route("/balances", methods=['GET'])
+@jwt_required()
+@roles_required("admin")
+def handle_get_all_user_balances():
+    try:
+        balances = get_all_user_balances()
+
         return jsonify({
             "error": None,
-            "message": [{"userId": user.user_id,
-                         "firstName": user.first_name,
-                         "lastName": user.last_name,
-                         "isTemporary": user.is_temporary,
-                         "priceRanking": user.price_ranking,
-                         "permissions": user.permissions,
-                         "hasProfilePicture": user.has_profile_picture
-                         } for user in users]
+            "message": [balance.to_json() for balance in balances]
         }), 200
 
     except Exception as e:
         # Log the error
         print(f"Unexpected error: {e}")
-        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"}, "message": None}), 500
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
+
+
+@users.route("/<user_id>/balance", methods=['GET'])
+@jwt_required()
+@roles_required("admin", "user")
+def handle_get_user_balance(user_id):
+    try:
+        # Balance of the own user, other users only for admins
+        if get_jwt().get("permissions") != "admin":
+            user = get_user_by_linked_account_uuid(get_jwt_identity())
+            if not user or str(user.user_id) != user_id.lower():
+                return jsonify({"error": {"exception": "InsufficientPermissions",
+                                          "message": "You do not have the required permissions for this"}}), 403
+
+        balance = get_user_balance(user_id)
+
+        # Check if user exists
+        if balance:
+            return jsonify({"error": None, 'message': balance.to_json("userId", "balance", "timeModified")}), 200
+        else:
+            return jsonify({"error": {"exception": "UserNotFound",
+                           "message": "User not found"}, 'message': None}), 404
+
+    except Exception as e:
+        # Log the error
+        print(f"Unexpected error: {e}")
+        return jsonify({"error": {"exception": "Error", "message": "An unexpected error occurred"},
+                       "message": None}), 500
 
 
 @users.route("/<user_id>", methods=['DELETE'])
@@ -297,14 +345,7 @@ def handle_get_specific_user(user_id):
 
         # Check if user exists
         if user:
-            return jsonify({"error": None, 'message': {"userId": user.user_id,
-                                                       "firstName": user.first_name,
-                                                       "lastName": user.last_name,
-                                                       "isTemporary": user.is_temporary,
-                                                       "priceRanking": user.price_ranking,
-                                                       "permissions": user.permissions,
-                                                       "hasProfilePicture": user.has_profile_picture
-                                                       }}), 200
+            return jsonify({"error": None, 'message': user.to_json()}), 200
         else:
             return jsonify({"error": {"exception": "UserNotFound",
                            "message": "User not found or not assigned"}, 'message': None}), 404
@@ -0,0 +1,95 @@
+# Production server configuration, loaded by gunicorn from the working directory (see entrypoint.sh)
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8085")
+
+# sync, gthread or gevent (gevent and psycogreen have to be installed separately)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+
+# Import the app once in the master, workers share the loaded modules copy-on-write
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers after a number of requests, the jitter keeps them from restarting at the same time
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Once in the master before any worker serves requests
+    from database_service.migrations import migrate_on_startup
+    migrate_on_startup()
+
+    # One background removal pool for all workers, they submit their images to it
+    from services.background_removal import start_background_removal_server
+    start_background_removal_server()
+
+    # Metrics of a previous run would be added to the new ones
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for file_name in os.listdir(multiproc_dir):
+            if file_name.endswith(".db"):
+                os.remove(os.path.join(multiproc_dir, file_name))
+
+
+def post_fork(server, worker):
+    # Connections, threads and cached data of the master must not be shared with the workers
+    from database_service.connection import reset_pools
+    from database_service.notifications import reset_listener
+    from database_service.session_retention import reset_retention_scheduler
+    from services.cache import clear_all_caches
+
+    reset_pools()
+    reset_listener()
+    reset_retention_scheduler()
+    clear_all_caches()
+
+
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        # Let psycopg2 yield to other greenlets while waiting for the database
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            worker.log.warning("psycogreen is not installed, database calls block the gevent worker")
+
+    # Every worker schedules the session retention, an advisory lock lets only one of them run it
+    from database_service.session_retention import start_retention_scheduler
+    start_retention_scheduler()
+
+
+def on_exit(server):
+    from services.background_removal import stop_background_removal_server
+    stop_background_removal_server()
+
+
+def child_exit(server, worker):
+    # Drop the gauges of the stopped worker from the metrics
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from database_service.connection import close_all_pools
+    from database_service.notifications import stop_listener
+    from database_service.session_retention import stop_retention_scheduler
+    from services.background_removal import get_background_remover
+
+    stop_listener()
+    stop_retention_scheduler()
+    get_background_remover().shutdown()
+    close_all_pools()
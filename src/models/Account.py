@@ -1,31 +1,60 @@
 import uuid
+from dataclasses import dataclass
+from typing import ClassVar
 from datetime import datetime
+from models.Model import Model
 
 
-class Account:
-    def __init__(self, public_id: uuid, username: str, password_hash: str, time_created: datetime, linked_user_id=uuid):
-        self.public_id = public_id
-        self.username = username
-        self.password_hash = password_hash
-        self.time_created = time_created
-        self.linked_user_id = linked_user_id
-
-
-class AccountSession:
-    def __init__(
-        self,
-        token_id: uuid,
-        account_id: uuid,
-        ip_address: str,
-        device: str,
-        browser: str,
-        origin_id: uuid,
-        time_created: datetime = None,
-    ):
-        self.token_id = token_id
-        self.account_id = account_id
-        self.ip_address = ip_address
-        self.device = device
-        self.browser = browser
-        self.origin_id = origin_id
-        self.time_created = time_created
+@dataclass(slots=True)
+class Account(Model):
+    # Fields are optional, a projection only selects some of them
+    public_id: uuid.UUID = None
+    username: str = None
+    time_created: datetime = None
+    linked_user_id: uuid.UUID = None
+    password_hash: bytes = None
+
+    # JSON key -> field (and column) it is built from
+    columns: ClassVar[dict] = {"publicId": "public_id",
+                               "username": "username",
+                               "timeCreated": "time_created",
+                               "linkedUserId": "linked_user_id"}
+
+    def __post_init__(self):
+        # bytea columns arrive as memoryview
+        if isinstance(self.password_hash, memoryview):
+            self.password_hash = self.password_hash.tobytes()
+
+    def _json(self):
+        return {"publicId": self.public_id,
+                "username": self.username,
+                "timeCreated": self.time_created,
+                "linkedUserId": self.linked_user_id}
+
+
+@dataclass(slots=True)
+class AccountSession(Model):
+    token_id: uuid.UUID = None
+    account_id: uuid.UUID = None
+    ip_address: str = None
+    device: str = None
+    browser: str = None
+    origin_id: uuid.UUID = None
+    time_created: datetime = None
+
+    columns: ClassVar[dict] = {"tokenId": "token_id",
+                               "accountId": "account_id",
+                               "ipAddress": "ip_address",
+                               "device": "device",
+                               "browser": "browser",
+                               "originId": "origin_id",
+                               "timeCreated": "time_created"}
+
+    def _json(self):
+        return {"tokenId": self.token_id,
+                "accountId": self.account_id,
+                "ipAddress": self.ip_address,
+                "device": self.device,
+                "browser": self.browser,
+                "originId": self.origin_id,
+                "timeCreated": self.time_created}
@@ -0,0 +1,22 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Model(ABC):
+    @classmethod
+    def from_row(cls, row):
+        # Cursor rows are selected in the order of the dataclass fields
+        return cls(*row)
+
+    @abstractmethod
+    def _json(self) -> dict:
+        # camelCase keys of the model
+        pass
+
+    def to_json(self, *fields) -> dict:
+        # camelCase representation for responses, optionally limited to the given keys
+        data = self._json()
+        if fields:
+            return {key: data[key] for key in fields}
+        return data
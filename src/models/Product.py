@@ -1,23 +1,68 @@
-class ProductCategory:
-    def __init__(self, category_id: int, category_name: str):
-        self.category_id = category_id
-        self.category_name = category_name
-
-
-class Beverage:
-    def __init__(self, product_id: int, product_name: str, category_id: int, beverage_size: float, pricing: dict):
-        self.product_id = product_id
-        self.product_name = product_name
-        self.category_id = category_id
-        self.beverage_size = beverage_size
-        self.pricing = pricing
-
-
-class Product:
-    def __init__(self, product_id: int, product_name: str, category_id: int,
-                 product_type: str, profile_picture_path: str):
-        self.product_id = product_id
-        self.product_name = product_name
-        self.category_id = category_id
-        self.product_type = product_type
-        self.profile_picture_path = profile_picture_path
+from dataclasses import dataclass
+from models.Model import Model
+
+
+@dataclass(slots=True)
+class ProductCategory(Model):
+    category_id: int
+    category_name: str
+
+    def _json(self):
+        return {"id": self.category_id,
+                "name": self.category_name}
+
+
+@dataclass(slots=True)
+class Beverage(Model):
+    product_id: int
+    product_name: str
+    category_id: int
+    beverage_size: float
+    pricing: dict
+
+    def _json(self):
+        return {"id": self.product_id,
+                "productName": self.product_name,
+                "categoryId": self.category_id,
+                "beverageSize": self.beverage_size,
+                "pricing": self.pricing}
+
+
+@dataclass(slots=True)
+class BeveragePrice(Model):
+    product_id: int
+    product_name: str
+    category_id: int
+    beverage_size: float
+    price: float
+
+    def _json(self):
+        return {"id": self.product_id,
+                "productName": self.product_name,
+                "categoryId": self.category_id,
+                "beverageSize": self.beverage_size,
+                "price": self.price}
+
+
+@dataclass(slots=True)
+class PriceMatrix:
+    # Effective price of every beverage per (pricing_type, price_ranking)
+    prices: dict  # (pricing_type, price_ranking) -> list of BeveragePrice
+
+    def get_prices(self, pricing_type: str, price_ranking: str):
+        return self.prices.get((pricing_type, price_ranking), [])
+
+
+@dataclass(slots=True)
+class Product(Model):
+    product_id: int
+    product_name: str
+    category_id: int
+    product_type: str
+    profile_picture_path: str = None
+
+    def _json(self):
+        return {"id": self.product_id,
+                "productName": self.product_name,
+                "categoryId": self.category_id,
+                "productType": self.product_type}
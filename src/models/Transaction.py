@@ -0,0 +1,23 @@
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from models.Model import Model
+
+
+@dataclass(slots=True)
+class TabTransactionPosition(Model):
+    transaction_id: int
+    transaction_position: int
+    time_created: datetime
+    product_id: int
+    quantity: int
+    balance: Decimal
+    user_affected: uuid.UUID
+    user_created: uuid.UUID
+
+    def _json(self):
+        return {"position": self.transaction_position,
+                "productId": self.product_id,
+                "quantity": self.quantity,
+                "balance": float(self.balance)}
@@ -1,15 +1,57 @@
 import uuid
+from dataclasses import dataclass
+from typing import ClassVar
 from datetime import datetime
+from decimal import Decimal
+from models.Model import Model
 
 
-class User:
-    def __init__(self, user_id: uuid, first_name: str, last_name: str, time_created: datetime,
-                 is_temporary: bool, price_ranking: str, permissions: str, profile_picture_path: str):
-        self.user_id = user_id
-        self.first_name = first_name
-        self.last_name = last_name
-        self.time_created = time_created
-        self.is_temporary = is_temporary
-        self.price_ranking = price_ranking
-        self.permissions = permissions
-        self.has_profile_picture = profile_picture_path is not "" and profile_picture_path is not None
+@dataclass(slots=True)
+class User(Model):
+    # Fields are optional, a projection only selects some of them
+    user_id: uuid.UUID = None
+    first_name: str = None
+    last_name: str = None
+    time_created: datetime = None
+    is_temporary: bool = None
+    price_ranking: str = None
+    permissions: str = None
+    profile_picture_path: str = None
+
+    # JSON key -> field (and column) it is built from
+    columns: ClassVar[dict] = {"userId": "user_id",
+                               "firstName": "first_name",
+                               "lastName": "last_name",
+                               "isTemporary": "is_temporary",
+                               "priceRanking": "price_ranking",
+                               "permissions": "permissions",
+                               "hasProfilePicture": "profile_picture_path"}
+
+    @property
+    def has_profile_picture(self) -> bool:
+        return bool(self.profile_picture_path)
+
+    def _json(self):
+        return {"userId": self.user_id,
+                "firstName": self.first_name,
+                "lastName": self.last_name,
+                "isTemporary": self.is_temporary,
+                "priceRanking": self.price_ranking,
+                "permissions": self.permissions,
+                "hasProfilePicture": self.has_profile_picture}
+
+
+@dataclass(slots=True)
+class UserBalance(Model):
+    user_id: uuid.UUID
+    first_name: str
+    last_name: str
+    balance: Decimal
+    time_modified: datetime
+
+    def _json(self):
+        return {"userId": self.user_id,
+                "firstName": self.first_name,
+                "lastName": self.last_name,
+                "balance": float(self.balance),
+                "timeModified": self.time_modified}
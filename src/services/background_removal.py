@@ -0,0 +1,343 @@
+# Background removal on dedicated worker processes, each holding one warm rembg session
+import itertools
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import BaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRemovalBusyError(Exception):
+    # Raised when all workers are busy and the wait queue is full
+    def __init__(self, retry_after: int):
+        super().__init__("Background removal workers are busy")
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        # Raised again in the web worker when the shared pool rejects a job
+        return (BackgroundRemovalBusyError, (self.retry_after, ))
+
+
+# Session of the current worker process
+_session = None
+
+
+def _init_worker(model_name: str, intra_op_threads: int, warm_up: bool):
+    global _session
+    # rembg builds the ONNX session options from OMP_NUM_THREADS
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    from PIL import Image
+    from rembg import new_session, remove
+
+    _session = new_session(model_name)
+    if warm_up:
+        # The first inference allocates the ONNX buffers, do it before the first real image arrives
+        remove(Image.new("RGB", (64, 64)), session=_session)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _remove_background(input_bytes: bytes):
+    from rembg import remove
+    started = time.time()
+    result = remove(input_bytes, session=_session, force_return_bytes=True)
+    return result, started, time.time() - started
+
+
+class BackgroundRemover:
+    def __init__(self, workers: int, max_queue: int, model_name: str = "u2net", intra_op_threads: int = 1,
+                 warm_up: bool = True, timeout: float = 120, retry_after: int = 5):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.model_name = model_name
+        self.intra_op_threads = intra_op_threads
+        self.warm_up = warm_up
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.pid = os.getpid()
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # Running plus waiting jobs
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "queue_wait_seconds_total": 0.0,
+            "inference_seconds_total": 0.0,
+            "inference_seconds_max": 0.0,
+        }
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the threads and database connections of the web worker
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.model_name, self.intra_op_threads, self.warm_up))
+            return self._executor
+
+    def _reset_executor(self, executor):
+        # A broken pool already terminated its workers, the next job starts a new one.
+        # Runs on the management thread of the pool, calling shutdown() from there would deadlock.
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def start(self, wait: bool = False):
+        # Spawn all workers and load their sessions without waiting for the first job
+        executor = self._get_executor()
+        futures = [executor.submit(_ready) for _ in range(self.workers)]
+        if wait:
+            for future in futures:
+                future.result(self.timeout)
+
+    def submit(self, input_bytes: bytes):
+        # Returns a future of the PNG bytes, the slot is held until the worker finished
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise BackgroundRemovalBusyError(self.retry_after)
+
+        try:
+            executor = self._get_executor()
+            submitted = time.time()
+            job = executor.submit(_remove_background, input_bytes)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self._stats["in_flight"] += 1
+        future = Future()
+        job.add_done_callback(lambda job: self._finish(job, future, executor, submitted))
+        return future
+
+    def _finish(self, job, future, executor, submitted):
+        self._slots.release()
+        try:
+            result, started, duration = job.result()
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. out of memory or the model could not be loaded), start over with a new pool
+                logger.warning("Background removal worker pool broke, restarting it")
+                self._reset_executor(executor)
+            with self._stats_lock:
+                self._stats["in_flight"] -= 1
+                self._stats["failed"] += 1
+            future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._stats["in_flight"] -= 1
+            self._stats["completed"] += 1
+            self._stats["queue_wait_seconds_total"] += max(started - submitted, 0.0)
+            self._stats["inference_seconds_total"] += duration
+            self._stats["inference_seconds_max"] = max(self._stats["inference_seconds_max"], duration)
+        future.set_result(result)
+
+    def remove_background(self, input_bytes: bytes):
+        return self.submit(input_bytes).result(self.timeout)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self._stats, workers=self.workers, max_queue=self.max_queue)
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _SharedBackgroundRemover:
+    # Runs in the background removal server, keeps the futures of the jobs until their web worker fetches them
+    def __init__(self, remover: BackgroundRemover):
+        self._remover = remover
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._job_ids = itertools.count()
+
+    def submit(self, input_bytes: bytes):
+        future = self._remover.submit(input_bytes)
+        with self._jobs_lock:
+            # Results of web workers that stopped waiting are dropped after the timeout
+            expired = time.time() - 2 * self._remover.timeout
+            for job_id in [job_id for job_id, (_, submitted) in self._jobs.items() if submitted < expired]:
+                del self._jobs[job_id]
+            job_id = next(self._job_ids)
+            self._jobs[job_id] = (future, time.time())
+        return job_id
+
+    def result(self, job_id: int):
+        with self._jobs_lock:
+            future, _ = self._jobs.pop(job_id)
+        return future.result(self._remover.timeout)
+
+    def start(self):
+        self._remover.start()
+
+    def get_stats(self):
+        return self._remover.get_stats()
+
+
+class _BackgroundRemovalManager(BaseManager):
+    pass
+
+
+_shared_remover = None
+
+
+def _get_shared_remover():
+    global _shared_remover
+    if _shared_remover is None:
+        _shared_remover = _SharedBackgroundRemover(_create_background_remover())
+    return _shared_remover
+
+
+_BackgroundRemovalManager.register("get_remover", callable=_get_shared_remover)
+
+
+class RemoteBackgroundRemover:
+    # Web worker side of the background removal server, used like a BackgroundRemover
+    def __init__(self, address: str, authkey: bytes, timeout: float = 120):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.pid = os.getpid()
+
+        self._remote = None
+        self._remote_lock = threading.Lock()
+
+    def _get_remote(self):
+        # The proxy opens one connection per thread on its own
+        with self._remote_lock:
+            if self._remote is None:
+                manager = _BackgroundRemovalManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._remote = manager.get_remover()
+            return self._remote
+
+    def start(self, wait: bool = False):
+        self._get_remote().start()
+
+    def submit(self, input_bytes: bytes):
+        # Raises BackgroundRemovalBusyError right away, the result is awaited on a thread of this worker
+        remote = self._get_remote()
+        job_id = remote.submit(input_bytes)
+        future = Future()
+
+        def wait_for_result():
+            try:
+                future.set_result(remote.result(job_id))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=wait_for_result, name="background-removal-result", daemon=True).start()
+        return future
+
+    def remove_background(self, input_bytes: bytes):
+        remote = self._get_remote()
+        return remote.result(remote.submit(input_bytes))
+
+    def get_stats(self):
+        return self._get_remote().get_stats()
+
+    def shutdown(self):
+        # The pool belongs to the server
+        pass
+
+
+def _create_background_remover():
+    workers = int(os.environ.get("BACKGROUND_REMOVAL_WORKERS", 1))
+    return BackgroundRemover(
+        workers=workers,
+        max_queue=int(os.environ.get("BACKGROUND_REMOVAL_MAX_QUEUE", workers * 4)),
+        model_name=os.environ.get("BACKGROUND_REMOVAL_MODEL", "u2net"),
+        intra_op_threads=int(os.environ.get("BACKGROUND_REMOVAL_THREADS", 1)),
+        warm_up=os.environ.get("BACKGROUND_REMOVAL_WARM_UP", "true").lower() == "true",
+        timeout=float(os.environ.get("BACKGROUND_REMOVAL_TIMEOUT", 120)),
+        retry_after=int(os.environ.get("BACKGROUND_REMOVAL_RETRY_AFTER", 5)))
+
+
+_remover = None
+_remover_lock = threading.Lock()
+
+
+def get_background_remover():
+    global _remover
+    remover = _remover
+    if remover is not None and remover.pid == os.getpid():
+        return remover
+
+    with _remover_lock:
+        # Worker processes belong to the process that started them
+        if _remover is None or _remover.pid != os.getpid():
+            address = os.environ.get("BACKGROUND_REMOVAL_ADDRESS")
+            if address:
+                # Submit to the pool of the background removal server instead of starting one
+                _remover = RemoteBackgroundRemover(
+                    address, bytes.fromhex(os.environ["BACKGROUND_REMOVAL_AUTHKEY"]),
+                    timeout=float(os.environ.get("BACKGROUND_REMOVAL_TIMEOUT", 120)))
+            else:
+                _remover = _create_background_remover()
+        return _remover
+
+
+def start_background_remover():
+    if os.environ.get("BACKGROUND_REMOVAL_PRESTART", "true").lower() == "true":
+        get_background_remover().start()
+
+
+_server = None
+
+
+def start_background_removal_server():
+    # One pool for all web workers of the host, started by the gunicorn master before forking them. The workers
+    # find the server through the environment they inherit.
+    global _server
+    if os.environ.get("BACKGROUND_REMOVAL_SHARED", "true").lower() != "true":
+        return
+    authkey = secrets.token_bytes(32)
+    # Spawned, the server does not inherit the threads and connections of the master
+    _server = _BackgroundRemovalManager(authkey=authkey, ctx=multiprocessing.get_context("spawn"))
+    _server.start()
+    os.environ["BACKGROUND_REMOVAL_ADDRESS"] = _server.address
+    os.environ["BACKGROUND_REMOVAL_AUTHKEY"] = authkey.hex()
+    start_background_remover()
+
+
+def stop_background_removal_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server = None
+        del os.environ["BACKGROUND_REMOVAL_ADDRESS"]
+        del os.environ["BACKGROUND_REMOVAL_AUTHKEY"]
+
+
+def get_stats():
+    # Jobs, queue wait and inference time of the pool, shared by all workers with the background removal server
+    return get_background_remover().get_stats()
+
+
+def submit_background_removal(input_bytes: bytes):
+    return get_background_remover().submit(input_bytes)
+
+
+def remove_background(input_bytes: bytes):
+    return get_background_remover().remove_background(input_bytes)
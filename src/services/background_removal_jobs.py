@@ -0,0 +1,137 @@
+# Background removal jobs, results are cached on disk by the SHA-256 of the input image.
+# The state lives in files next to the result, so every web worker can answer the polling requests:
+#   <job_id>.png      finished result
+#   <job_id>.pending  job is running (mtime = start)
+#   <job_id>.error    job failed, contains the reason
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from services.background_removal import get_background_remover
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def get_cache_dir():
+    return os.environ.get("BACKGROUND_REMOVAL_CACHE_DIR", "data/images/background_removed/")
+
+
+def get_job_id(input_bytes: bytes):
+    return hashlib.sha256(input_bytes).hexdigest()
+
+
+def _path(job_id: str, suffix: str):
+    return os.path.join(get_cache_dir(), f"{job_id}.{suffix}")
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers never see a partially written file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_result_path(job_id: str):
+    path = _path(job_id, "png")
+    try:
+        # Keep results that are still requested from being pruned
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        return None
+
+
+def get_job_status(job_id: str):
+    # Returns (status, detail): done, pending, failed or None for unknown jobs
+    if not JOB_ID_PATTERN.match(job_id):
+        return None, None
+    if os.path.exists(_path(job_id, "png")):
+        return "done", None
+
+    try:
+        started = os.path.getmtime(_path(job_id, "pending"))
+        # Jobs of a crashed web worker never finish, they can be submitted again
+        if time.time() - started <= get_background_remover().timeout:
+            return "pending", None
+    except FileNotFoundError:
+        pass
+
+    try:
+        with open(_path(job_id, "error"), "r") as error_file:
+            return "failed", error_file.read()
+    except FileNotFoundError:
+        return None, None
+
+
+def _finish_job(job_id: str, future):
+    try:
+        _write_atomic(_path(job_id, "png"), future.result())
+        _remove(_path(job_id, "error"))
+    except Exception as e:
+        logger.warning("Background removal job %s failed: %s", job_id, e)
+        _write_atomic(_path(job_id, "error"), str(e).encode("utf-8"))
+    finally:
+        _remove(_path(job_id, "pending"))
+
+
+def submit_job(input_bytes: bytes):
+    # Returns (job_id, status), identical images share one job and its cached result
+    job_id = get_job_id(input_bytes)
+    status, _ = get_job_status(job_id)
+    if status in ("done", "pending"):
+        return job_id, status
+
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    _prune_cache()
+
+    # Raises BackgroundRemovalBusyError before the job is marked as pending
+    future = get_background_remover().submit(input_bytes)
+    _write_atomic(_path(job_id, "pending"), b"")
+    future.add_done_callback(lambda future: _finish_job(job_id, future))
+    return job_id, "pending"
+
+
+def remove_background_cached(input_bytes: bytes):
+    # Synchronous removal that shares the cache with the jobs
+    result_path = get_result_path(get_job_id(input_bytes))
+    if result_path:
+        with open(result_path, "rb") as result_file:
+            return result_file.read()
+
+    output_bytes = get_background_remover().remove_background(input_bytes)
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    _write_atomic(_path(get_job_id(input_bytes), "png"), output_bytes)
+    return output_bytes
+
+
+def _prune_cache():
+    # Delete cached results and job markers not used within the max age, at most once per hour
+    global _last_prune
+    max_age = float(os.environ.get("BACKGROUND_REMOVAL_CACHE_MAX_AGE", 7 * 24 * 60 * 60))
+    with _prune_lock:
+        if time.time() - _last_prune < 60 * 60:
+            return
+        _last_prune = time.time()
+
+    for entry in os.scandir(get_cache_dir()):
+        try:
+            if (JOB_ID_PATTERN.match(entry.name.split(".")[0]) and
+                    time.time() - entry.stat().st_mtime > max_age):
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
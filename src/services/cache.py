@@ -0,0 +1,83 @@
+# Thread-safe in-memory caches
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+MISSING = object()
+
+# All caches of the process, e.g. to reset them when the database is replaced
+_caches = weakref.WeakSet()
+
+
+class TTLCache:
+    # LRU cache whose entries additionally expire after `ttl` seconds
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0, name: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Caches with a name report their stats in get_all_cache_stats
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation, loads started before it are not stored
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, generation: int = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is MISSING:
+            generation = self.generation
+            value = loader()
+            self.set(key, value, generation)
+        return value
+
+    def discard(self, predicate):
+        # Remove all entries whose key matches the predicate
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "max_size": self.max_size}
+
+
+def clear_all_caches():
+    for cache in list(_caches):
+        cache.clear()
+
+
+def get_all_cache_stats():
+    return {cache.name: cache.get_stats() for cache in list(_caches) if cache.name}
@@ -0,0 +1,68 @@
+# Pre-serialized, pre-compressed catalog responses
+import gzip
+import os
+import threading
+from flask import Response, current_app
+from services.cache import MISSING, TTLCache
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always available
+    brotli = None
+
+# Notification channel, sent whenever products, pricing or categories change
+CATALOG_CHANNEL = "product_catalog"
+
+# TTL is only a safety net, writes invalidate the cache
+catalog_cache = TTLCache(max_size=64, ttl=float(os.environ.get("CATALOG_CACHE_TTL", 3600)), name="catalog")
+_build_lock = threading.Lock()
+
+
+class CachedResponse:
+    __slots__ = ("body", "status", "mimetype", "encoded")
+
+    def __init__(self, body: bytes, status: int, mimetype: str):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.encoded = {"gzip": gzip.compress(body, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(body, quality=5)
+
+    def to_response(self, accept_encodings):
+        encoding = accept_encodings.best_match(list(self.encoded))
+        if encoding:
+            response = Response(self.encoded[encoding], status=self.status, mimetype=self.mimetype)
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = Response(self.body, status=self.status, mimetype=self.mimetype)
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+def render_json(payload, status: int = 200):
+    # Serialize like jsonify() does
+    return CachedResponse(f"{current_app.json.dumps(payload)}\n".encode("utf-8"), status, current_app.json.mimetype)
+
+
+def render_raw_json(message: str, status: int = 200):
+    # Envelope around a message that is already JSON text (e.g. built by the database), passed through unparsed
+    return CachedResponse(f'{{"error":null,"message":{message}}}\n'.encode("utf-8"), status, current_app.json.mimetype)
+
+
+def get_cached_response(key, builder):
+    # builder() returns (payload, status) or a rendered CachedResponse and only runs on a cache miss, once at a time
+    def load():
+        with _build_lock:
+            # Another request may have built it while we waited
+            cached = catalog_cache.get(key)
+            if cached is not MISSING:
+                return cached
+            result = builder()
+            return result if isinstance(result, CachedResponse) else render_json(*result)
+
+    return catalog_cache.get_or_load(key, load)
+
+
+def invalidate_catalog(payload=None):
+    catalog_cache.clear()
@@ -0,0 +1,125 @@
+# Bounded worker pool for bcrypt hashing and verification
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class HashingPoolSaturatedError(Exception):
+    # Raised when all workers are busy and the wait queue is full
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+def _hashpw(password: bytes):
+    started = time.time()
+    result = bcrypt.hashpw(password, bcrypt.gensalt())
+    return result, started, time.time() - started
+
+
+def _checkpw(password: bytes, password_hash: bytes):
+    started = time.time()
+    result = bcrypt.checkpw(password, password_hash)
+    return result, started, time.time() - started
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int, executor: str = "thread", retry_after: int = 1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.pid = os.getpid()
+
+        # bcrypt releases the GIL, so threads already run hashes in parallel
+        if executor == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+
+        # Running plus waiting jobs
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise HashingPoolSaturatedError(self.retry_after)
+
+        try:
+            with self._stats_lock:
+                self._stats["in_flight"] += 1
+            submitted = time.time()
+            result, started, duration = self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            with self._stats_lock:
+                self._stats["in_flight"] -= 1
+
+        queue_wait = max(started - submitted, 0.0)
+        with self._stats_lock:
+            self._stats["completed"] += 1
+            self._stats["queue_wait_seconds_total"] += queue_wait
+            self._stats["queue_wait_seconds_max"] = max(self._stats["queue_wait_seconds_max"], queue_wait)
+            self._stats["hash_seconds_total"] += duration
+            self._stats["hash_seconds_max"] = max(self._stats["hash_seconds_max"], duration)
+        return result
+
+    def hash_password(self, password: str):
+        return self._run(_hashpw, password.encode('utf-8'))
+
+    def check_password(self, password: str, password_hash: bytes):
+        return self._run(_checkpw, password.encode('utf-8'), bytes(password_hash))
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self._stats, workers=self.workers, max_queue=self.max_queue)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    global _hasher
+    hasher = _hasher
+    if hasher is not None and hasher.pid == os.getpid():
+        return hasher
+
+    with _hasher_lock:
+        # Worker threads do not survive a fork, every process builds its own pool
+        if _hasher is None or _hasher.pid != os.getpid():
+            workers = int(os.environ.get("PASSWORD_HASH_WORKERS", min(os.cpu_count() or 1, 4)))
+            _hasher = PasswordHasher(workers=workers,
+                                     max_queue=int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", workers * 4)),
+                                     executor=os.environ.get("PASSWORD_HASH_EXECUTOR", "thread"),
+                                     retry_after=int(os.environ.get("PASSWORD_HASH_RETRY_AFTER", 1)))
+        return _hasher
+
+
+def hash_password(password: str):
+    return get_password_hasher().hash_password(password)
+
+
+def check_password(password: str, password_hash: bytes):
+    return get_password_hasher().check_password(password, password_hash)
+
+
+def get_stats():
+    # Queue wait and hash time of the pool of this worker
+    return get_password_hasher().get_stats()
@@ -0,0 +1,22 @@
+# Cache of refresh token sessions: (account_id, token_id) -> (is_active, permissions)
+import os
+from services.cache import TTLCache
+
+# Notification channel, payload is the account_id or "*" for all accounts
+SESSION_CHANNEL = "account_sessions"
+
+session_cache = TTLCache(max_size=int(os.environ.get("SESSION_CACHE_MAX_SIZE", 10000)),
+                         ttl=float(os.environ.get("SESSION_CACHE_TTL", 60)), name="session")
+
+
+def invalidate_account_sessions(account_id=None):
+    # Drop the cached sessions of one account, or of all accounts
+    if account_id is None or account_id == "*":
+        session_cache.clear()
+    else:
+        account_id = str(account_id)
+        session_cache.discard(lambda key: key[0] == account_id)
+
+
+def handle_session_notification(payload):
+    invalidate_account_sessions(payload)
@@ -0,0 +1,24 @@
+# Device and browser of a session from its User-Agent header. user_agents runs a long list of regexes,
+# while the clients only send a handful of distinct strings.
+import os
+import user_agents
+from services.cache import TTLCache
+
+# Longer strings are parsed every time, they would only push the real clients out of the cache
+MAX_CACHED_LENGTH = 512
+
+# A parsed string never changes, entries only leave the cache when it is full
+user_agent_cache = TTLCache(max_size=int(os.environ.get("USER_AGENT_CACHE_MAX_SIZE", 1024)), ttl=float("inf"),
+                            name="userAgent")
+
+
+def _parse_user_agent(ua_string: str):
+    ua = user_agents.parse(ua_string)
+    return f"{ua.device.family}", f"{ua.browser.family} {ua.browser.version_string}"
+
+
+def parse_user_agent(ua_string: str):
+    # Returns (device, browser) as stored with a session
+    if len(ua_string) > MAX_CACHED_LENGTH:
+        return _parse_user_agent(ua_string)
+    return user_agent_cache.get_or_load(ua_string, lambda: _parse_user_agent(ua_string))
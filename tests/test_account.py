@@ -10,6 +10,10 @@ sys.path.append(os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
 
 from app import app  # noqa
+import database_service.account  # noqa
+from database_service import connection  # noqa
+from flask_jwt_extended import decode_token  # noqa
+from services.password_hashing import check_password  # noqa
 
 
 @pytest.fixture
@@ -66,6 +70,81 @@ def test_login_success(client, setup_account_entry):
     assert response_data["refresh_token"], "Refresh token is empty!"
 
 
+def test_login_releases_connection_while_hashing_success(client, monkeypatch, setup_account_entry):
+    held_connections = []
+
+    def check_password_and_record(password, password_hash):
+        held_connections.append(connection._unit_of_work.get().conn)
+        return check_password(password, password_hash)
+
+    monkeypatch.setattr(database_service.account, "check_password", check_password_and_record)
+    payload = {"username": "test_user", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    # bcrypt ran without a connection of the request
+    assert held_connections == [None], f"Expected no connection while hashing, but got {held_connections}"
+
+
+def test_login_session_checkout_fail(client, monkeypatch, setup_account_entry):
+    get_public_db_connection = database_service.account.get_public_db_connection
+    checkouts = []
+
+    def checkout_once(*args):
+        # The connection of the session insert can not be checked out
+        checkouts.append(len(checkouts))
+        if len(checkouts) > 1:
+            raise connection.PoolTimeoutError("No connection available")
+        return get_public_db_connection(*args)
+
+    monkeypatch.setattr(database_service.account, "get_public_db_connection", checkout_once)
+    with connection.unit_of_work():
+        with pytest.raises(connection.PoolTimeoutError):
+            database_service.account.login_account("test_user", "Password123", "origin", "token",
+                                                   "127.0.0.1", "Other", "Other")
+    assert checkouts == [0, 1], f"Expected two checkouts, but got {checkouts}"
+
+
+def test_login_user_agent_cached_success(client, setup_account_entry):
+    user_agent = ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 "
+                  "(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1")
+    admin_headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    stats = client.get('/misc/stats', headers=admin_headers).get_json()["message"]["caches"]["userAgent"]
+
+    # The second login with the same client is answered from the cache
+    payload = {"username": "test_user", "password": "Password123"}
+    for _ in range(2):
+        response = client.post('/account/login', json=payload, headers={"User-Agent": user_agent})
+        assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    response = client.get('/misc/stats', headers=admin_headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    new_stats = response.get_json()["message"]["caches"]["userAgent"]
+    assert new_stats["hits"] - stats["hits"] >= 1, f"Expected a cache hit, but got {new_stats}"
+
+    # Both sessions carry the parsed metadata
+    response = client.get('/account/session', headers=admin_headers)
+    sessions = response.get_json()["message"]["d0192fdf-56ee-4aab-81e2-36667414c0b1"]
+    assert [session["device"] for session in sessions] == ["iPhone", "iPhone"]
+    assert all(session["browser"].startswith("Mobile Safari 17") for session in sessions), f"Got {sessions}"
+
+
+def test_login_with_linked_user_permissions_success(client, setup_account_entry, setup_user_entry):
+    # Login as account linked to an admin user
+    payload = {"username": "test_admin", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+
+    # Assert the response status code is 200 Ok
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    response_data = response.get_json()
+
+    # Permissions of the linked user are part of the access token
+    with app.app_context():
+        claims = decode_token(response_data["access_token"])
+    assert claims["permissions"] == "admin", f"Expected permissions 'admin', but got {claims['permissions']}"
+    assert claims["sub"] == "439fcdd2-0cb3-46b0-b1ef-e5795806c4bd"
+
+
 def test_login_fail(client):
     user = "test_user3"
 
@@ -280,6 +359,45 @@ def test_get_all_account_sessions_success(client, setup_account_entry):
     assert "browser" in currentAccount[0], "Missing metadata in response"
 
 
+def test_get_all_accounts_paginated_success(client, setup_account_entry):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    accounts = []
+    cursor = ""
+    while True:
+        response = client.get(f'/account/?limit=1&fields=publicId&after={cursor}', headers=headers)
+        assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+        page = response.get_json()["message"]
+        assert len(page) == 1, f"Expected 1 account per page, but got {len(page)}"
+        assert list(page[0]) == ["publicId"], f"Unexpected fields: {page[0]}"
+        accounts += page
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    # Every account is listed exactly once
+    response = client.get('/account/', headers=headers)
+    all_accounts = [account["publicId"] for account in response.get_json()["message"]]
+    assert sorted(account["publicId"] for account in accounts) == sorted(all_accounts)
+
+
+def test_get_account_sessions_with_fields_success(client, setup_account_entry):
+    payload = {"username": "test_user", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.get('/account/session?fields=tokenId&limit=10&count=true', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.headers["X-Total-Count"] == "1"
+
+    # Still grouped by account, the sessions only hold the requested fields
+    sessions = response.get_json()["message"]["d0192fdf-56ee-4aab-81e2-36667414c0b1"]
+    assert list(sessions[0]) == ["tokenId"], f"Unexpected fields: {sessions[0]}"
+
+
 def test_terminate_all_accounts_sessions_by_admin_success(client, setup_account_entry):
     # Test successful login
     payload = {"username": "test_user", "password": "Password123"}
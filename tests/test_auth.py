@@ -1,13 +1,16 @@
 import os
 import sys
+import time
+import psycopg2
 import pytest
-from test_setup import setup, setup_schema, setup_account_entry
+from test_setup import postgres, setup, setup_schema, setup_account_entry
 
 # Add to the Python path
 sys.path.append(os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
 
 from app import app  # noqa
+from database_service.notifications import wait_for_listener  # noqa
 
 
 @pytest.fixture
@@ -46,3 +49,55 @@ def test_token_refresh_success(client, setup_account_entry):
 
     # Ensure the response contains a new access token
     assert "access_token" in data, "Response does not contain an access token"
+
+
+def test_token_refresh_after_logout_fail(client, setup_account_entry):
+    # Login and refresh once to populate the session cache
+    payload = {"username": "test_user", "password": "Password123", "originId": "80f56ef6-a31f-4114-954b-85cbdc1ec783"}
+    response = client.post('/account/login', json=payload)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    data = response.get_json()
+
+    headers = {"Authorization": f"Bearer {data['refresh_token']}"}
+    response = client.get('/account/refresh', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    # Logout invalidates the cached session
+    response = client.post('/account/logout', json={"originId": "80f56ef6-a31f-4114-954b-85cbdc1ec783"},
+                           headers={"Authorization": f"Bearer {data['access_token']}"})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    response = client.get('/account/refresh', headers=headers)
+    assert response.status_code == 401, f"Expected status code 401, but got {response.status_code}"
+
+
+def test_token_refresh_invalidated_by_other_worker_fail(client, setup_account_entry):
+    # Login and refresh to populate the session cache
+    payload = {"username": "test_user", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    refresh_token = response.get_json()["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {refresh_token}"}
+    response = client.get('/account/refresh', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert wait_for_listener(5), "Notification listener did not connect"
+    response = client.get('/account/refresh', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    # Invalidate the session like another worker would, bypassing this process
+    conn = psycopg2.connect(host=os.environ["POSTGRES_HOST"], port=os.environ["POSTGRES_PORT"],
+                            user=postgres.username, password=postgres.password, dbname="bude_transactions")
+    cur = conn.cursor()
+    cur.execute("UPDATE account_sessions SET invalidated = true")
+    cur.execute("SELECT pg_notify('account_sessions', 'd0192fdf-56ee-4aab-81e2-36667414c0b1')")
+    conn.commit()
+    conn.close()
+
+    # The notification reaches the cache asynchronously
+    for _ in range(50):
+        response = client.get('/account/refresh', headers=headers)
+        if response.status_code == 401:
+            break
+        time.sleep(0.1)
+    assert response.status_code == 401, f"Expected status code 401, but got {response.status_code}"
@@ -0,0 +1,165 @@
+import os
+import sys
+import pytest
+from concurrent.futures import Future
+from test_setup import get_mock_JWT_access_token, setup, setup_schema
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from services import background_removal, background_removal_jobs  # noqa
+from services.background_removal import BackgroundRemovalBusyError, BackgroundRemover  # noqa
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def busy_remover(monkeypatch):
+    # Remover without free worker or queue slot, no worker process is started
+    remover = BackgroundRemover(workers=1, max_queue=0, retry_after=7)
+    remover._slots.acquire()
+    monkeypatch.setattr(background_removal, "get_background_remover", lambda: remover)
+    monkeypatch.setattr(background_removal_jobs, "get_background_remover", lambda: remover)
+    yield remover
+    remover._slots.release()
+    remover.shutdown()
+
+
+class FakeRemover:
+    # Hands out futures the test resolves itself instead of running rembg
+    timeout = 120
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, input_bytes):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def remove_background(self, input_bytes):
+        self.futures.append(None)
+        return b"removed"
+
+
+@pytest.fixture
+def fake_remover(monkeypatch, tmp_path):
+    remover = FakeRemover()
+    monkeypatch.setenv("BACKGROUND_REMOVAL_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(background_removal_jobs, "get_background_remover", lambda: remover)
+    yield remover
+
+
+def post_picture(client, url):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    with open("tests/fixtures/picture_with_background.jpg", "rb") as image_file:
+        data = {"file": (image_file, "picture_with_background.jpg")}
+        return client.post(url, data=data, headers=headers, content_type="multipart/form-data")
+
+
+def test_remove_background_job_success(client, fake_remover):
+    response = post_picture(client, "/misc/remove-background/jobs")
+
+    # Assert the response status code is 202 Accepted
+    assert response.status_code == 202, f"Expected status code 202, but got {response.status_code}"
+    job_id = response.get_json()["message"]["jobId"]
+    assert response.headers["Location"] == f"/misc/remove-background/{job_id}"
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get(f"/misc/remove-background/{job_id}", headers=headers)
+    assert response.status_code == 202, f"Expected job to be pending, but got {response.status_code}"
+
+    fake_remover.futures[0].set_result(b"removed")
+    response = client.get(f"/misc/remove-background/{job_id}", headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.mimetype == "image/png"
+    assert response.data == b"removed"
+    response.close()
+
+    # Identical uploads are answered from the cache
+    response = post_picture(client, "/misc/remove-background/jobs")
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.get_json()["message"] == {"jobId": job_id, "status": "done"}
+
+    response = post_picture(client, "/misc/remove-background/")
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.data == b"removed"
+    assert len(fake_remover.futures) == 1, "Expected the image to be processed only once"
+
+
+def test_remove_background_job_failed(client, fake_remover):
+    response = post_picture(client, "/misc/remove-background/jobs")
+    job_id = response.get_json()["message"]["jobId"]
+
+    fake_remover.futures[0].set_exception(RuntimeError("Model could not be loaded"))
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get(f"/misc/remove-background/{job_id}", headers=headers)
+    assert response.status_code == 500, f"Expected status code 500, but got {response.status_code}"
+    assert response.get_json()["message"]["status"] == "failed"
+
+    # Failed jobs can be submitted again
+    response = post_picture(client, "/misc/remove-background/jobs")
+    assert response.status_code == 202, f"Expected status code 202, but got {response.status_code}"
+    assert len(fake_remover.futures) == 2
+
+
+def test_remove_background_job_not_found(client, fake_remover):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get(f"/misc/remove-background/{'0' * 64}", headers=headers)
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+    response = client.get("/misc/remove-background/..%2F..%2Fapp", headers=headers)
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+
+def test_busy_remover_rejects(busy_remover):
+    with pytest.raises(BackgroundRemovalBusyError):
+        busy_remover.remove_background(b"image")
+
+    stats = busy_remover.get_stats()
+    assert stats["rejected"] == 1, f"Expected 1 rejected job, but got {stats['rejected']}"
+    assert stats["in_flight"] == 0
+
+
+def test_shared_remover_rejects(monkeypatch):
+    # One pool in the server process, the web worker only holds a client
+    monkeypatch.setenv("BACKGROUND_REMOVAL_WORKERS", "1")
+    monkeypatch.setenv("BACKGROUND_REMOVAL_MAX_QUEUE", "0")
+    monkeypatch.setenv("BACKGROUND_REMOVAL_RETRY_AFTER", "7")
+    monkeypatch.setenv("BACKGROUND_REMOVAL_PRESTART", "false")
+    monkeypatch.setattr(background_removal, "_remover", None)
+    background_removal.start_background_removal_server()
+    try:
+        remover = background_removal.get_background_remover()
+        assert isinstance(remover, background_removal.RemoteBackgroundRemover)
+
+        # The first image takes the only slot while the worker starts, the second is rejected by the server
+        remover.submit(b"image")
+        with pytest.raises(BackgroundRemovalBusyError) as error:
+            remover.submit(b"image")
+        assert error.value.retry_after == 7, f"Expected Retry-After 7, but got {error.value.retry_after}"
+        assert remover.get_stats()["rejected"] == 1
+    finally:
+        background_removal.stop_background_removal_server()
+
+
+def test_remove_background_busy_fail(client, busy_remover):
+    access_token = get_mock_JWT_access_token(True)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with open("tests/fixtures/picture_with_background.jpg", "rb") as image_file:
+        data = {"file": (image_file, "picture_with_background.jpg")}
+        response = client.post("/misc/remove-background/", data=data, headers=headers,
+                               content_type="multipart/form-data")
+
+    # Assert the response status code is 503 Service Unavailable
+    assert response.status_code == 503, f"Expected status code 503, but got {response.status_code}"
+    assert response.headers["Retry-After"] == "7"
@@ -0,0 +1,90 @@
+import os
+import runpy
+import sys
+import pytest
+from test_setup import setup, setup_schema
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from database_service.connection import (ConnectionPool, PoolTimeoutError, _connect_kwargs,  # noqa
+                                         get_auth_db_connection, get_pool)
+
+
+def test_connection_is_reused_after_close():
+    conn = get_auth_db_connection()
+    backend_pid = conn.get_backend_pid()
+    conn.close()
+
+    # The same physical connection is handed out again
+    conn = get_auth_db_connection()
+    assert conn.get_backend_pid() == backend_pid, "Expected pooled connection to be reused"
+    conn.close()
+
+
+def test_connection_context_manager_rolls_back_on_error():
+    with pytest.raises(ZeroDivisionError):
+        with get_auth_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            1 / 0
+
+    # Connection was released in a clean state
+    with get_auth_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        assert cur.fetchone()[0] == 1
+
+
+def test_pool_checkout_timeout():
+    pool = ConnectionPool(_connect_kwargs("auth"), min_size=0, max_size=1, timeout=0.2)
+    conn = pool.getconn()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+
+    conn.close()
+    pool.getconn().close()
+    pool.close()
+
+
+def test_pool_recycles_after_max_uses():
+    pool = ConnectionPool(_connect_kwargs("auth"), min_size=0, max_size=1, max_uses=2)
+
+    conn = pool.getconn()
+    backend_pid = conn.get_backend_pid()
+    conn.close()
+    conn = pool.getconn()
+    assert conn.get_backend_pid() == backend_pid
+    conn.close()
+
+    # Third checkout exceeds max_uses and opens a new connection
+    conn = pool.getconn()
+    assert conn.get_backend_pid() != backend_pid, "Expected connection to be recycled"
+    conn.close()
+    pool.close()
+
+
+def test_pool_discards_broken_connection():
+    pool = get_pool("auth")
+    conn = get_auth_db_connection()
+    backend_pid = conn.get_backend_pid()
+    conn.close()
+
+    # Simulate a dropped connection
+    pool._idle[-1].conn.close()
+
+    conn = get_auth_db_connection()
+    assert conn.get_backend_pid() != backend_pid, "Expected broken connection to be replaced"
+    conn.close()
+
+
+def test_gunicorn_post_fork_resets_pools():
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), '../src/gunicorn.conf.py'))
+    pool = get_pool("auth")
+
+    # A forked worker builds its own pools instead of sharing the master's sockets
+    config["post_fork"](None, None)
+    assert get_pool("auth") is not pool, "Expected a new pool after post_fork"
+    pool.close()
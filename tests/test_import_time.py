@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+
+# Only the background removal workers may load the imaging stack
+HEAVY_MODULES = ["rembg", "onnxruntime", "numba", "scipy", "skimage", "numpy"]
+
+# Seconds a web worker may spend importing the app, generous for slow CI runners
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", 3))
+
+IMPORT_SCRIPT = f'''
+import json, sys, time
+sys.path.insert(0, {SRC_PATH!r})
+started = time.perf_counter()
+import app
+print(json.dumps({{"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}}))
+'''
+
+
+def import_app():
+    # A fresh interpreter, the test process already imported everything
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, timeout=60,
+                            cwd=SRC_PATH)
+    assert result.returncode == 0, f"Importing the app failed: {result.stderr}"
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_import_skips_imaging_stack():
+    modules = import_app()["modules"]
+
+    loaded = [module for module in HEAVY_MODULES if module in modules]
+    assert not loaded, f"Expected no heavy modules to be imported by the app, but got {loaded}"
+
+
+def test_app_import_time_budget():
+    # Best of three, the first run also warms the file system cache
+    seconds = min(import_app()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_TIME_BUDGET, f"Expected app import below {IMPORT_TIME_BUDGET}s, but took {seconds:.2f}s"
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from endpoints.json_provider import OrjsonProvider, _http_date  # noqa
+
+
+@dataclass
+class Position:
+    product_id: int
+    quantity: int
+
+
+PAYLOAD = {
+    "error": None,
+    "message": [{"userId": uuid.UUID("95cebd35-2489-4dbf-b379-a1f901875831"),
+                 "timeCreated": datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+                 "birthday": date(2000, 1, 31),
+                 "price": Decimal("1.50"),
+                 "ratio": 0.25,
+                 "name": "Bude Bräu",
+                 "positions": [Position(1, 2)],
+                 "byId": {2: "b", 1: "a"}}]
+}
+
+
+def test_orjson_provider_matches_default_provider():
+    expected = json.loads(DefaultJSONProvider(app).dumps(PAYLOAD))
+    assert json.loads(OrjsonProvider(app).dumps(PAYLOAD)) == expected
+
+    with app.app_context():
+        response = OrjsonProvider(app).response(PAYLOAD)
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data()) == expected
+    assert expected["message"][0]["timeCreated"] == "Sat, 01 Mar 2025 12:30:15 GMT"
+
+
+def test_http_date_matches_werkzeug():
+    for value in [datetime(2025, 3, 1, 12, 30, 15), datetime(2024, 12, 31, 23, 59, 59, tzinfo=timezone.utc),
+                  datetime(2025, 1, 1, 0, 30, tzinfo=timezone(timedelta(hours=2))), date(2025, 2, 28)]:
+        assert _http_date(value) == http_date(value)
+
+
+def test_orjson_provider_falls_back_for_large_integers():
+    assert OrjsonProvider(app).dumps({"value": 2 ** 70}) == '{"value": 1180591620717411303424}'
+
+
+def test_app_uses_orjson_provider():
+    assert isinstance(app.json, OrjsonProvider)
+    assert app.json.loads(b'{"a": [1, 2]}') == {"a": [1, 2]}
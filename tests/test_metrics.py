@@ -0,0 +1,102 @@
+import os
+import sys
+import pytest
+from test_setup import get_mock_JWT_access_token, setup, setup_schema, setup_account_entry, setup_user_entry
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from prometheus_client.parser import text_string_to_metric_families  # noqa
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+def get_samples(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    samples = {}
+    for family in text_string_to_metric_families(response.get_data(as_text=True)):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def get_sample(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_request_metrics_success(client, setup_account_entry, setup_user_entry):
+    route = {"blueprint": "users", "route": "/user/", "method": "GET"}
+    before = get_samples(client)
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    for _ in range(2):
+        response = client.get('/user/', headers=headers)
+        assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    response = client.get('/user/?limit=0', headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+    after = get_samples(client)
+
+    def delta(name, **labels):
+        return get_sample(after, name, **labels) - get_sample(before, name, **labels)
+
+    assert delta("http_requests_total", status="200", **route) == 2
+    assert delta("http_requests_total", status="400", **route) == 1
+    assert delta("http_request_duration_seconds_count", **route) == 3
+    assert delta("http_response_size_bytes_sum", **route) > 0, "Expected the response sizes to be recorded"
+    assert get_sample(after, "http_requests_in_progress", **route) == 0, "Expected no request in progress"
+
+    # The user list reads from the database, the invalid request does not
+    assert delta("http_request_db_queries_sum", **route) >= 2
+    assert delta("http_request_db_seconds_sum", **route) > 0, "Expected database time to be recorded"
+    assert delta("http_request_db_connections_sum", **route) >= 2
+
+
+def test_unmatched_route_metrics_success(client):
+    before = get_samples(client)
+    response = client.get('/does-not-exist')
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+    after = get_samples(client)
+    labels = {"blueprint": "app", "route": "<unmatched>", "method": "GET", "status": "404"}
+    assert get_sample(after, "http_requests_total", **labels) - get_sample(before, "http_requests_total", **labels) == 1
+
+
+def test_metrics_token_fail(client, monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+
+    response = client.get('/metrics')
+    assert response.status_code == 401, f"Expected status code 401, but got {response.status_code}"
+
+    response = client.get('/metrics', headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+
+def test_pool_metrics_success(client, setup_account_entry):
+    pid = str(os.getpid())
+    before = get_samples(client)
+
+    response = client.post('/account/login', json={"username": "test_user", "password": "Password123"})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    after = get_samples(client)
+    completed = (get_sample(after, "password_hashing_jobs_completed_total", pid=pid) -
+                 get_sample(before, "password_hashing_jobs_completed_total", pid=pid))
+    assert completed == 1, f"Expected one password check, but got {completed}"
+    assert get_sample(after, "password_hashing_hash_seconds_total", pid=pid) > 0
+    assert ("background_removal_workers", (("pid", pid), )) in after, "Expected the background removal pool"
+
+    # The same stats for the answering worker
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    stats = client.get('/misc/stats', headers=headers).get_json()["message"]
+    assert stats["passwordHashing"]["completed"] >= 1, f"Unexpected stats {stats['passwordHashing']}"
+    assert stats["backgroundRemoval"]["workers"] >= 1, f"Unexpected stats {stats['backgroundRemoval']}"
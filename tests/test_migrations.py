@@ -0,0 +1,318 @@
+import os
+import re
+import sys
+from datetime import datetime, timezone
+import psycopg2
+import pytest
+from test_setup import postgres, setup, setup_schema
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from database_service.account import (get_account_sessions_page, get_accounts_page,  # noqa
+                                      invalidate_tokens_by_account_id, invalidate_tokens_by_origin_id)
+from database_service.connection import get_auth_db_connection  # noqa
+from database_service.migrations import apply_migrations, get_migrations  # noqa
+from database_service.pagination import encode_cursor  # noqa
+from database_service.query_stats import TimedCursor  # noqa
+from database_service.session_retention import get_max_age, purge_invalidated_sessions  # noqa
+from database_service.user import get_users_page  # noqa
+
+
+# Schema of the first release, databases created from it only get the changes of the migrations
+BASELINE_SQL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures/init_baseline.sql.template'))
+INIT_SQL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../sql/init.sql.template'))
+
+
+def connect(dbname: str = "bude_transactions"):
+    return psycopg2.connect(host=postgres.get_container_host_ip(), port=postgres.get_exposed_port(5432),
+                            user=postgres.username, password=postgres.password, dbname=dbname)
+
+
+@pytest.fixture
+def session_rows():
+    # Many accounts with mostly invalidated sessions, like a database that has been running for a while
+    conn = connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('''
+                INSERT INTO account(public_id, username, password_hash)
+                SELECT gen_random_uuid(), 'account_' || i, '\\x00'
+                FROM generate_series(1, 500) i
+                ''')
+    cur.execute('''
+                INSERT INTO account_sessions(token_id, account_id, ip_address, device, browser, origin_id, invalidated)
+                SELECT gen_random_uuid(), a.public_id, '127.0.0.1', 'Other', 'Other', gen_random_uuid(), i > 1
+                FROM account a
+                CROSS JOIN generate_series(1, 10) i
+                ''')
+    cur.execute("ANALYZE account, account_sessions")
+    cur.close()
+    conn.close()
+
+
+@pytest.fixture
+def captured_statements(monkeypatch):
+    # Statements of the data services with their parameters bound, as they are sent to the database
+    statements = []
+    execute = TimedCursor.execute
+
+    def capture(self, query, vars=None):
+        statements.append(self.mogrify(query, vars).decode("utf-8"))
+        return execute(self, query, vars)
+
+    monkeypatch.setattr(TimedCursor, "execute", capture)
+    return statements
+
+
+def get_index_names(statement: str, setup_statements: tuple = ()):
+    # Index names in the plan of the statement. The small test tables would still be scanned sequentially.
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SET enable_seqscan = off")
+    for setup_statement in setup_statements:
+        cur.execute(setup_statement)
+    cur.execute(f"EXPLAIN (FORMAT JSON) {statement}")
+    plan = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+    index_names = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            index_names.add(node["Index Name"])
+        nodes += node.get("Plans", [])
+    return index_names
+
+
+ACCOUNT_ID = "d0192fdf-56ee-4aab-81e2-36667414c0b1"
+TOKEN_ID = "07b05ff3-0d08-4bad-9ea3-4d46f0a4f5d2"
+USER_ID = "95cebd35-2489-4dbf-b379-a1f901875831"
+
+
+def purge_sessions():
+    conn = get_auth_db_connection()
+    try:
+        purge_invalidated_sessions(conn, get_max_age())
+    finally:
+        conn.close()
+
+
+def next_page(row_id: str):
+    return encode_cursor(datetime.now(timezone.utc), row_id)
+
+
+# Hot data-service calls and the index of the migrations their statements have to use
+HOT_QUERIES = {
+    "invalidate_tokens_by_origin_id": (lambda: invalidate_tokens_by_origin_id(ACCOUNT_ID, TOKEN_ID),
+                                       "account_sessions_active_account_origin_idx"),
+    "invalidate_tokens_by_account_id": (lambda: invalidate_tokens_by_account_id(ACCOUNT_ID),
+                                        "account_sessions_active_account_origin_idx"),
+    "purge_invalidated_sessions": (purge_sessions, "account_sessions_invalidated_idx"),
+    "get_users_page": (lambda: get_users_page(limit=100, after=next_page(USER_ID)), "user_time_created_idx"),
+    "get_accounts_page": (lambda: get_accounts_page(limit=100, after=next_page(ACCOUNT_ID)),
+                          "account_time_created_idx"),
+    "get_account_sessions_page": (lambda: get_account_sessions_page(limit=100),
+                                  "account_sessions_active_time_created_idx"),
+}
+
+# Referencing columns of foreign keys and their index, used when the referenced row is deleted or updated
+FOREIGN_KEY_INDEXES = {
+    ("account", "linked_user_id"): "account_linked_user_id_idx",
+    ("product", "category_id"): "product_category_id_idx",
+    ("tab_transactions", "user_affected"): "tab_transactions_user_affected_idx",
+    ("tab_transactions", "user_created"): "tab_transactions_user_created_idx",
+    ("register_transactions", "user_created"): "register_transactions_user_created_idx",
+}
+
+
+@pytest.mark.parametrize("query_name", HOT_QUERIES)
+def test_hot_query_uses_index_success(query_name, session_rows, captured_statements):
+    call, expected_index_name = HOT_QUERIES[query_name]
+    call()
+    statements = [statement for statement in captured_statements
+                  if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "DELETE")]
+    assert statements, f"Expected {query_name} to run a statement"
+
+    index_names = set().union(*(get_index_names(statement) for statement in statements))
+    assert expected_index_name in index_names, \
+        f"Expected {query_name} to use {expected_index_name}, but the plans use {index_names}"
+
+
+@pytest.mark.parametrize("table_name, column_name", FOREIGN_KEY_INDEXES)
+def test_foreign_key_uses_index_success(table_name, column_name):
+    # The lookup PostgreSQL runs for ON DELETE and ON UPDATE, built from the constraint in the catalog
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT c.conrelid::regclass::text, quote_ident(a.attname), format_type(a.atttypid, a.atttypmod)
+                FROM pg_constraint c
+                JOIN pg_attribute a ON(a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey))
+                WHERE c.contype = 'f'
+                AND c.conrelid = %s::regclass
+                AND a.attname = %s
+                ''',
+                (f'"{table_name}"', column_name))
+    foreign_key = cur.fetchone()
+    cur.close()
+    conn.close()
+    assert foreign_key, f"Expected {table_name}.{column_name} to be a foreign key"
+
+    # Like the cached plan of the referential action, which does not know the value
+    relation, column, column_type = foreign_key
+    index_names = get_index_names("EXECUTE foreign_key_lookup(NULL)", (
+        "SET plan_cache_mode = force_generic_plan",
+        f"PREPARE foreign_key_lookup({column_type}) AS "
+        f"SELECT 1 FROM ONLY {relation} x WHERE $1 = {column} FOR KEY SHARE OF x"))
+    expected_index_name = FOREIGN_KEY_INDEXES[table_name, column_name]
+    assert expected_index_name in index_names, \
+        f"Expected {table_name}.{column_name} to use {expected_index_name}, but the plan uses {index_names}"
+
+
+def test_migrations_applied_success():
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+    versions = [row[0] for row in cur.fetchall()]
+    assert versions == [version for version, _, _ in get_migrations()], f"Unexpected applied versions: {versions}"
+
+    # Applied migrations are not run again
+    assert apply_migrations(conn) == [], "Expected no pending migrations"
+    cur.close()
+    conn.close()
+
+
+def test_migrate_command_success(monkeypatch):
+    monkeypatch.setenv("POSTGRES_MIGRATION_USER", postgres.username)
+    monkeypatch.setenv("POSTGRES_MIGRATION_PW", postgres.password)
+
+    # Forget the last migration, the command applies it again
+    conn = connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    version, name, _ = get_migrations()[-1]
+    cur.execute("DELETE FROM schema_migrations WHERE version = %s", (version, ))
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["migrate", "--status"])
+    assert result.exit_code == 0, f"Expected exit code 0, but got {result.output}"
+    assert f"{version:04d}_{name}: pending" in result.output
+
+    result = runner.invoke(args=["migrate"])
+    assert result.exit_code == 0, f"Expected exit code 0, but got {result.output}"
+    assert f"Applied {version:04d}_{name}" in result.output
+
+    cur.execute("SELECT COUNT(*) FROM schema_migrations WHERE version = %s", (version, ))
+    assert cur.fetchone()[0] == 1, "Expected the migration to be recorded again"
+    cur.close()
+    conn.close()
+
+
+def get_schema(conn):
+    # Columns, indexes and privileges of the application roles, enough to compare two databases
+    cur = conn.cursor()
+    cur.execute('''
+                SELECT table_name, column_name, data_type, is_nullable, column_default
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+                ''')
+    columns = set(cur.fetchall())
+    cur.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public'")
+    indexes = set(cur.fetchall())
+    cur.execute('''
+                SELECT c.relname, NULL, r.rolname, a.privilege_type
+                FROM pg_class c
+                CROSS JOIN aclexplode(c.relacl) a
+                JOIN pg_roles r ON(r.oid = a.grantee)
+                WHERE c.relnamespace = 'public'::regnamespace
+                UNION ALL
+                SELECT c.relname, t.attname, r.rolname, a.privilege_type
+                FROM pg_attribute t
+                JOIN pg_class c ON(c.oid = t.attrelid)
+                CROSS JOIN aclexplode(t.attacl) a
+                JOIN pg_roles r ON(r.oid = a.grantee)
+                WHERE c.relnamespace = 'public'::regnamespace
+                ''')
+    privileges = set(cur.fetchall())
+    cur.execute("SELECT table_name FROM table_versions")
+    table_versions = set(cur.fetchall())
+    cur.close()
+    return columns, indexes, privileges, table_versions
+
+
+def create_database(dbname: str):
+    admin_conn = connect("postgres")
+    admin_conn.autocommit = True
+    admin_cur = admin_conn.cursor()
+    admin_cur.execute(f"CREATE DATABASE {dbname}")
+    admin_cur.close()
+    admin_conn.close()
+
+
+def drop_database(dbname: str):
+    # The privileges of the application roles in it would keep them from being dropped, also after a failed test
+    admin_conn = connect("postgres")
+    admin_conn.autocommit = True
+    admin_cur = admin_conn.cursor()
+    admin_cur.execute(f"DROP DATABASE {dbname} WITH (FORCE)")
+    admin_cur.close()
+    admin_conn.close()
+
+
+@pytest.fixture
+def baseline_database():
+    create_database("bude_baseline")
+    yield "bude_baseline"
+    drop_database("bude_baseline")
+
+
+def execute_init_script(conn, path: str):
+    # The roles already exist in the test container, everything else is created by the script
+    conn.autocommit = True
+    with open(path, "r") as sql_file:
+        sql_script = re.sub(r"^CREATE USER .*$", "", sql_file.read(), flags=re.MULTILINE)
+    conn.cursor().execute(sql_script.format(db_public_user=os.environ['POSTGRES_PUBLIC_USER'],
+                                            db_public_user_pw=os.environ['POSTGRES_PUBLIC_PW'],
+                                            db_auth_user=os.environ['POSTGRES_AUTH_USER'],
+                                            db_auth_user_pw=os.environ['POSTGRES_AUTH_PW']))
+    conn.autocommit = False
+
+
+def test_migrations_on_baseline_schema_success(baseline_database):
+    conn = connect(baseline_database)
+    execute_init_script(conn, BASELINE_SQL_PATH)
+    applied = apply_migrations(conn)
+    assert len(applied) == len(get_migrations()), f"Expected all migrations to be applied, but got {applied}"
+
+    # Migrated and freshly created databases end up with the same schema
+    current_conn = connect()
+    for migrated, current, part in zip(get_schema(conn), get_schema(current_conn),
+                                       ("columns", "indexes", "privileges", "table versions")):
+        assert migrated == current, \
+            f"Unexpected {part}: missing {current - migrated}, additional {migrated - current}"
+    current_conn.close()
+    conn.close()
+
+
+def test_init_script_schema_success(baseline_database):
+    # Deployments created from the template do not have to run the migrations before starting
+    conn = connect(baseline_database)
+    execute_init_script(conn, INIT_SQL_PATH)
+
+    # Indexes and schema_migrations are left to the migrations, everything the data services query is created
+    current_conn = connect()
+    columns, _, privileges, table_versions = get_schema(conn)
+    current_columns, _, current_privileges, current_table_versions = get_schema(current_conn)
+    current_columns = {column for column in current_columns if column[0] != "schema_migrations"}
+    for created, current, part in zip((columns, privileges, table_versions),
+                                      (current_columns, current_privileges, current_table_versions),
+                                      ("columns", "privileges", "table versions")):
+        assert created == current, \
+            f"Unexpected {part}: missing {current - created}, additional {created - current}"
+    current_conn.close()
+    conn.close()
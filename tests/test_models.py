@@ -0,0 +1,51 @@
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+import pytest
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from dataclasses import dataclass  # noqa
+from models.Account import Account  # noqa
+from models.Model import Model  # noqa
+from models.User import User, UserBalance  # noqa
+
+
+def test_user_from_row_to_json():
+    row = ("95cebd35-2489-4dbf-b379-a1f901875831", "Test", "User", datetime(2025, 1, 1), False, "regular", "user", "")
+    user = User.from_row(row)
+
+    assert user.to_json() == {"userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+                              "firstName": "Test",
+                              "lastName": "User",
+                              "isTemporary": False,
+                              "priceRanking": "regular",
+                              "permissions": "user",
+                              "hasProfilePicture": False}
+    assert User.from_row(row[:7] + ("data/images/profile_pictures/1.jpg", )).has_profile_picture
+    balance = UserBalance.from_row((row[0], "Test", "User", Decimal("-1.50"), None))
+    assert balance.to_json("balance") == {"balance": -1.5}
+
+
+def test_models_are_slotted():
+    account = Account.from_row(("d0192fdf-56ee-4aab-81e2-36667414c0b1", "test_user", datetime(2025, 1, 1), None,
+                                memoryview(b"hash")))
+
+    # bytea values are converted once when the row is mapped
+    assert account.password_hash == b"hash"
+    assert not hasattr(account, "__dict__")
+    with pytest.raises(AttributeError):
+        account.unknown = 1
+
+
+def test_model_without_json_fail():
+    @dataclass(slots=True)
+    class Incomplete(Model):
+        name: str
+
+    # Every model has to define its JSON keys
+    with pytest.raises(TypeError):
+        Incomplete("test")
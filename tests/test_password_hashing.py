@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+from test_setup import setup, setup_schema, setup_account_entry
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from services import password_hashing  # noqa
+from services.password_hashing import HashingPoolSaturatedError, PasswordHasher  # noqa
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def saturated_hasher(monkeypatch):
+    # Hasher without free worker or queue slot
+    hasher = PasswordHasher(workers=1, max_queue=0, retry_after=3)
+    hasher._slots.acquire()
+    monkeypatch.setattr(password_hashing, "get_password_hasher", lambda: hasher)
+    yield hasher
+    hasher._slots.release()
+    hasher.shutdown()
+
+
+def test_hash_and_check_password_success():
+    hasher = PasswordHasher(workers=2, max_queue=2)
+    password_hash = hasher.hash_password("Password123")
+
+    assert hasher.check_password("Password123", password_hash)
+    assert not hasher.check_password("Password1234", password_hash)
+
+    stats = hasher.get_stats()
+    assert stats["completed"] == 3, f"Expected 3 completed hashes, but got {stats['completed']}"
+    assert stats["hash_seconds_total"] > 0
+    hasher.shutdown()
+
+
+def test_saturated_hasher_rejects(saturated_hasher):
+    with pytest.raises(HashingPoolSaturatedError):
+        saturated_hasher.hash_password("Password123")
+
+    assert saturated_hasher.get_stats()["rejected"] == 1
+
+
+def test_login_saturated_hasher_fail(client, setup_account_entry, saturated_hasher):
+    payload = {"username": "test_user", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+
+    # Assert the response status code is 503 Service Unavailable
+    assert response.status_code == 503, f"Expected status code 503, but got {response.status_code}"
+    assert response.headers["Retry-After"] == "3"
+    assert response.get_json()["error"]["exception"] == "ServiceUnavailable"
+
+    # Connection was handed back, the database is still usable
+    response = client.get('/account/test-connection')
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
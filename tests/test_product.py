@@ -1,3 +1,4 @@
+import gzip
 import io
 import os
 import sys
@@ -12,6 +13,7 @@ sys.path.append(os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
 
 from app import app  # noqa
+from services.catalog_cache import invalidate_catalog  # noqa
 
 
 @pytest.fixture
@@ -74,6 +76,30 @@ def test_get_all_product_categories_success(client, setup_product_entry):
     assert len(data["message"]) == 3, "Expected amount of categories doesn't match"
 
 
+def test_get_all_product_categories_not_modified_success(client):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.post('/product/category', json={"categoryName": "Bier"}, headers=headers)
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+
+    response = client.get('/product/category', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    etag = response.headers["ETag"]
+
+    # Unchanged list is not sent again
+    response = client.get('/product/category', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304, f"Expected status code 304, but got {response.status_code}"
+
+    # A new category creates a new version
+    response = client.post('/product/category', json={"categoryName": "Schnaps"}, headers=headers)
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+
+    response = client.get('/product/category', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert len(response.get_json()["message"]) == 2, "Expected amount of categories doesn't match"
+
+
 def test_create_beverage_success(client, setup_product_entry):
     # Test successful creation of beverage
     access_token = get_mock_JWT_access_token(True)
@@ -207,6 +233,196 @@ def test_get_all_beverages_success(client, setup_product_entry):
     assert len(beverages) == 2, "Expected amount of beverages for categoryId 2 doesn't match"
 
 
+def test_get_all_beverages_compressed_success(client, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    plain = client.get('/product/beverage', headers=headers)
+    assert plain.status_code == 200, f"Expected status code 200, but got {plain.status_code}"
+
+    # Pre-compressed variant of the same body
+    response = client.get('/product/beverage', headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_get_all_beverages_json_engine_success(client, monkeypatch, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    catalogs = {}
+    for engine in ("python", "json"):
+        monkeypatch.setenv("BEVERAGE_CATALOG_ENGINE", engine)
+        invalidate_catalog()
+        response = client.get('/product/beverage', headers=headers)
+        assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+        catalogs[engine] = sorted(response.get_json()["message"], key=lambda category: category["categoryId"])
+        for category in catalogs[engine]:
+            category["beverages"].sort(key=lambda beverage: beverage["id"])
+
+    # The document built by PostgreSQL is the same as the one grouped in Python
+    assert catalogs["json"] == catalogs["python"], f"Unexpected catalog {catalogs['json']}"
+    assert catalogs["json"][0]["beverages"][0]["pricing"] == {"normal": 1.5, "party": 2.0, "bigEvent": 3.0}
+
+
+def test_get_all_beverages_not_modified_success(client, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+    headers = {"Authorization": f"Bearer {access_token}", "Accept-Encoding": "gzip"}
+
+    response = client.get('/product/beverage', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    etag = response.headers["ETag"]
+
+    # Unchanged catalog is not sent again
+    response = client.get('/product/beverage', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304, f"Expected status code 304, but got {response.status_code}"
+
+
+def test_get_all_beverages_after_update_success(client, setup_product_entry):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Warm up the catalog cache
+    response = client.get('/product/beverage', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    payload = {
+        "productName": "Paulaner Spezi Zero",
+        "categoryId": 2,
+        "beverageSize": 0.5,
+        "pricing": {"normal": 1.0, "party": 1.5, "bigEvent": 2.0}
+    }
+    response = client.put('/product/beverage/1', json=payload, headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    # Cached catalog was invalidated by the update
+    response = client.get('/product/beverage', headers=headers)
+    beverages = [cat["beverages"] for cat in response.get_json()["message"] if cat["categoryId"] == 2][0]
+    beverage = [bev for bev in beverages if bev["id"] == 1][0]
+    assert beverage["productName"] == "Paulaner Spezi Zero"
+    assert beverage["pricing"]["normal"] == 1.0
+
+
+def test_get_beverage_prices_success(client, monkeypatch, setup_account_entry, setup_user_entry, setup_product_entry):
+    monkeypatch.setenv("PRICE_MARKUP_REGULAR", "10")
+    access_token = get_mock_JWT_access_token(False)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Own user (regular) with the party prices plus 10% markup
+    response = client.get('/product/beverage?event=party', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    prices = {beverage["id"]: beverage for beverage in response.get_json()["message"]}
+    assert len(prices) == 3, "Expected one entry per beverage"
+    assert prices[3]["price"] == 2.75, f"Expected price to be 2.75 but got {prices[3]['price']}"
+    assert prices[1]["productName"] == "Paulaner Spezi" and prices[1]["categoryId"] == 2
+
+    etag = response.headers["ETag"]
+    assert "Authorization" in response.headers["Vary"]
+
+    response = client.get('/product/beverage?event=party&forUser=95cebd35-2489-4dbf-b379-a1f901875831',
+                          headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.headers["ETag"] == etag, "Expected the same ETag for the own user"
+
+    # Admins get the prices of any user, here a member without markup, normal prices by default
+    admin_headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get('/product/beverage?forUser=1b6b231b-66f0-468a-b900-dfc9a48977b9', headers=admin_headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    prices = {beverage["id"]: beverage["price"] for beverage in response.get_json()["message"]}
+    assert prices == {1: 1.5, 2: 2.5, 3: 2.0}, f"Unexpected prices {prices}"
+
+    # Unchanged prices are revalidated, a changed markup changes the ETag
+    response = client.get('/product/beverage?event=party', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304, f"Expected status code 304, but got {response.status_code}"
+    monkeypatch.setenv("PRICE_MARKUP_REGULAR", "20")
+    response = client.get('/product/beverage?event=party', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    prices = {beverage["id"]: beverage["price"] for beverage in response.get_json()["message"]}
+    assert prices[3] == 3.0, f"Expected price to be 3.0 but got {prices[3]}"
+    monkeypatch.setenv("PRICE_MARKUP_REGULAR", "10")
+
+    # The update invalidates the cached prices
+    payload = {
+        "productName": "Berg Ulrichsbier",
+        "categoryId": 3,
+        "beverageSize": 0.3,
+        "pricing": {"normal": 2.0, "party": 3.0, "bigEvent": 3.5}
+    }
+    response = client.put('/product/beverage/3', json=payload, headers=admin_headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    response = client.get('/product/beverage?event=party', headers=headers)
+    prices = {beverage["id"]: beverage["price"] for beverage in response.get_json()["message"]}
+    assert prices[3] == 3.3, f"Expected price to be 3.3 but got {prices[3]}"
+
+
+def test_get_beverage_prices_fail(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.get('/product/beverage?event=happyHour', headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+    response = client.get('/product/beverage?forUser=not-a-uuid', headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+    # Users only get their own prices
+    response = client.get('/product/beverage?forUser=1b6b231b-66f0-468a-b900-dfc9a48977b9', headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+    admin_headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get('/product/beverage?forUser=00000000-0000-0000-0000-000000000000', headers=admin_headers)
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+
+def test_event_mode_success(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+
+    response = client.get('/product/event-mode', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.get_json()["message"]["eventMode"] == "normal"
+
+    response = client.get('/product/beverage/current', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    etag = response.headers["ETag"]
+    catalog = response.get_json()["message"]
+    assert catalog["eventMode"] == "normal"
+    beverages = [cat["beverages"] for cat in catalog["categories"] if cat["categoryId"] == 2][0]
+    assert {bev["id"]: bev["price"] for bev in beverages} == {1: 1.5, 2: 2.5}
+
+    # Polling tablets get 304 until something changes
+    response = client.get('/product/beverage/current', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304, f"Expected status code 304, but got {response.status_code}"
+
+    admin_headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.put('/product/event-mode', json={"eventMode": "party"}, headers=admin_headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.get_json()["message"]["eventMode"] == "party"
+
+    # The switch invalidates the cached catalog and its ETag
+    response = client.get('/product/beverage/current', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    catalog = response.get_json()["message"]
+    assert catalog["eventMode"] == "party"
+    beverages = [cat["beverages"] for cat in catalog["categories"] if cat["categoryId"] == 2][0]
+    assert {bev["id"]: bev["price"] for bev in beverages} == {1: 2.0, 2: 3.5}
+
+    response = client.get('/product/event-mode', headers=headers)
+    assert response.get_json()["message"]["eventMode"] == "party"
+
+
+def test_set_event_mode_fail(client, setup_account_entry, setup_user_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.put('/product/event-mode', json={"eventMode": "happyHour"}, headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+    # Only admins switch the mode
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    response = client.put('/product/event-mode', json={"eventMode": "party"}, headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+
 def calculate_ssim(image1, image2):
     # Resize the retrieved image to match the original image
     image2 = image2.resize(image1.size, Image.LANCZOS)
@@ -411,3 +627,87 @@ def test_delete_product_success(client, setup_product_entry):
 
     # Ensure right amount of products are listed (2 before, 1 after)
     assert len(beverages) == 1, "Expected amount of beverages for categoryId 2 doesn't match"
+
+
+def test_import_beverages_csv_success(client, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+
+    data = "\n".join([
+        "productName,categoryId,beverageSize,normal,party,bigEvent,productId",
+        "Augustiner Hell,1,0.5,3.0,3.5,4.0,",
+        '"Club-Mate, Granat",2,0.5,2.0,2.5,3.0,',
+        "Paulaner Spezi,2,0.5,1.8,2.2,3.2,1",
+        "Unknown Category,99,0.5,1.0,1.0,1.0,",
+        "Free Beer,1,0.5,-1,1.0,1.0,",
+        "Too Short,1,0.5",
+        "Renamed Twice,2,0.5,1.0,1.0,1.0,1",
+    ])
+    response = client.post('/product/import', data=data, content_type="text/csv", headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    result = response.get_json()["message"]
+    assert result["created"] == 2 and result["updated"] == 1, f"Unexpected result {result}"
+    assert [error["line"] for error in result["errors"]] == [5, 6, 7, 8], f"Unexpected errors {result['errors']}"
+    assert result["errors"][0]["message"] == "Unknown categoryId"
+    assert result["errors"][3]["message"] == "Duplicate productId"
+
+    # Imported beverages are in the catalog right away
+    response = client.get('/product/beverage', headers=headers)
+    beverages = {bev["productName"]: bev for cat in response.get_json()["message"] for bev in cat["beverages"]}
+    assert beverages["Club-Mate, Granat"]["pricing"] == {"normal": 2.0, "party": 2.5, "bigEvent": 3.0}
+    assert beverages["Paulaner Spezi"]["pricing"]["normal"] == 1.8
+    assert len(beverages) == 5, f"Expected 5 beverages, but got {list(beverages)}"
+
+
+def test_import_beverages_jsonl_success(client, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+
+    data = "\n".join([
+        '{"productName": "Tegernseer", "categoryId": 1, "beverageSize": 0.5, '
+        '"pricing": {"normal": 3.0, "party": 3.5, "bigEvent": 4.0}}',
+        '{"productName": "Broken"',
+        '',
+        '{"productId": 2, "productName": "RedBull", "categoryId": 2, "beverageSize": 0.25, '
+        '"normal": 2.0, "party": 3.0, "bigEvent": 3.5}',
+    ])
+    response = client.post('/product/import', data=data, content_type="application/x-ndjson", headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    result = response.get_json()["message"]
+    assert result["created"] == 1 and result["updated"] == 1, f"Unexpected result {result}"
+    assert result["errors"] == [{"line": 2, "message": "Invalid JSON"}]
+
+
+def test_import_beverages_fail(client, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+
+    response = client.post('/product/import', data="productName\n", content_type="text/plain", headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+    # Required columns are checked before anything is imported
+    response = client.post('/product/import', data="productName,categoryId\nBeer,1\n", content_type="text/csv",
+                           headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+    assert response.get_json()["error"]["exception"] == "InvalidImport"
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    response = client.post('/product/import', data="", content_type="text/csv", headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+
+def test_export_beverages_success(client, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+
+    response = client.get('/product/export', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.mimetype == "text/csv"
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == "productId,productName,categoryId,beverageSize,normal,party,bigEvent"
+    assert lines[1] == "1,Paulaner Spezi,2,0.50,1.50,2.00,3.00", f"Unexpected row {lines[1]}"
+    assert len(lines) == 4, "Expected the header and one line per beverage"
+
+    # An export can be imported again and updates every beverage
+    response = client.post('/product/import', data="\n".join(lines), content_type="text/csv", headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    result = response.get_json()["message"]
+    assert result == {"created": 0, "updated": 3, "errors": []}, f"Unexpected result {result}"
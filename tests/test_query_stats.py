@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import sys
+import pytest
+from test_setup import get_mock_JWT_access_token, setup, setup_schema, setup_account_entry, setup_user_entry
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from database_service import query_stats  # noqa
+from database_service.user import get_all_users, get_user_by_user_id  # noqa
+
+USER_ID = "95cebd35-2489-4dbf-b379-a1f901875831"
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+def get_events(caplog, event: str):
+    records = [json.loads(record.getMessage()) for record in caplog.records if record.name == query_stats.__name__]
+    return [record for record in records if record["event"] == event]
+
+
+def test_slow_query_log_success(caplog, monkeypatch, setup_account_entry, setup_user_entry):
+    # Every statement counts as slow
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_THRESHOLD", 0)
+
+    with caplog.at_level(logging.WARNING, logger=query_stats.__name__):
+        users = get_all_users()
+
+    events = get_events(caplog, "slow_query")
+    assert len(events) == 1, f"Expected one slow query, but got {events}"
+    # The caller is the data service, not the pagination helper running the statement
+    assert events[0]["caller"] == "database_service.user.get_users_page"
+    assert events[0]["rows"] == len(users) == 3
+    assert events[0]["seconds"] >= 0
+    assert events[0]["statement"].startswith("SELECT u.user_id"), f"Unexpected statement: {events[0]['statement']}"
+
+
+def test_slow_query_log_request_context_success(client, caplog, monkeypatch, setup_account_entry, setup_user_entry):
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_THRESHOLD", 0)
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    with caplog.at_level(logging.WARNING, logger=query_stats.__name__):
+        response = client.get(f'/user/{USER_ID}', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    events = get_events(caplog, "slow_query")
+    assert any(event["context"] == "GET /user/<user_id>" and
+               event["caller"] == "database_service.user.get_user_by_user_id" for event in events), \
+        f"Expected the query of the request to be logged, but got {events}"
+    # Parameters are never logged
+    assert all(USER_ID not in event["statement"] for event in events)
+
+
+def test_n_plus_one_detection_success(caplog, monkeypatch, setup_account_entry, setup_user_entry):
+    monkeypatch.setattr(query_stats, "DETECT_N_PLUS_ONE", True)
+    monkeypatch.setattr(query_stats, "N_PLUS_ONE_THRESHOLD", 3)
+
+    with caplog.at_level(logging.WARNING, logger=query_stats.__name__):
+        token = query_stats.start_query_stats("test")
+        for _ in range(3):
+            get_user_by_user_id(USER_ID)
+        get_all_users()
+        stats = query_stats.stop_query_stats(token)
+
+    assert stats.queries == 4, f"Expected 4 statements, but got {stats.queries}"
+    events = get_events(caplog, "n_plus_one")
+    assert len(events) == 1, f"Expected one N+1 report, but got {events}"
+    assert events[0]["caller"] == "database_service.user.get_user_by_user_id"
+    assert events[0]["context"] == "test"
+    assert events[0]["count"] == 3 and events[0]["rows"] == 3
+
+
+def test_n_plus_one_detection_disabled_success(caplog, monkeypatch, setup_account_entry, setup_user_entry):
+    monkeypatch.setattr(query_stats, "DETECT_N_PLUS_ONE", False)
+    monkeypatch.setattr(query_stats, "N_PLUS_ONE_THRESHOLD", 2)
+
+    with caplog.at_level(logging.WARNING, logger=query_stats.__name__):
+        token = query_stats.start_query_stats("test")
+        for _ in range(3):
+            get_user_by_user_id(USER_ID)
+        query_stats.stop_query_stats(token)
+
+    assert get_events(caplog, "n_plus_one") == [], "Expected no N+1 report outside of debug mode"
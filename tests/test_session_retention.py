@@ -0,0 +1,131 @@
+import os
+import sys
+import psycopg2
+import pytest
+from test_setup import get_mock_JWT_access_token, postgres, setup, setup_schema, setup_account_entry
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+from database_service.session_retention import (RETENTION_LOCK_ID, drop_expired_session_partitions,  # noqa
+                                                run_session_retention)
+
+ACCOUNT_ID = "d0192fdf-56ee-4aab-81e2-36667414c0b1"
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def migration_role(monkeypatch):
+    monkeypatch.setenv("POSTGRES_MIGRATION_USER", postgres.username)
+    monkeypatch.setenv("POSTGRES_MIGRATION_PW", postgres.password)
+
+
+def connect():
+    conn = psycopg2.connect(host=postgres.get_container_host_ip(), port=postgres.get_exposed_port(5432),
+                            user=postgres.username, password=postgres.password, dbname="bude_transactions")
+    conn.autocommit = True
+    return conn
+
+
+def insert_sessions(cur, count: int, invalidated: bool, age: str):
+    cur.execute('''
+                INSERT INTO account_sessions(token_id, account_id, ip_address, device, browser, origin_id,
+                                             time_created, invalidated, time_invalidated)
+                SELECT gen_random_uuid(), %s, '127.0.0.1', 'Other', 'Other', gen_random_uuid(),
+                       NOW() - %s::interval, %s, CASE WHEN %s THEN NOW() - %s::interval END
+                FROM generate_series(1, %s)
+                ''',
+                (ACCOUNT_ID, age, invalidated, invalidated, age, count))
+
+
+def count_sessions(cur, invalidated: bool):
+    cur.execute("SELECT COUNT(*) FROM account_sessions WHERE invalidated = %s", (invalidated, ))
+    return cur.fetchone()[0]
+
+
+def test_purge_sessions_success(setup_account_entry):
+    conn = connect()
+    cur = conn.cursor()
+    insert_sessions(cur, 25, True, "90 days")
+    insert_sessions(cur, 5, True, "1 day")
+    insert_sessions(cur, 3, False, "90 days")
+
+    # Small batches still delete every old invalidated session
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["purge-sessions", "--max-age", str(30 * 24 * 60 * 60), "--batch-size", "10"])
+    assert result.exit_code == 0, f"Expected exit code 0, but got {result.output}"
+    assert "25 session(s) deleted" in result.output
+
+    # Recently invalidated and active sessions are kept
+    assert count_sessions(cur, True) == 5, "Expected recently invalidated sessions to be kept"
+    assert count_sessions(cur, False) == 3, "Expected active sessions to be kept"
+    cur.close()
+    conn.close()
+
+
+def test_purge_sessions_locked_fail(setup_account_entry):
+    # Another worker is running the retention
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (RETENTION_LOCK_ID, ))
+    assert run_session_retention(0, 10) is None, "Expected the retention to be skipped"
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["purge-sessions"])
+    assert result.exit_code != 0, f"Expected the command to fail, but got {result.output}"
+    cur.close()
+    conn.close()
+
+
+def test_partition_sessions_success(client, setup_account_entry, migration_role):
+    conn = connect()
+    cur = conn.cursor()
+    insert_sessions(cur, 4, True, "400 days")
+    insert_sessions(cur, 2, False, "1 hour")
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["partition-sessions"])
+    assert result.exit_code == 0, f"Expected exit code 0, but got {result.output}"
+    assert "partitioned by month" in result.output
+
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'account_sessions'::regclass")
+    assert cur.fetchone()[0] == "p", "Expected account_sessions to be partitioned"
+    assert count_sessions(cur, True) == 4 and count_sessions(cur, False) == 2, "Expected all sessions to be copied"
+
+    # Running it again keeps the table as it is
+    result = runner.invoke(args=["partition-sessions"])
+    assert "already partitioned" in result.output
+
+    # Logins, session checks and the admin overview work on the partitioned table
+    payload = {"username": "test_user", "password": "Password123"}
+    response = client.post('/account/login', json=payload)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    headers = {"Authorization": f"Bearer {response.get_json()['refresh_token']}"}
+    response = client.get('/account/refresh', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get('/account/session', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert len(response.get_json()["message"][ACCOUNT_ID]) == 3, "Expected the two old and the new active session"
+
+    # The months of the old sessions are dropped as a whole
+    result = runner.invoke(args=["purge-sessions", "--max-age", str(30 * 24 * 60 * 60)])
+    assert result.exit_code == 0, f"Expected exit code 0, but got {result.output}"
+    assert "Dropped account_sessions_p" in result.output
+    assert count_sessions(cur, True) == 0, "Expected the old sessions to be gone"
+    assert count_sessions(cur, False) == 3, "Expected current sessions to be kept"
+
+    # Nothing left to drop
+    assert drop_expired_session_partitions(conn, 30 * 24 * 60 * 60) == []
+    cur.close()
+    conn.close()
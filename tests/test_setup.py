@@ -11,6 +11,9 @@ sys.path.append(os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
 
 from app import app  # noqa
+from database_service.connection import close_all_pools  # noqa
+from database_service.migrations import apply_migrations  # noqa
+from services.cache import clear_all_caches  # noqa
 
 # Path to the SQL initialization file
 INIT_SQL_PATH = os.path.abspath(os.path.join(
@@ -28,6 +31,9 @@ def setup(request):
 
     # Stop the container after all tests
     def remove_container():
+        # Pooled connections and cached data belong to the stopped database
+        close_all_pools()
+        clear_all_caches()
         postgres.stop()
 
     request.addfinalizer(remove_container)
@@ -80,8 +86,11 @@ def setup_schema():
                                             db_auth_user_pw=os.environ['POSTGRES_AUTH_PW']
                                             )
         cursor.execute(sql_script)
-    conn.commit()
     cursor.close()
+
+    # Bring the schema to the current version like a deployment does
+    conn.autocommit = False
+    apply_migrations(conn)
     conn.close()
 
 
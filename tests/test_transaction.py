@@ -0,0 +1,209 @@
+import os
+import sys
+import psycopg2
+import pytest
+from test_setup import (get_mock_JWT_access_token, postgres, setup, setup_schema, setup_account_entry, setup_user_entry,
+                        setup_product_entry)
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_book_transaction_success(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+
+    # Use access token to POST /transaction/
+    headers = {"Authorization": f"Bearer {access_token}"}
+    payload = {
+        "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+        "positions": [
+            {"productId": 1, "quantity": 2},
+            {"productId": 2, "quantity": 1}
+        ]
+    }
+    response = client.post('/transaction/', json=payload, headers=headers)
+
+    # Assert the response status code is 201 Created
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+    data = response.get_json()
+
+    assert data["error"] is None, f"Expected 'error' to be None, but got {data['error']}"
+
+    # Prices are resolved on the server (normal pricing)
+    assert data["message"]["total"] == -5.5, f"Expected total of -5.5, but got {data['message']['total']}"
+    assert len(data["message"]["positions"]) == 2, "Expected amount of positions doesn't match"
+    assert data["message"]["positions"][0]["position"] == 1
+    assert data["message"]["positions"][0]["balance"] == -3.0
+
+    # Booked transaction can be read again
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.get(f'/transaction/{data["message"]["transactionId"]}', headers=headers)
+
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    transaction = response.get_json()["message"]
+    assert transaction["userId"] == "95cebd35-2489-4dbf-b379-a1f901875831"
+    assert transaction["userCreated"] == "95cebd35-2489-4dbf-b379-a1f901875831"
+    assert transaction["total"] == -5.5
+    assert [position["productId"] for position in transaction["positions"]] == [1, 2]
+
+
+def test_book_transaction_party_pricing_with_markup_success(
+        client, monkeypatch, setup_account_entry, setup_user_entry, setup_product_entry):
+    monkeypatch.setenv("PRICE_MARKUP_REGULAR", "10")
+    admin_headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.put('/product/event-mode', json={"eventMode": "party"}, headers=admin_headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    payload = {
+        "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+        "positions": [{"productId": 3, "quantity": 1}]
+    }
+    response = client.post('/transaction/', json=payload, headers=headers)
+
+    # Party price of the event mode 2.5 plus 10% markup for regular users
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+    assert response.get_json()["message"]["total"] == -2.75
+
+    # Admins may book with the prices of another tier
+    response = client.post('/transaction/', json={**payload, "pricingType": "normal"}, headers=admin_headers)
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+    assert response.get_json()["message"]["total"] == -2.2
+
+
+def test_book_transaction_pricing_type_fail(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    payload = {
+        "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+        "pricingType": "party",
+        "positions": [{"productId": 3, "quantity": 1}]
+    }
+
+    # Users can not book with other prices than the event mode (normal)
+    response = client.post('/transaction/', json=payload, headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+    response = client.post('/transaction/', json={**payload, "pricingType": "happyHour"}, headers=headers)
+    assert response.status_code == 400, f"Expected status code 400, but got {response.status_code}"
+
+
+def test_book_transaction_unknown_product_fail(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    access_token = get_mock_JWT_access_token(False)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    payload = {
+        "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+        "positions": [
+            {"productId": 1, "quantity": 1},
+            {"productId": 99, "quantity": 1}
+        ]
+    }
+    response = client.post('/transaction/', json=payload, headers=headers)
+
+    # Nothing is booked if a single position fails
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.get('/transaction/1', headers=headers)
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+
+def test_book_transaction_invalid_positions_fail(client):
+    access_token = get_mock_JWT_access_token(False)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    # JSON booleans are no ids or quantities
+    for position in [{"productId": 1, "quantity": 0}, {"productId": 1, "quantity": True},
+                     {"productId": True, "quantity": 1}]:
+        payload = {
+            "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+            "positions": [position]
+        }
+        response = client.post('/transaction/', json=payload, headers=headers)
+
+        # Assert the response status code is 400 Bad Request
+        assert response.status_code == 400, f"Expected status code 400 for {position}, but got {response.status_code}"
+        assert response.get_json()["error"]["exception"] == "InvalidPositions"
+
+
+def test_user_balance_after_bookings_success(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    for quantity in [1, 3]:
+        payload = {
+            "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+            "positions": [{"productId": 1, "quantity": quantity}]
+        }
+        response = client.post('/transaction/', json=payload, headers=headers)
+        assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+
+    # Balance of a single user
+    response = client.get('/user/95cebd35-2489-4dbf-b379-a1f901875831/balance', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.get_json()["message"]["balance"] == -6.0
+
+    # Balances of other users only for admins
+    response = client.get('/user/1b6b231b-66f0-468a-b900-dfc9a48977b9/balance', headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+    # Overview only for admins
+    response = client.get('/user/balances', headers=headers)
+    assert response.status_code == 403, f"Expected status code 403, but got {response.status_code}"
+
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(True)}"}
+    response = client.get('/user/balances', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    balances = {balance["userId"]: balance["balance"] for balance in response.get_json()["message"]}
+    assert balances["95cebd35-2489-4dbf-b379-a1f901875831"] == -6.0
+    assert balances["1b6b231b-66f0-468a-b900-dfc9a48977b9"] == 0.0
+
+    response = client.get('/user/95cebd35-2489-4dbf-b379-a1f901875831/balance', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    response = client.get('/user/00000000-0000-0000-0000-000000000000/balance', headers=headers)
+    assert response.status_code == 404, f"Expected status code 404, but got {response.status_code}"
+
+
+def test_reconcile_user_balances_success(client, setup_account_entry, setup_user_entry, setup_product_entry):
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    payload = {
+        "userId": "95cebd35-2489-4dbf-b379-a1f901875831",
+        "positions": [{"productId": 1, "quantity": 2}]
+    }
+    response = client.post('/transaction/', json=payload, headers=headers)
+    assert response.status_code == 201, f"Expected status code 201, but got {response.status_code}"
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["reconcile-balances"])
+    assert result.exit_code == 0, f"Expected no drift, but got {result.output}"
+
+    # Let the stored balance drift from the ledger
+    conn = psycopg2.connect(host=postgres.get_container_host_ip(), port=postgres.get_exposed_port(5432),
+                            user=postgres.username, password=postgres.password, dbname="bude_transactions")
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("UPDATE user_balance SET balance = 10")
+    cur.close()
+    conn.close()
+
+    result = runner.invoke(args=["reconcile-balances"])
+    assert result.exit_code == 1, f"Expected drift to be reported, but got {result.output}"
+    assert "95cebd35-2489-4dbf-b379-a1f901875831: stored 10.00, expected -3.00" in result.output
+
+    result = runner.invoke(args=["reconcile-balances", "--fix"])
+    assert result.exit_code == 0, f"Expected drift to be fixed, but got {result.output}"
+
+    response = client.get('/user/95cebd35-2489-4dbf-b379-a1f901875831/balance', headers=headers)
+    assert response.get_json()["message"]["balance"] == -3.0
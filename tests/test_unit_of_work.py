@@ -0,0 +1,151 @@
+import io
+import os
+import sys
+import psycopg2
+import pytest
+from datetime import datetime, timezone
+from test_setup import get_mock_JWT_access_token, setup, setup_schema, setup_account_entry, setup_user_entry
+
+# Add to the Python path
+sys.path.append(os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+
+from app import app  # noqa
+import endpoints.user  # noqa
+from database_service import query_stats, table_version  # noqa
+from database_service.connection import (UnitOfWorkFailedError, get_auth_db_connection, get_pool,  # noqa
+                                         unit_of_work)
+from database_service.pagination import InvalidPageRequest, encode_cursor  # noqa
+from database_service.table_version import USER_TABLE  # noqa
+from database_service.user import (get_profile_picture_path_by_user_id, get_user_by_user_id, get_users_page,  # noqa
+                                   update_user, update_user_profile_picture_path)
+
+USER_ID = "95cebd35-2489-4dbf-b379-a1f901875831"
+
+
+@pytest.fixture
+def client():
+    # Fixture to create a test client for the Flask app
+    app.testing = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_unit_of_work_success(setup_account_entry, setup_user_entry):
+    token = query_stats.start_query_stats("test")
+    with unit_of_work():
+        user = get_user_by_user_id(USER_ID)
+        update_user_profile_picture_path(user.user_id, "data/images/profile_pictures/test.jpg")
+        # Later calls see the uncommitted change of the same transaction
+        assert get_profile_picture_path_by_user_id(USER_ID) == "data/images/profile_pictures/test.jpg"
+    stats = query_stats.stop_query_stats(token)
+
+    assert stats.checkouts == 1, f"Expected one connection for the whole unit, but got {stats.checkouts}"
+    assert get_profile_picture_path_by_user_id(USER_ID) == "data/images/profile_pictures/test.jpg"
+
+
+def test_unit_of_work_rollback_fail(setup_account_entry, setup_user_entry):
+    before = get_profile_picture_path_by_user_id(USER_ID)
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            update_user_profile_picture_path(USER_ID, "data/images/profile_pictures/test.jpg")
+            raise RuntimeError("Failed after writing")
+
+    assert get_profile_picture_path_by_user_id(USER_ID) == before, "Expected the update to be rolled back"
+
+
+def test_unit_of_work_invalidates_on_commit_success(monkeypatch, setup_account_entry, setup_user_entry):
+    invalidated = []
+    monkeypatch.setattr(table_version, "invalidate_table_version", invalidated.append)
+    with unit_of_work():
+        update_user(USER_ID, "Test", "User", False, "regular", "user")
+        # Other requests would cache the old version again until the unit is committed
+        assert invalidated == [], "Expected the caches to be invalidated after the commit"
+    assert invalidated == [USER_TABLE]
+
+    # Nothing is invalidated for rolled back work
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            update_user(USER_ID, "Test", "User", False, "regular", "user")
+            raise RuntimeError("Failed after writing")
+    assert invalidated == [USER_TABLE]
+
+    # Without a unit the data service commits on its own
+    update_user(USER_ID, "Test", "User", False, "regular", "user")
+    assert invalidated == [USER_TABLE, USER_TABLE]
+
+
+def test_unit_of_work_invalid_page_rollback_fail(setup_account_entry, setup_user_entry):
+    before = get_profile_picture_path_by_user_id(USER_ID)
+    with pytest.raises(UnitOfWorkFailedError):
+        with unit_of_work():
+            update_user_profile_picture_path(USER_ID, "data/images/profile_pictures/test.jpg")
+            # Decodes, but the id is no UUID and the statement fails
+            with pytest.raises(InvalidPageRequest):
+                get_users_page(limit=10, after=encode_cursor(datetime.now(timezone.utc), "not-a-uuid"))
+            # The failed statement rolled back the whole unit, later calls can not commit a part of it
+            update_user_profile_picture_path(USER_ID, "data/images/profile_pictures/other.jpg")
+
+    assert get_profile_picture_path_by_user_id(USER_ID) == before, "Expected the unit to be rolled back"
+
+
+def test_unit_of_work_lost_connection_fail(setup_account_entry, setup_user_entry):
+    before = get_profile_picture_path_by_user_id(USER_ID)
+    with pytest.raises(UnitOfWorkFailedError):
+        with unit_of_work():
+            update_user_profile_picture_path(USER_ID, "data/images/profile_pictures/test.jpg")
+            conn = get_auth_db_connection()
+            other = get_pool("auth").getconn()
+            other.cursor().execute("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(), ))
+            other.close()
+            with pytest.raises(psycopg2.OperationalError):
+                conn.cursor().execute("SELECT 1")
+            # A new connection would commit the later writes without the lost ones
+            update_user_profile_picture_path(USER_ID, "data/images/profile_pictures/other.jpg")
+
+    assert get_profile_picture_path_by_user_id(USER_ID) == before, "Expected no part of the unit to be committed"
+
+
+def test_request_unit_of_work_rollback_fail(client, monkeypatch, setup_account_entry, setup_user_entry):
+    before = get_profile_picture_path_by_user_id(USER_ID)
+    checkouts = []
+
+    def update_and_fail(user_id, path):
+        # The view fails after the path was written
+        update_user_profile_picture_path(user_id, path)
+        checkouts.append(query_stats.get_query_stats().checkouts)
+        raise RuntimeError("Failed after writing")
+
+    monkeypatch.setattr(endpoints.user, "update_user_profile_picture_path", update_and_fail)
+
+    with open("tests/fixtures/profile.png", "rb") as img_file:
+        image_data = img_file.read()
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    response = client.post("/user/profile-picture", data={"file": (io.BytesIO(image_data), "profile.png")},
+                           content_type="multipart/form-data", headers=headers)
+    assert response.status_code == 500, f"Expected status code 500, but got {response.status_code}"
+
+    # The user lookup and the update shared one connection
+    assert checkouts == [1], f"Expected one connection for the request, but got {checkouts}"
+    assert get_profile_picture_path_by_user_id(USER_ID) == before, "Expected the update to be rolled back"
+
+
+def test_request_unit_of_work_failed_success_response_fail(client, monkeypatch, setup_account_entry,
+                                                           setup_user_entry):
+    before = get_profile_picture_path_by_user_id(USER_ID)
+
+    def update_and_ignore_rollback(user_id, path):
+        # The view answers with success although a data service rolled back the unit
+        response = update_user_profile_picture_path(user_id, path)
+        get_auth_db_connection().rollback()
+        return response
+
+    monkeypatch.setattr(endpoints.user, "update_user_profile_picture_path", update_and_ignore_rollback)
+
+    with open("tests/fixtures/profile.png", "rb") as img_file:
+        image_data = img_file.read()
+    headers = {"Authorization": f"Bearer {get_mock_JWT_access_token(False)}"}
+    response = client.post("/user/profile-picture", data={"file": (io.BytesIO(image_data), "profile.png")},
+                           content_type="multipart/form-data", headers=headers)
+    assert response.status_code == 500, f"Expected status code 500, but got {response.status_code}"
+    assert get_profile_picture_path_by_user_id(USER_ID) == before, "Expected the update to be rolled back"
@@ -127,6 +127,66 @@ def test_get_all_users_success(client, setup_account_entry, setup_user_entry):
     assert len(data["message"]) == 3, "Expected amount of users doesn't match"
 
 
+def test_get_all_users_not_modified_success(client, setup_account_entry, setup_user_entry):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.get('/user/', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"], "Last-Modified header is missing"
+
+    # Unchanged list is not sent again
+    response = client.get('/user/', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304, f"Expected status code 304, but got {response.status_code}"
+    assert response.data == b""
+
+    # Changing a user creates a new version
+    payload = {"firstName": "Changed", "lastName": "User", "isTemporary": False,
+               "priceRanking": "regular", "permissions": "user"}
+    response = client.put('/user/95cebd35-2489-4dbf-b379-a1f901875831', json=payload, headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+
+    response = client.get('/user/', headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    assert response.headers["ETag"] != etag, "Expected a new ETag after the update"
+
+
+def test_get_all_users_paginated_success(client, setup_account_entry, setup_user_entry):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Walk through the users two at a time, only with the requested fields
+    response = client.get('/user/?limit=2&fields=userId,firstName&count=true', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    first_page = response.get_json()["message"]
+    assert len(first_page) == 2, f"Expected 2 users, but got {len(first_page)}"
+    assert all(set(user) == {"userId", "firstName"} for user in first_page), f"Unexpected fields: {first_page}"
+    assert response.headers["X-Total-Count"] == "3"
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f'/user/?limit=2&fields=userId,firstName&after={cursor}', headers=headers)
+    assert response.status_code == 200, f"Expected status code 200, but got {response.status_code}"
+    second_page = response.get_json()["message"]
+    assert len(second_page) == 1, f"Expected 1 user, but got {len(second_page)}"
+    assert "X-Next-Cursor" not in response.headers, "Last page must not have a next cursor"
+
+    user_ids = {user["userId"] for user in first_page + second_page}
+    assert user_ids == {"95cebd35-2489-4dbf-b379-a1f901875831", "1b6b231b-66f0-468a-b900-dfc9a48977b9",
+                        "0becd0ae-fd81-4f54-9685-160eed903b31"}, f"Unexpected users: {user_ids}"
+
+
+def test_get_all_users_paginated_fail(client, setup_account_entry, setup_user_entry):
+    access_token = get_mock_JWT_access_token(True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    for query in ("limit=0", "limit=abc", "fields=password", "after=not-a-cursor",
+                  "after=WyIyMDI0LTAxLTAxVDAwOjAwOjAwKzAwOjAwIiwgIm5vLXV1aWQiXQ"):
+        response = client.get(f'/user/?{query}', headers=headers)
+        assert response.status_code == 400, f"Expected status code 400 for {query}, but got {response.status_code}"
+        assert response.get_json()["error"]["exception"] == "InvalidPageRequest"
+
+
 def test_create_user_success(client):
     # Test successful registration
     access_token = get_mock_JWT_access_token(True)